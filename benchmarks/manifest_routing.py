@@ -0,0 +1,93 @@
+"""
+Compare the cost of routing a v2 manifest request when the repository's tag
+lists are decoded from json on every request, as crane used to do, with
+resolving it against the parsed tag sets, and with looking up the redirect
+target that is now precomputed when the metadata is loaded.
+
+Usage::
+
+    python benchmarks/manifest_routing.py [number of tags]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crane import data  # noqa
+from crane import manifests  # noqa
+
+
+ACCEPT = set([manifests.SCHEMA2_MEDIATYPE, manifests.MANIFEST_LIST_MEDIATYPE])
+
+
+def write_metadata(path, tag_count):
+    tags = ['tag%d' % i for i in range(tag_count)]
+    digest = 'sha256:' + '0' * 64
+    with open(path, 'w') as metadata_file:
+        json.dump({
+            'version': 4,
+            'repo-registry-id': 'bench/repo',
+            'repository': 'bench-repo',
+            'url': 'http://cdn.example.com/bench/repo/',
+            'protected': False,
+            'schema2_data': tags,
+            'manifest_list_data': tags[::2],
+            'manifest_list_amd64_tags': dict((tag, [digest, 2]) for tag in tags[::2]),
+        }, metadata_file)
+
+
+def route_with_json(repo, identifier):
+    # what name_serve_or_redirect did on every request before the lookup
+    # structures existed
+    schema2_data = json.loads(repo.schema2_data)
+    manifest_list_data = json.loads(repo.manifest_list_data)
+    manifest_list_amd64_tags = json.loads(repo.manifest_list_amd64_tags)
+    if manifests.MANIFEST_LIST_MEDIATYPE in ACCEPT and identifier in manifest_list_data:
+        return 'manifests/list/' + identifier
+    elif identifier in manifest_list_amd64_tags.keys():
+        return 'manifests/2/' + manifest_list_amd64_tags[identifier][0]
+    elif identifier in schema2_data:
+        return 'manifests/2/' + identifier
+    return 'manifests/1/' + identifier
+
+
+def route_with_lookups(repo, identifier):
+    return manifests.resolve(repo.schema2_tags, repo.manifest_list_tags,
+                             repo.manifest_list_amd64, identifier, ACCEPT)[0]
+
+
+def route_with_table(repo, identifier):
+    return manifests.route(repo, identifier, ACCEPT)[0]
+
+
+def main():
+    tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    working_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(working_dir, 'repo.json')
+        write_metadata(path, tag_count)
+        repo = data.load_from_file(path)[1]
+    finally:
+        shutil.rmtree(working_dir)
+
+    # the last tag is the worst case for list membership tests
+    identifier = 'tag%d' % (tag_count - 1)
+    assert route_with_json(repo, identifier) == route_with_lookups(repo, identifier)
+    assert route_with_json(repo, identifier) == route_with_table(repo, identifier)
+
+    print 'routing one manifest request in a repository with %d tags' % tag_count
+    for name, func in (('json per request', route_with_json),
+                       ('pre-parsed lookups', route_with_lookups),
+                       ('precomputed table', route_with_table)):
+        timer = timeit.Timer(lambda: func(repo, identifier))
+        number = 10 if func is route_with_json else 100000
+        best = min(timer.repeat(repeat=3, number=number)) / number
+        print '  %-20s %10.2f us/request' % (name, best * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Compare serving redirects through the Flask app, as crane.wsgi does, with
+serving them through crane.fastpath, as crane.fastpath_wsgi does.
+
+Requests are made by client threads calling the WSGI application directly,
+without a web server or sockets in between, so the numbers show the cost of
+crane itself. For each kind of request the throughput and the 99th percentile
+latency are reported. With more than one thread, the latencies mostly show how
+long requests wait for the interpreter lock.
+
+Usage::
+
+    python benchmarks/redirects.py [number of requests] [number of threads]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import timeit
+
+import mock
+from werkzeug.test import EnvironBuilder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crane import app as app_module  # noqa
+from crane import config  # noqa
+from crane import data  # noqa
+from crane import fastpath  # noqa
+
+
+DIGEST = 'sha256:' + '0' * 64
+
+REQUESTS = (
+    ('v2 blob', '/v2/bench/repo/blobs/' + DIGEST),
+    ('v2 manifest by tag', '/v2/bench/repo/manifests/latest'),
+    ('v1 image layer', '/v1/images/abc123/layer'),
+    ('v2 unknown repository', '/v2/bench/nothing/blobs/' + DIGEST),
+)
+
+
+def write_metadata(data_dir):
+    with open(os.path.join(data_dir, 'v2.json'), 'w') as metadata_file:
+        json.dump({
+            'version': 4,
+            'repo-registry-id': 'bench/repo',
+            'repository': 'bench-repo',
+            'url': 'http://cdn.example.com/bench/repo/',
+            'protected': False,
+            'schema2_data': ['latest', DIGEST],
+            'manifest_list_data': [],
+            'manifest_list_amd64_tags': {},
+        }, metadata_file)
+    with open(os.path.join(data_dir, 'v1.json'), 'w') as metadata_file:
+        json.dump({
+            'version': 1,
+            'repo-registry-id': 'bench/old',
+            'repository': 'bench-old',
+            'url': 'http://cdn.example.com/bench/old/',
+            'images': [{'id': 'abc123'}],
+            'tags': {'latest': 'abc123'},
+        }, metadata_file)
+
+
+def run(application, path, count, threads):
+    """
+    :return:    tuple of the number of requests per second and the 99th
+                percentile latency in seconds
+    :rtype:     tuple
+    """
+    environ = EnvironBuilder(path, headers={
+        'Accept': 'application/vnd.docker.distribution.manifest.v2+json'}).get_environ()
+    latencies = []
+
+    def start_response(status, headers):
+        pass
+
+    def client():
+        timer = timeit.default_timer
+        own = []
+        for i in xrange(count // threads):
+            start = timer()
+            body = application(dict(environ), start_response)
+            ''.join(body)
+            if hasattr(body, 'close'):
+                body.close()
+            own.append(timer() - start)
+        latencies.extend(own)
+
+    clients = [threading.Thread(target=client) for i in range(threads)]
+    start = timeit.default_timer()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = timeit.default_timer() - start
+
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[int(0.99 * len(latencies)) - 1]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_metadata(data_dir)
+        with mock.patch('crane.app.init_logging'):
+            flask_app = app_module.create_app()
+        flask_app.config[config.KEY_DATA_DIR] = data_dir
+        data.load_all(flask_app)
+        applications = (('flask', flask_app), ('fastpath', fastpath.FastPath(flask_app)))
+
+        print '%d requests from %d threads' % (count, threads)
+        for name, path in REQUESTS:
+            print '  %s' % name
+            for app_name, application in applications:
+                # warm up caches
+                run(application, path, 100, 1)
+                per_second, p99 = run(application, path, count, threads)
+                print '    %-10s %10.0f req/s %10.0f us p99' % (app_name, per_second, p99 * 1e6)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare the cost of looking up a repository in the response data when it is
+held in each process, as crane does by default, with looking it up in the
+memory-mapped shared store ("shared_store_dir"), both when the record has to be
+unpickled and when it is found in the table's per-process record cache.
+
+A v2 manifest request looks up its repository at least twice, once to
+authorize it and once to route it.
+
+Usage::
+
+    python benchmarks/store_lookup.py [number of tags]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crane import data  # noqa
+from crane import store  # noqa
+
+
+def write_metadata(working_dir, tag_count):
+    tags = ['tag%d' % i for i in range(tag_count)]
+    digest = 'sha256:' + '0' * 64
+    v2_path = os.path.join(working_dir, 'v2.json')
+    with open(v2_path, 'w') as metadata_file:
+        json.dump({
+            'version': 4,
+            'repo-registry-id': 'bench/repo',
+            'repository': 'bench-repo',
+            'url': 'http://cdn.example.com/bench/repo/',
+            'protected': False,
+            'schema2_data': tags,
+            'manifest_list_data': tags[::2],
+            'manifest_list_amd64_tags': dict((tag, [digest, 2]) for tag in tags[::2]),
+        }, metadata_file)
+    v1_path = os.path.join(working_dir, 'v1.json')
+    with open(v1_path, 'w') as metadata_file:
+        json.dump({
+            'version': 1,
+            'repo-registry-id': 'bench/old',
+            'repository': 'bench-old',
+            'url': 'http://cdn.example.com/bench/old/',
+            'images': [{'id': '%064x' % i} for i in range(tag_count)],
+            'tags': dict((tag, '%064x' % i) for i, tag in enumerate(tags)),
+        }, metadata_file)
+    return v1_path, v2_path
+
+
+def main():
+    tag_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    working_dir = tempfile.mkdtemp()
+    try:
+        v1_path, v2_path = write_metadata(working_dir, tag_count)
+        v1_repo_id, v1_repo = data.load_from_file(v1_path)[:2]
+        v2_repo_id, v2_repo = data.load_from_file(v2_path)[:2]
+        store_dir = os.path.join(working_dir, 'store')
+        os.mkdir(store_dir)
+        generation_path = store.publish(store_dir, '0' * 32, {
+            'v1_repos': {v1_repo_id: v1_repo},
+            'v2_repos': {v2_repo_id: v2_repo},
+        })
+        generation = store.open_current(store_dir, ['v1_repos', 'v2_repos'])
+
+        print 'looking up repositories with %d tags, generation file of %d bytes' % (
+            tag_count, os.path.getsize(generation_path))
+        for name, repo_id, table, in_process in (
+                ('v1', v1_repo_id, generation.table('v1_repos'), {v1_repo_id: v1_repo}),
+                ('v2', v2_repo_id, generation.table('v2_repos'), {v2_repo_id: v2_repo})):
+            print '  %s repository' % name
+            for label, repos, cache_size in (('in process', in_process, 0),
+                                             ('store, uncached', table, 0),
+                                             ('store, cached', table, 1000)):
+                store.resize_record_caches(cache_size)
+                store.clear_record_caches()
+                timer = timeit.Timer(lambda: repos[repo_id])
+                number = 10 if label == 'store, uncached' else 100000
+                best = min(timer.repeat(repeat=3, number=number)) / number
+                print '    %-20s %10.2f us/lookup' % (label, best * 1e6)
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == '__main__':
+    main()
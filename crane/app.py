@@ -5,6 +5,7 @@ import os.path
 from flask import Flask
 
 from crane.views import crane, v1, v2
+from crane import cdn
 from crane import config
 from crane import data
 from crane import exceptions
@@ -40,6 +41,8 @@ def create_app():
     # in case the config says that debug mode is on, we need to adjust the
     # log level
     set_log_level(app)
+    app_util.configure_caches(app)
+    cdn.init_app(app)
     data.start_monitoring_data_dir(app)
     search.load_config(app)
 
@@ -1,20 +1,39 @@
 import binascii
+import calendar
 import hashlib
 import hmac
 import httplib
 import logging
+import time
 from functools import wraps
 
-from flask import json, request
+from flask import current_app, json, request
 from rhsm import certificate
 from rhsm import certificate2
 
+from crane import cache
+from crane import compression
+from crane import config
+from crane import entitlement
 from crane import exceptions
 from crane import data
+from crane import store
 
 
 logger = logging.getLogger(__name__)
 
+# parsed client certificates keyed by the sha256 digest of the PEM, as tuples of
+# (certificate or None, time after which the entry must not be used, compiled
+# crane.entitlement.PathMatcher or None)
+certificate_cache = cache.LRUCache(1000)
+# results of check_path() keyed by (PEM digest, url path)
+certificate_path_cache = cache.LRUCache(10000)
+# number of repositories whose results a certificate is expected to need
+_PATHS_PER_CERTIFICATE = 10
+# the most recent result of get_repositories and get_v2_repositories, as tuples
+# of (generation, result), keyed by function name
+_repositories_cache = {}
+
 
 def http_error_handler(error):
     """
@@ -74,7 +93,7 @@ def repo_is_authorized(repo_id):
 
     if repo_tuple.protected:
         cert = _get_certificate()
-        if not cert or not cert.check_path(repo_tuple.url_path):
+        if not cert or not _check_path(cert, repo_tuple.url_path):
             # return 404 so we don't reveal the existence of repos that the user
             # is not authorized for
             raise exceptions.HTTPError(httplib.NOT_FOUND)
@@ -96,25 +115,22 @@ def authorize_image_id(func):
         image_repos = response_data['images'].get(image_id)
         if image_repos is None:
             raise exceptions.HTTPError(httplib.NOT_FOUND)
-        found_match = False
-
-        # Check if an uprotected repo matches the request
-
-        # Check if a protected repo matches the request
-        cert = _get_certificate()
         repo_tuple = None
 
-        for repo_id in image_repos:
-            repo_tuple = response_data['repos'].get(repo_id)
-            # if the repo is unprotected or the path is supported
-            if not repo_tuple.protected:
-                found_match = True
-                break
-            elif cert and cert.check_path(repo_tuple.url_path):
-                found_match = True
-                break
-
-        if not found_match:
+        # Check if an uprotected repo matches the request
+        if image_repos.unprotected is not None:
+            repo_tuple = response_data['repos'].get(image_repos.unprotected)
+        else:
+            # Check if a protected repo matches the request, checking each
+            # distinct path only once
+            cert = _get_certificate()
+            if cert:
+                for url_path, repo_id in image_repos.protected:
+                    if _check_path(cert, url_path):
+                        repo_tuple = response_data['repos'].get(repo_id)
+                        break
+
+        if repo_tuple is None:
             # return 404 so we don't reveal the existence of images that the user
             # is not authorized for
             raise exceptions.HTTPError(httplib.NOT_FOUND)
@@ -126,7 +142,8 @@ def authorize_image_id(func):
 
 def _get_certificate():
     """
-    Get the parsed certificate from the environment
+    Get the parsed certificate from the environment. Parsed certificates are
+    cached until they expire, keyed by a digest of the PEM.
 
     :rtype: rhsm.certificate2.EntitlementCertificate, or None
     """
@@ -134,13 +151,104 @@ def _get_certificate():
     pem_str = env.get('SSL_CLIENT_CERT', '')
     if not pem_str:
         return None
-    cert = certificate.create_from_pem(pem_str)
-    # The certificate may not be an entitlement certificate in which case we also return None
-    if not isinstance(cert, certificate2.EntitlementCertificate):
-        return None
+    pem_digest = hashlib.sha256(pem_str).digest()
+    entry = certificate_cache.get(pem_digest)
+    if entry is not None and entry[1] > time.time():
+        cert, not_after, matcher = entry
+    else:
+        cert = certificate.create_from_pem(pem_str)
+        # The certificate may not be an entitlement certificate in which case we also return None
+        if not isinstance(cert, certificate2.EntitlementCertificate):
+            cert = None
+        not_after = _certificate_end(cert)
+        if not_after > time.time():
+            matcher = entitlement.compile_certificate(cert) if cert is not None else None
+            certificate_cache.set(pem_digest, (cert, not_after, matcher))
+        else:
+            certificate_cache.pop(pem_digest)
+            return cert
+    if cert is not None:
+        # remember which certificate this is, so _check_path can use its
+        # compiled matcher and memoize its results
+        request.crane_certificate = (pem_digest, cert, matcher)
     return cert
 
 
+def _certificate_end(cert):
+    """
+    :param cert:    a parsed certificate, or None
+    :type  cert:    rhsm.certificate2.EntitlementCertificate
+
+    :return:    unix timestamp at which the certificate expires. For anything that
+                is not an entitlement certificate this is an hour from now, so
+                that invalid certificates are not parsed on every request either.
+    :rtype:     float
+    """
+    if cert is None:
+        return time.time() + 3600
+    try:
+        return calendar.timegm(cert.valid_range.end().utctimetuple())
+    except (AttributeError, TypeError, ValueError):
+        # without a known end date the certificate is not cached
+        return 0
+
+
+def _check_path(cert, url_path):
+    """
+    Determine if a certificate is entitled to a path. For certificates that came
+    from the certificate cache, the path is matched with the compiled matcher
+    and the result is memoized.
+
+    :param cert:        certificate returned by _get_certificate()
+    :type  cert:        rhsm.certificate2.EntitlementCertificate
+    :param url_path:    path of the repository being accessed
+    :type  url_path:    basestring
+
+    :return:    True iff the certificate is entitled to the path
+    :rtype:     bool
+    """
+    pem_digest, cached_cert, matcher = getattr(request, 'crane_certificate',
+                                               (None, None, None))
+    if cached_cert is not cert:
+        return cert.check_path(url_path)
+    key = (pem_digest, url_path)
+    allowed = certificate_path_cache.get(key)
+    if allowed is None:
+        if matcher is not None:
+            allowed = matcher.match(url_path)
+        else:
+            allowed = bool(cert.check_path(url_path))
+        certificate_path_cache.set(key, allowed)
+    return allowed
+
+
+def configure_caches(app):
+    """
+    Size the caches according to the app's configuration.
+
+    :param app: flask app
+    :type  app: flask.Flask
+    """
+    size = app.config.get(config.KEY_CERT_CACHE_SIZE, 1000)
+    certificate_cache.resize(size)
+    certificate_path_cache.resize(size * _PATHS_PER_CERTIFICATE)
+    compression.variant_cache.variants.resize(
+        app.config.get(config.KEY_COMPRESSED_CACHE_SIZE, 1000))
+    store.resize_record_caches(app.config.get(config.KEY_SHARED_STORE_CACHE_SIZE, 1000))
+
+
+def cache_stats():
+    """
+    :return:    hit and miss counters of the caches in this process, keyed by cache name
+    :rtype:     dict
+    """
+    return {'certificates': certificate_cache.stats(),
+            'certificate_paths': certificate_path_cache.stats(),
+            'compressed_responses': compression.variant_cache.variants.stats(),
+            'shared_store_records': dict((name, records.stats())
+                                         for name, records in store.record_caches.items())}
+
+
 def get_data():
     """
     Get the current data used for processing requests from
@@ -171,6 +279,48 @@ def get_v2_data():
     return request.crane_data_v2
 
 
+def not_modified(etag):
+    """
+    Determine if the client already has the current version of a response, as
+    indicated by its If-None-Match header.
+
+    :param etag:    strong entity tag of the response, without quotes, or None
+    :type  etag:    basestring
+
+    :return:    a 304 response if the client has the current version, else None
+    :rtype:     flask.Response
+    """
+    if etag:
+        # the client may have a compressed variant, see crane.compression
+        for candidate in compression.etags(etag):
+            if request.if_none_match.contains_weak(candidate):
+                response = current_app.response_class(status=httplib.NOT_MODIFIED)
+                response.set_etag(candidate)
+                return response
+    return None
+
+
+def _cached_per_generation(func):
+    """
+    Cache the result of a function of the response data until the data is
+    reloaded. The result must not be modified by callers.
+
+    :param func:    function that takes no arguments
+    :type  func:    function
+    :rtype: function
+    """
+    @wraps(func)
+    def wrapper(generation):
+        cached = _repositories_cache.get(func.__name__)
+        if generation is not None and cached is not None and cached[0] == generation:
+            return cached[1]
+        result = func()
+        _repositories_cache[func.__name__] = (generation, result)
+        return result
+
+    return wrapper
+
+
 def get_repositories():
     """
     Get the current data used for processing requests from the flask request context
@@ -186,6 +336,11 @@ def get_repositories():
     :return: dictionary keyed by repo-registry-ids
     :rtype: dict
     """
+    return _get_repositories(get_data().get('generation'))
+
+
+@_cached_per_generation
+def _get_repositories():
     all_repo_data = get_data().get('repos', {})
     relevant_repo_data = {}
     for repo_registry_id, repo in all_repo_data.items():
@@ -210,6 +365,11 @@ def get_v2_repositories():
     :return: dictionary keyed by repo-registry-ids
     :rtype: dict
     """
+    return _get_v2_repositories(get_v2_data().get('generation'))
+
+
+@_cached_per_generation
+def _get_v2_repositories():
     all_repo_data_v2 = get_v2_data().get('repos', {})
     relevant_repo_data = {}
     for repo_registry_id, repo in all_repo_data_v2.items():
@@ -263,12 +423,58 @@ def name_is_authorized(name):
 
     if v2_repo_tuple.protected:
         cert = _get_certificate()
-        if not cert or not cert.check_path(v2_repo_tuple.url_path):
+        if not cert or not _check_path(cert, v2_repo_tuple.url_path):
             # return 404 so we don't reveal the existence of repos that the user
             # is not authorized for
             raise exceptions.HTTPError(httplib.NOT_FOUND)
 
 
+def authorized_names(names):
+    """
+    Determines which of the given repository names the current request is
+    authorized to read, either as a v2 repository or as a v1 repository, with
+    the same outcome as calling name_is_authorized and then repo_is_authorized
+    for each name. The client certificate is looked up at most once, and each
+    protected path is checked only once.
+
+    :param names:   names of repositories
+    :type  names:   iterable
+
+    :return:    the names that are known to this app and that the user is
+                authorized to read
+    :rtype:     set
+    """
+    names = set(names)
+    if not names:
+        return set()
+    all_repos = (get_v2_data()['repos'], get_data()['repos'])
+    # the certificate is only needed if a protected repository is found
+    cert = None
+    cert_loaded = False
+    path_allowed = {}
+    allowed = set()
+    for name in names:
+        for repos in all_repos:
+            repo_tuple = repos.get(name)
+            if repo_tuple is None:
+                continue
+            if not repo_tuple.protected:
+                allowed.add(name)
+                break
+            if not cert_loaded:
+                cert = _get_certificate()
+                cert_loaded = True
+            if not cert:
+                continue
+            url_path = repo_tuple.url_path
+            if url_path not in path_allowed:
+                path_allowed[url_path] = bool(_check_path(cert, url_path))
+            if path_allowed[url_path]:
+                allowed.add(name)
+                break
+    return allowed
+
+
 def authorize_name(func):
     """
     Authorize that a particular certificate has access to any directory
@@ -0,0 +1,95 @@
+"""
+Small in-process caches shared by the threads of a web server process.
+"""
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """
+    Thread-safe dictionary that holds at most "maxsize" items, discarding the
+    least recently used item when it is full. Lookups are counted so the
+    effectiveness of the cache can be monitored.
+    """
+    def __init__(self, maxsize):
+        """
+        :param maxsize: maximum number of items to hold. 0 disables the cache.
+        :type  maxsize: int
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        :param key:     key of the item
+        :param default: value to return if the key is not in the cache
+
+        :return:    the cached value, or default
+        """
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # re-insert to mark the item as most recently used
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        :param key:     key of the item
+        :param value:   value to cache
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove an item from the cache.
+
+        :param key:     key of the item
+        :param default: value to return if the key is not in the cache
+
+        :return:    the removed value, or default
+        """
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        """
+        Remove all items. The lookup counters are kept.
+        """
+        with self._lock:
+            self._items.clear()
+
+    def resize(self, maxsize):
+        """
+        :param maxsize: new maximum number of items to hold. 0 disables the cache.
+        :type  maxsize: int
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._items) > max(maxsize, 0):
+                self._items.popitem(last=False)
+
+    def stats(self):
+        """
+        :return:    dictionary with the keys "hits", "misses", "size" and "maxsize"
+        :rtype:     dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._items), 'maxsize': self.maxsize}
@@ -0,0 +1,149 @@
+"""
+Rewriting and signing of the URLs clients are redirected to, as configured in
+the "cdn" section of the config.
+
+The configuration is bound to a URLSigner when the app is created. Tokens
+follow Akamai's Auth Token 2.0 Specification, see
+crane.app_util.generate_cdn_url_token. When "url_auth_bucket" is set, token
+expirations are rounded up to a multiple of it, so that all redirects to a
+path within one bucket share a token, which is then computed only once and
+cached.
+"""
+import binascii
+import hashlib
+import hmac
+import time
+import urlparse
+
+from flask import current_app
+
+from crane import cache
+from crane import config
+
+
+EXTENSION_NAME = 'crane.cdn'
+
+
+class URLSigner(object):
+    """
+    Rewrites and signs redirect URLs with a fixed configuration.
+    """
+    def __init__(self, cdn_config):
+        """
+        :param cdn_config:  values of the "cdn" config section
+        :type  cdn_config:  dict
+        """
+        self.url_match = cdn_config.get(config.KEY_URL_MATCH)
+        self.url_replace = cdn_config.get(config.KEY_URL_REPLACE)
+        self.auth_param = cdn_config.get(config.KEY_URL_AUTH_PARAM)
+        self.auth_ttl = cdn_config.get(config.KEY_URL_AUTH_TTL)
+        self.auth_bucket = cdn_config.get(config.KEY_URL_AUTH_BUCKET) or 0
+        self.tokens = cache.LRUCache(cdn_config.get(config.KEY_URL_AUTH_CACHE_SIZE, 0))
+        self._hmac = None
+        auth_secret = cdn_config.get(config.KEY_URL_AUTH_SECRET)
+        if auth_secret:
+            algorithm = cdn_config.get(config.KEY_URL_AUTH_ALGO).lower()
+            # copied for every token, so the key is only processed once
+            self._hmac = hmac.new(binascii.a2b_hex(auth_secret),
+                                  digestmod=getattr(hashlib, algorithm))
+
+    def rewrite(self, url):
+        """
+        Rewrites the URL by performing a simple match and replace.
+
+        :param url:    URL for redirect
+        :type  url:    string
+
+        :return:    rewritten URL, or the unmodified URL if both url_match and
+                    url_replace are not configured
+        :rtype:     string
+        """
+        if self.url_match and self.url_replace:
+            return url.replace(self.url_match, self.url_replace)
+        return url
+
+    def expiration(self, now):
+        """
+        :param now: unix timestamp
+        :type  now: float
+
+        :return:    unix timestamp at which a token generated now expires
+        :rtype:     int
+        """
+        expiration = int(now) + self.auth_ttl
+        if self.auth_bucket > 0:
+            # round up, so tokens are valid for at least the configured ttl
+            expiration += -expiration % self.auth_bucket
+        return expiration
+
+    def sign(self, url, now=None):
+        """
+        Adds the token auth param to the URL.
+
+        :param url:    URL for redirect
+        :type  url:    string
+        :param now:    unix timestamp the token's lifetime starts at. defaults
+                       to the current time
+        :type  now:    float
+
+        :return:    URL with authorization token, or the unmodified URL if
+                    url_auth_secret is not configured
+        :rtype:     string
+        """
+        if self._hmac is None:
+            return url
+        cdn_path = urlparse.urlparse(url).path
+        expiration = self.expiration(time.time() if now is None else now)
+        key = (cdn_path, expiration)
+        token = self.tokens.get(key)
+        if token is None:
+            token = self.token(cdn_path, expiration)
+            self.tokens.set(key, token)
+        return '%s?%s=%s' % (url, self.auth_param, token)
+
+    def max_age(self, now):
+        """
+        :param now: unix timestamp a URL was signed at
+        :type  now: float
+
+        :return:    number of seconds a URL signed at "now" remains valid, or
+                    None if URLs are not signed
+        :rtype:     int
+        """
+        if self._hmac is None:
+            return None
+        return max(self.expiration(now) - int(now), 0)
+
+    def token(self, path, expiration):
+        """
+        :param path:        path to be secured
+        :type  path:        string
+        :param expiration:  unix timestamp for token expiration
+        :type  expiration:  int
+
+        :return:    the same token as crane.app_util.generate_cdn_url_token
+        :rtype:     string
+        """
+        new_token = 'exp=%d~' % expiration
+        token_hmac = self._hmac.copy()
+        token_hmac.update('%surl=%s' % (new_token, path))
+        return '%shmac=%s' % (new_token, token_hmac.hexdigest())
+
+
+def init_app(app):
+    """
+    Bind the app's current "cdn" configuration. Call it again after changing
+    that configuration.
+
+    :param app: flask app
+    :type  app: flask.Flask
+    """
+    app.extensions[EXTENSION_NAME] = URLSigner(app.config.get(config.SECTION_CDN, {}))
+
+
+def signer():
+    """
+    :return:    the URL signer of the current app
+    :rtype:     URLSigner
+    """
+    return current_app.extensions[EXTENSION_NAME]
@@ -0,0 +1,146 @@
+"""
+Compressed variants of response bodies.
+
+Most of crane's responses only change when the metadata is reloaded, so each
+body is compressed at most once per encoding: the first request that accepts an
+encoding compresses the body, and later requests for the same body are answered
+from a cache keyed by the body's digest. The cache is cleared whenever the
+metadata generation changes.
+
+gzip is always available. brotli is offered in addition if the "brotli" package
+is installed; otherwise clients that accept both get gzip.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import zlib
+
+from flask import request
+
+from crane import cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# bodies smaller than this are not worth compressing
+MIN_SIZE = 1024
+
+
+def gzip(body):
+    """
+    :param body:    bytes to compress
+    :type  body:    str
+
+    :return:    gzip compressed body. The header has neither a file name nor a
+                modification time, so the same body always compresses to the
+                same bytes.
+    :rtype:     str
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+# content codings, in order of preference when a client accepts several equally
+ENCODERS = OrderedDict()
+if brotli is not None:
+    # the highest quality levels take seconds for multi-MB bodies
+    ENCODERS['br'] = lambda body: brotli.compress(body, quality=9)
+ENCODERS['gzip'] = gzip
+
+
+class VariantCache(object):
+    """
+    Compressed bodies of one metadata generation, keyed by the digest of the
+    uncompressed body and the content coding.
+    """
+    def __init__(self, maxsize):
+        """
+        :param maxsize: maximum number of compressed bodies to hold. 0 disables the cache.
+        :type  maxsize: int
+        """
+        self.variants = cache.LRUCache(maxsize)
+        self.generation = None
+        self._lock = threading.Lock()
+
+    def get(self, generation, body, encoding):
+        """
+        :param generation:  generation of the data the body was made from
+        :type  generation:  basestring
+        :param body:        uncompressed body
+        :type  body:        str
+        :param encoding:    a key of ENCODERS
+        :type  encoding:    str
+
+        :return:    compressed body
+        :rtype:     str
+        """
+        if generation != self.generation:
+            with self._lock:
+                if generation != self.generation:
+                    self.variants.clear()
+                    self.generation = generation
+        key = (hashlib.sha1(body).digest(), encoding)
+        compressed = self.variants.get(key)
+        if compressed is None:
+            compressed = ENCODERS[encoding](body)
+            self.variants.set(key, compressed)
+        return compressed
+
+
+variant_cache = VariantCache(1000)
+
+
+def etags(etag):
+    """
+    :param etag:    entity tag of an uncompressed body, without quotes
+    :type  etag:    basestring
+
+    :return:    the entity tag, followed by the entity tags of each compressed
+                variant of the body
+    :rtype:     list
+    """
+    return [etag] + ['%s-%s' % (etag, encoding) for encoding in ENCODERS]
+
+
+def _compressible(mimetype):
+    return mimetype == 'application/json' or mimetype.endswith('+json') or \
+        mimetype.startswith('text/')
+
+
+def compress_response(response, generation):
+    """
+    Compress a response's body with the best content coding the client accepts.
+    Only complete 200 and error responses with a json or text body of at least
+    MIN_SIZE bytes that is not already encoded are compressed. Redirects, 304
+    and partial responses are left alone. Entity tags of compressed responses
+    get the content coding appended.
+
+    :param response:    flask response object for a request
+    :type  response:    flask.Response
+    :param generation:  generation of the data the response was made from
+    :type  generation:  basestring
+
+    :return:    the response
+    :rtype:     flask.Response
+    """
+    status = response.status_code
+    if (status != 200 and status < 400) or response.direct_passthrough or \
+            response.is_streamed or 'Content-Encoding' in response.headers or \
+            not _compressible(response.mimetype):
+        return response
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODERS.keys())
+    if encoding is None:
+        return response
+    response.set_data(variant_cache.get(generation, body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag('%s-%s' % (etag, encoding), weak)
+    return response
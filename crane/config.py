@@ -1,10 +1,12 @@
 import binascii
 from ConfigParser import ConfigParser, NoSectionError, NoOptionError
 from contextlib import contextmanager
+import httplib
 import logging
 import os
 
 import pkg_resources
+from werkzeug.http import HTTP_STATUS_CODES
 
 
 _logger = logging.getLogger(__name__)
@@ -24,6 +26,18 @@ SECTION_GENERAL = 'general'
 KEY_DEBUG = 'debug'
 KEY_DATA_DIR = 'data_dir'
 KEY_DATA_POLLING_INTERVAL = 'data_dir_polling_interval'
+KEY_DATA_WATCHER = 'data_dir_watcher'
+KEY_DATA_WATCHER_DEBOUNCE = 'data_dir_watcher_debounce'
+VALID_DATA_WATCHERS = ['poll', 'inotify']
+KEY_LOAD_WORKERS = 'load_workers'
+KEY_INDEX_PATH = 'index_path'
+KEY_SHARED_STORE_DIR = 'shared_store_dir'
+KEY_CERT_CACHE_SIZE = 'cert_cache_size'
+KEY_COMPRESSED_CACHE_SIZE = 'compressed_cache_size'
+KEY_SHARED_STORE_CACHE_SIZE = 'shared_store_cache_size'
+KEY_REDIRECT_STATUS = 'redirect_status'
+VALID_REDIRECT_STATUSES = [302, 307, 308]
+KEY_REDIRECT_MAX_AGE = 'redirect_max_age'
 KEY_ENDPOINT = 'endpoint'
 
 # cdn rewrite settings
@@ -34,6 +48,8 @@ KEY_URL_AUTH_SECRET = 'url_auth_secret'
 KEY_URL_AUTH_PARAM = 'url_auth_param'
 KEY_URL_AUTH_TTL = 'url_auth_ttl'
 KEY_URL_AUTH_ALGO = 'url_auth_algo'
+KEY_URL_AUTH_BUCKET = 'url_auth_bucket'
+KEY_URL_AUTH_CACHE_SIZE = 'url_auth_cache_size'
 VALID_AUTH_ALGO = ["sha256", "sha1", "md5"]
 
 # serve content settings
@@ -48,6 +64,25 @@ SECTION_GSA = 'gsa'
 SECTION_SOLR = 'solr'
 KEY_URL = 'url'
 
+# search settings
+SECTION_SEARCH = 'search'
+KEY_SEARCH_LOCAL = 'local'
+KEY_CACHE_TTL = 'cache_ttl'
+KEY_CACHE_STALE_TTL = 'cache_stale_ttl'
+KEY_CACHE_ERROR_TTL = 'cache_error_ttl'
+KEY_CACHE_SIZE = 'cache_size'
+KEY_POOL_SIZE = 'pool_size'
+KEY_POOL_IDLE_TIMEOUT = 'pool_idle_timeout'
+KEY_TIMEOUT = 'timeout'
+KEY_MAX_RESULTS = 'max_results'
+KEY_BACKENDS = 'backends'
+KEY_DEADLINE = 'deadline'
+KEY_BREAKER_THRESHOLD = 'breaker_threshold'
+KEY_BREAKER_RESET_TIMEOUT = 'breaker_reset_timeout'
+KEY_ADAPTIVE_TIMEOUT = 'adaptive_timeout'
+KEY_MIN_TIMEOUT = 'min_timeout'
+VALID_SEARCH_BACKENDS = ['gsa', 'solr', 'local']
+
 
 def load(app):
     """
@@ -98,13 +133,34 @@ def read_config(app, parser):
     with supress(NoSectionError):
         app.config['DEBUG'] = parser.getboolean(SECTION_GENERAL, KEY_DEBUG)
         # parse other "general" section values
-        for key in (KEY_DATA_DIR, KEY_ENDPOINT):
+        for key in (KEY_DATA_DIR, KEY_ENDPOINT, KEY_INDEX_PATH, KEY_SHARED_STORE_DIR):
             with supress(NoOptionError):
                 app.config[key] = parser.get(SECTION_GENERAL, key)
         # parse "general" section values as integers
-        for key in (KEY_DATA_POLLING_INTERVAL, ):
+        for key in (KEY_DATA_POLLING_INTERVAL, KEY_DATA_WATCHER_DEBOUNCE, KEY_LOAD_WORKERS,
+                    KEY_CERT_CACHE_SIZE, KEY_COMPRESSED_CACHE_SIZE, KEY_SHARED_STORE_CACHE_SIZE,
+                    KEY_REDIRECT_MAX_AGE):
             with supress(NoOptionError):
                 app.config[key] = int(parser.get(SECTION_GENERAL, key))
+        with supress(NoOptionError):
+            watcher = parser.get(SECTION_GENERAL, KEY_DATA_WATCHER)
+            if watcher in VALID_DATA_WATCHERS:
+                app.config[KEY_DATA_WATCHER] = watcher
+            else:
+                _logger.error('value for config option %s is not a valid choice. falling back '
+                              'to default' % KEY_DATA_WATCHER)
+        with supress(NoOptionError, ValueError):
+            status = int(parser.get(SECTION_GENERAL, KEY_REDIRECT_STATUS))
+            if status in VALID_REDIRECT_STATUSES and status not in HTTP_STATUS_CODES:
+                # older werkzeug releases, which Flask>=0.9 allows, do not know 308
+                _logger.error('the installed werkzeug does not support status %d for config '
+                              'option %s. falling back to 307' % (status, KEY_REDIRECT_STATUS))
+                status = httplib.TEMPORARY_REDIRECT
+            if status in VALID_REDIRECT_STATUSES:
+                app.config[KEY_REDIRECT_STATUS] = status
+            else:
+                _logger.error('value for config option %s is not a valid choice. falling back '
+                              'to default' % KEY_REDIRECT_STATUS)
 
     app.config['DEBUG'] = app.config.get('DEBUG') or \
         os.environ.get(DEBUG_ENV_NAME, '').lower() == 'true'
@@ -119,7 +175,7 @@ def read_config(app, parser):
                 section[key] = parser.get(SECTION_CDN, key)
 
         # parse values as integers
-        for key in (KEY_URL_AUTH_TTL,):
+        for key in (KEY_URL_AUTH_TTL, KEY_URL_AUTH_BUCKET, KEY_URL_AUTH_CACHE_SIZE):
             with supress(NoOptionError):
                 section[key] = int(parser.get(SECTION_CDN, key))
 
@@ -180,6 +236,35 @@ def read_config(app, parser):
             with supress(NoOptionError):
                 section[key] = parser.get(SECTION_SOLR, key)
 
+    # "search" section settings
+    with supress(NoSectionError):
+        section = app.config.setdefault(SECTION_SEARCH, {})
+
+        for key in (KEY_CACHE_TTL, KEY_CACHE_STALE_TTL, KEY_CACHE_ERROR_TTL, KEY_CACHE_SIZE,
+                    KEY_POOL_SIZE, KEY_POOL_IDLE_TIMEOUT, KEY_MAX_RESULTS,
+                    KEY_BREAKER_THRESHOLD, KEY_BREAKER_RESET_TIMEOUT):
+            with supress(NoOptionError):
+                section[key] = int(parser.get(SECTION_SEARCH, key))
+        for key in (KEY_TIMEOUT, KEY_MIN_TIMEOUT):
+            with supress(NoOptionError):
+                section[key] = float(parser.get(SECTION_SEARCH, key))
+        with supress(NoOptionError):
+            section[KEY_ADAPTIVE_TIMEOUT] = parser.getboolean(SECTION_SEARCH,
+                                                              KEY_ADAPTIVE_TIMEOUT)
+        with supress(NoOptionError):
+            section[KEY_SEARCH_LOCAL] = parser.getboolean(SECTION_SEARCH, KEY_SEARCH_LOCAL)
+        with supress(NoOptionError):
+            section[KEY_DEADLINE] = float(parser.get(SECTION_SEARCH, KEY_DEADLINE))
+        with supress(NoOptionError):
+            section[KEY_BACKENDS] = []
+            for name in parser.get(SECTION_SEARCH, KEY_BACKENDS).split(','):
+                name = name.strip().lower()
+                if name in VALID_SEARCH_BACKENDS:
+                    section[KEY_BACKENDS].append(name)
+                elif name:
+                    _logger.error('value %s for config option %s is not a valid choice. '
+                                  'ignoring it' % (name, KEY_BACKENDS))
+
 
 @contextmanager
 def supress(*exceptions):
@@ -1,32 +1,139 @@
 from collections import namedtuple
+import itertools
 import logging
+import multiprocessing
 import os
 import threading
 import time
 import urlparse
 import fnmatch
+import hashlib
 from flask import json
 
+from . import compression
 from . import config
+from . import inotify
+from . import manifests
+from . import search_index
+from . import store
 
 
 logger = logging.getLogger(__name__)
 
+# "generation" identifies the snapshot of the metadata that the response data
+# was built from, and changes whenever it is reloaded with different files.
+# "search_index" is a crane.search_index.SearchIndex of all v1 and v2
+# repositories if the local search backend is configured, else None.
 v1_response_data = {
     'repos': {},
     'images': {},
+    'generation': None,
+    'search_index': None,
 }
 
 v2_response_data = {
-    'repos': {}
+    'repos': {},
+    'generation': None,
+}
+
+# state of the most recent call to load_all, used to re-parse only changed files
+# and to patch the response data it published. "files" maps each metadata file
+# path to its LoadedFile, "paths" lists the metadata files in load order, "winners"
+# maps each repo key to the LoadedFile whose repository is being served,
+# "repo_images" maps each v1 repo key to the ids of the images listed by any of its
+# files, and "v1"/"v2" are the response data it published.
+_load_state = {
+    'files': {},
+    'paths': [],
+    'winners': {},
+    'repo_images': {},
+    'v1': None,
+    'v2': None,
 }
 
+# the shared store generation that the response data is currently mapped from,
+# if the "shared_store_dir" option is set
+_shared_generation = None
+# the metadata index that the response data is currently mapped from, if the
+# "index_path" option is set and the index was current when metadata was loaded
+_index_generation = None
+# tables of the shared store and the index whose records are looked up by
+# requests, and so are worth caching. The "files" table is only read when
+# metadata is reloaded.
+_CACHED_TABLES = ('v1_repos', 'images', 'v2_repos')
+
+# description is the optional "description" value of the metadata, which is
+# only used for searching.
+# images_etag and tags_etag are strong entity tags of images_json and tags_json.
+# images_gzip and tags_gzip are the gzip compressed bodies, or None if they are
+# smaller than crane.compression.MIN_SIZE.
 V1Repo = namedtuple('V1Repo', ['url', 'repository', 'images_json', 'tags_json',
-                               'url_path', 'protected'])
-V2Repo = namedtuple('V2Repo', ['url', 'repository', 'url_path', 'protected'])
-V3Repo = namedtuple('V3Repo', ['url', 'repository', 'url_path', 'schema2_data', 'protected'])
+                               'url_path', 'protected', 'images_etag', 'tags_etag',
+                               'images_gzip', 'tags_gzip', 'description'])
+V1Repo.__new__.__defaults__ = (None, None, None, None, None)
+V2Repo = namedtuple('V2Repo', ['url', 'repository', 'url_path', 'protected', 'description'])
+V2Repo.__new__.__defaults__ = (None,)
+# schema2_tags, manifest_list_tags and manifest_list_amd64 hold the same data as
+# the corresponding json fields, parsed once at load time so that manifest
+# requests can be routed without decoding json. manifest_routes holds the
+# redirect target of every known tag and digest, see crane.manifests.build_routes.
+# They must not be modified.
+V3Repo = namedtuple('V3Repo', ['url', 'repository', 'url_path', 'schema2_data', 'protected',
+                               'schema2_tags', 'manifest_routes', 'description'])
+V3Repo.__new__.__defaults__ = (frozenset(), {}, None)
 V4Repo = namedtuple('V4Repo', ['url', 'repository', 'url_path', 'schema2_data',
-                               'manifest_list_data', 'manifest_list_amd64_tags', 'protected'])
+                               'manifest_list_data', 'manifest_list_amd64_tags', 'protected',
+                               'schema2_tags', 'manifest_list_tags', 'manifest_list_amd64',
+                               'manifest_routes', 'description'])
+V4Repo.__new__.__defaults__ = (frozenset(), frozenset(), {}, {}, None)
+
+# the result of loading one metadata file, along with the fingerprint the file
+# had when it was loaded
+LoadedFile = namedtuple('LoadedFile', ['fingerprint', 'repo_id', 'repo_tuple', 'image_ids'])
+ParsedFile = namedtuple('ParsedFile', ['path', 'result'])
+
+
+class ImageRepos(frozenset):
+    """
+    The ids of the v1 repositories that contain an image, along with which of
+    them should serve the image. It compares equal to a plain frozenset of the
+    repo ids.
+
+    unprotected is the lowest repo id of the unprotected repositories, or None if
+    all of them are protected. protected is a tuple of (url_path, repo_id) with
+    one entry per distinct url_path of the protected repositories, holding the
+    lowest repo id with that path, ordered by repo id. Choosing the lowest repo id
+    makes the repository an image is served from, and so the redirect URL,
+    stable across processes and reloads.
+    """
+    def __new__(cls, repo_ids=(), repos=None):
+        """
+        :param repo_ids:    ids of the repositories that contain the image
+        :type  repo_ids:    iterable
+        :param repos:       V1Repo instances keyed by repo id, which must include
+                            every repo in repo_ids
+        :type  repos:       dict
+        """
+        self = super(ImageRepos, cls).__new__(cls, repo_ids)
+        self.unprotected = None
+        self.protected = ()
+        if repos is not None:
+            protected = []
+            seen_paths = set()
+            for repo_id in sorted(self):
+                repo_tuple = repos[repo_id]
+                if not repo_tuple.protected:
+                    self.unprotected = repo_id
+                    break
+                if repo_tuple.url_path not in seen_paths:
+                    seen_paths.add(repo_tuple.url_path)
+                    protected.append((repo_tuple.url_path, repo_id))
+            else:
+                self.protected = tuple(protected)
+        return self
+
+    def __init__(self, repo_ids=(), repos=None):
+        super(ImageRepos, self).__init__()
 
 
 def load_from_file(path):
@@ -53,38 +160,92 @@ def load_from_file(path):
     repo_id = repo_data['repo-registry-id']
     url_path = urlparse.urlparse(repo_data['url']).path
     repository = repo_data['repository']
+    description = repo_data.get('description')
 
     if repo_data['version'] == 1:
         image_ids = [image['id'] for image in repo_data['images']]
+        images_json, images_gzip = encode_body(repo_data['images'])
+        tags_json, tags_gzip = encode_body(repo_data['tags'])
         repo_tuple = V1Repo(repo_data['url'],
                             repository,
-                            json.dumps(repo_data['images']),
-                            json.dumps(repo_data['tags']),
-                            url_path, repo_data.get('protected', False))
+                            images_json,
+                            tags_json,
+                            url_path, repo_data.get('protected', False),
+                            etag(images_json), etag(tags_json),
+                            images_gzip, tags_gzip, description)
         return repo_id, repo_tuple, image_ids
     elif repo_data['version'] == 2:
         repo_tuple = V2Repo(repo_data['url'],
                             repository,
-                            url_path, repo_data.get('protected', False))
+                            url_path, repo_data.get('protected', False), description)
         return repo_id, repo_tuple, None
     elif repo_data['version'] == 3:
+        schema2_tags = frozenset(repo_data['schema2_data'])
         repo_tuple = V3Repo(repo_data['url'],
                             repository,
                             url_path,
                             json.dumps(repo_data['schema2_data']),
-                            repo_data.get('protected', False))
+                            repo_data.get('protected', False),
+                            schema2_tags,
+                            manifests.build_routes(repo_data['url'], schema2_tags,
+                                                   frozenset(), {}),
+                            description)
         return repo_id, repo_tuple, None
     elif repo_data['version'] == 4:
+        schema2_tags = frozenset(repo_data['schema2_data'])
+        manifest_list_tags = frozenset(repo_data['manifest_list_data'])
+        manifest_list_amd64 = dict((tag, (digest, int(schema_version)))
+                                   for tag, (digest, schema_version)
+                                   in repo_data['manifest_list_amd64_tags'].iteritems())
         repo_tuple = V4Repo(repo_data['url'],
                             repository,
                             url_path,
                             json.dumps(repo_data['schema2_data']),
                             json.dumps(repo_data['manifest_list_data']),
                             json.dumps(repo_data['manifest_list_amd64_tags']),
-                            repo_data.get('protected', False))
+                            repo_data.get('protected', False),
+                            schema2_tags,
+                            manifest_list_tags,
+                            manifest_list_amd64,
+                            manifests.build_routes(repo_data['url'], schema2_tags,
+                                                   manifest_list_tags, manifest_list_amd64),
+                            description)
         return repo_id, repo_tuple, None
 
 
+def encode_body(value):
+    """
+    Serialize a response body once, in the form it is sent to clients.
+
+    :param value:   value to serialize as json
+    :type  value:   list or dict
+
+    :return:    tuple of the compact json as utf-8 encoded bytes, and the same
+                bytes gzip compressed, or None if the json is smaller than
+                crane.compression.MIN_SIZE
+    :rtype:     tuple
+    """
+    body = json.dumps(value, separators=(',', ':'))
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    if len(body) < compression.MIN_SIZE:
+        return body, None
+    return body, compression.gzip(body)
+
+
+def etag(body):
+    """
+    :param body:    a serialized response body
+    :type  body:    basestring
+
+    :return:    strong entity tag for the body, without quotes
+    :rtype:     str
+    """
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    return hashlib.sha1(body).hexdigest()
+
+
 def monitor_data_dir(app, last_modified=0):
     """
     Loop forever monitoring the data directory for changes and reload the data if any changes occur
@@ -139,6 +300,40 @@ def monitor_data_dir(app, last_modified=0):
                 break
 
 
+def monitor_data_dir_inotify(app, last_modified=0):
+    """
+    Loop forever waiting for inotify events on metadata files in the data directory,
+    and reload only the files that changed. Bursts of events are collected until
+    none have arrived for "data_dir_watcher_debounce" milliseconds.
+
+    Falls back to polling with monitor_data_dir if the data directory cannot be
+    watched.
+
+    :param app: the flask application
+    :type  app: flask.Flask
+    :param last_modified:   seconds since the epoch; passed on to monitor_data_dir
+                            if falling back to polling.
+    :type  last_modified:   int or float
+    """
+    data_dir = app.config[config.KEY_DATA_DIR]
+    debounce = app.config[config.KEY_DATA_WATCHER_DEBOUNCE] / 1000.0
+    try:
+        if not os.path.isdir(data_dir):
+            raise OSError('The data directory specified does not exist: %s' % data_dir)
+        watcher = inotify.InotifyWatcher(
+            data_dir, poll_interval=app.config[config.KEY_DATA_POLLING_INTERVAL])
+    except OSError, e:
+        logger.error('could not watch data directory, falling back to polling: %s' % str(e))
+        return monitor_data_dir(app, last_modified)
+
+    # changes that happened before the watches were in place would be missed
+    load_all(app)
+    while True:
+        changed_paths = watcher.wait_for_changes(debounce)
+        logger.debug('metadata files changed: %s' % changed_paths)
+        load_all(app, changed_paths)
+
+
 def start_monitoring_data_dir(app):
     """
     Spin off a daemon thread that monitors the data dir for changes and updates the app config
@@ -150,60 +345,577 @@ def start_monitoring_data_dir(app):
     now = time.time()
     # load the data once in a blocking fashion
     load_all(app)
-    thread = threading.Thread(target=monitor_data_dir, args=(app, now))
+    if app.config.get(config.KEY_DATA_WATCHER) == 'inotify':
+        target = monitor_data_dir_inotify
+    else:
+        target = monitor_data_dir
+    thread = threading.Thread(target=target, args=(app, now))
     thread.setDaemon(True)
     thread.start()
 
 
-def load_all(app):
+def load_all(app, changed_paths=None):
     """
     Load all metadata files and replace the "response_data" value in this
     module.
 
+    Only files that were added or changed since the previous load are parsed;
+    a file is considered unchanged if its path, mtime, size and inode all match
+    what was seen last time. The new response data is built by patching the
+    previously published data with the repositories of those files, so a change
+    to one repository does not cost a full re-parse of the data dir.
+
     :param app: the flask application
     :type  app: flask.Flask
+    :param changed_paths:   full paths of the only metadata files that may have
+                            been added, changed or removed since the previous
+                            load. If None, the whole data dir is scanned.
+    :type  changed_paths:   set or None
     """
     global v2_response_data
-    v2_repos = {}
-
     global v1_response_data
-    v1_repos = {}
-    images = {}
+    global _load_state
+    global _index_generation
+
+    store_dir = app.config.get(config.KEY_SHARED_STORE_DIR)
+    if isinstance(store_dir, basestring) and store_dir:
+        return _load_shared(app, store_dir)
 
     try:
         data_dir = app.config[config.KEY_DATA_DIR]
         logger.info('loading metadata from %s' % data_dir)
-        # scan data dir recursively and pick json files
-        paths = [os.path.join(dirpath, f)
-                 for dirpath, dirnames, files in os.walk(data_dir,
-                                                         followlinks=True)
-                 for f in fnmatch.filter(files, '*.json')]
-        # load data from each file
-        for metadata_file_path in paths:
-            try:
-                logger.debug('loading: %s' % metadata_file_path)
-                repo_id, repo_tuple, image_ids = load_from_file(metadata_file_path)
-            except Exception, e:
-                logger.error('skipping current metadata load: %s' % str(e))
-                continue
-
-            if isinstance(repo_tuple, V1Repo):
-                v1_repos[repo_id] = repo_tuple
-                for image_id in image_ids:
-                    images.setdefault(image_id, set()).add(repo_id)
-            else:
-                v2_repos[repo_id] = repo_tuple
-        # make each set immutable
-        for image_id in images.keys():
-            images[image_id] = frozenset(images[image_id])
+
+        previous = _load_state
+        if previous['v1'] is not v1_response_data or previous['v2'] is not v2_response_data:
+            # the published data was not built by the previous load, so there
+            # is nothing to patch; keep the parsed files but rebuild from scratch.
+            previous = {'files': previous['files'], 'paths': previous['paths'],
+                        'winners': {}, 'repo_images': {}, 'v1': None, 'v2': None}
+            changed_paths = None
+
+        if changed_paths is None:
+            paths = find_metadata_files(data_dir)
+        else:
+            # in the same order as find_metadata_files, so that the same file
+            # wins a duplicate repo-registry-id as in a full load
+            known_paths = set(previous['paths'])
+            paths = [path for path in previous['paths']
+                     if path not in changed_paths or os.path.exists(path)]
+            paths.extend(path for path in changed_paths
+                         if path not in known_paths and os.path.exists(path))
+            paths.sort()
+
+        if _map_index(app, paths):
+            return
+        if not previous['files']:
+            previous['files'] = _load_index(app)
+
+        workers = int(app.config.get(config.KEY_LOAD_WORKERS, 1))
+        loaded_files = load_files(paths, previous['files'], changed_paths, workers)
+        winners = _select_winners(paths, loaded_files)
+        repo_images = _collect_repo_images(loaded_files)
+
+        if previous['v1'] is None:
+            affected = set(winners)
+        else:
+            affected = set()
+            for path, loaded_file in previous['files'].iteritems():
+                if loaded_files.get(path) is not loaded_file:
+                    affected.add(_repo_key(loaded_file))
+            for path, loaded_file in loaded_files.iteritems():
+                if previous['files'].get(path) is not loaded_file:
+                    affected.add(_repo_key(loaded_file))
+
+        if not affected:
+            _load_state = dict(previous, files=loaded_files, paths=paths)
+            logger.info('metadata unchanged')
+            return
+
+        v1_repos, v2_repos, images = _patch_response_data(previous, winners, repo_images,
+                                                          affected)
+        generation = store.fingerprint_digest(dict(
+            (path, loaded_file.fingerprint)
+            for path, loaded_file in loaded_files.iteritems())).encode('hex')
+
         # replace old data structure with new
         v1_response_data = {
             'repos': v1_repos,
             'images': images,
+            'generation': generation,
+            'search_index': _build_search_index(app, v1_repos, v2_repos),
         }
         v2_response_data = {
-            'repos': v2_repos
+            'repos': v2_repos,
+            'generation': generation,
+        }
+        _load_state = {
+            'files': loaded_files,
+            'paths': paths,
+            'winners': winners,
+            'repo_images': repo_images,
+            'v1': v1_response_data,
+            'v2': v2_response_data,
         }
-        logger.info('finished loading metadata')
+        _index_generation = None
+        logger.info('finished loading metadata, %d repositories changed' % len(affected))
     except Exception, e:
         logger.error('aborting metadata load: %s' % str(e))
+
+
+def file_fingerprint(path):
+    """
+    :param path:    full path to a metadata file
+    :type  path:    basestring
+
+    :return:    value that changes whenever the file at path is replaced or modified
+    :rtype:     tuple
+
+    :raises OSError: if the file cannot be stat'd
+    """
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+def _load_shared(app, store_dir):
+    """
+    Load the metadata through a shared store, so that all processes on a host
+    use one memory-mapped copy of it. The first process that notices a change
+    parses the changed files and publishes a new generation of the store; the
+    others just map the published generation.
+
+    :param app:         the flask application
+    :type  app:         flask.Flask
+    :param store_dir:   full path to the shared store directory
+    :type  store_dir:   basestring
+    """
+    global v2_response_data
+    global v1_response_data
+    global _shared_generation
+
+    try:
+        data_dir = app.config[config.KEY_DATA_DIR]
+        logger.info('loading metadata from %s through shared store %s' % (data_dir, store_dir))
+        with store.lock(store_dir):
+            paths = find_metadata_files(data_dir)
+            digest = source_digest(paths)
+
+            generation = store.open_current(store_dir, _CACHED_TABLES)
+            if generation is None or generation.source_digest != digest:
+                if generation is None:
+                    previous_files = _load_index(app)
+                else:
+                    previous_files = generation.table('files')
+                workers = int(app.config.get(config.KEY_LOAD_WORKERS, 1))
+                loaded_files = load_files(paths, previous_files, workers=workers)
+                store.publish(store_dir, digest, build_tables(paths, loaded_files))
+                logger.info('published new generation of shared store')
+                generation = store.open_current(store_dir, _CACHED_TABLES)
+
+        if _shared_generation is not None and _shared_generation.path == generation.path:
+            logger.info('metadata unchanged')
+            return
+        # replace old data structure with new
+        v1_response_data = {
+            'repos': generation.table('v1_repos'),
+            'images': generation.table('images'),
+            'generation': generation.source_digest.encode('hex'),
+            'search_index': _build_search_index(app, generation.table('v1_repos'),
+                                                generation.table('v2_repos')),
+        }
+        v2_response_data = {
+            'repos': generation.table('v2_repos'),
+            'generation': generation.source_digest.encode('hex'),
+        }
+        _shared_generation = generation
+        # records of the previous generation are no longer needed. Requests that
+        # still use it may add a few more, which are evicted as usual.
+        store.clear_record_caches()
+        logger.info('finished loading metadata from %s' % generation.path)
+    except Exception, e:
+        logger.error('aborting metadata load: %s' % str(e))
+
+
+def source_digest(paths):
+    """
+    :param paths:   full paths of all current metadata files
+    :type  paths:   list
+
+    :return:    digest of the fingerprints of the files, see
+                crane.store.fingerprint_digest
+    :rtype:     str
+    """
+    fingerprints = {}
+    for path in paths:
+        try:
+            fingerprints[path] = file_fingerprint(path)
+        except OSError, e:
+            logger.error('skipping current metadata load: %s' % str(e))
+    return store.fingerprint_digest(fingerprints)
+
+
+def build_tables(paths, loaded_files):
+    """
+    Build the tables that the shared store and the metadata index hold.
+
+    :param paths:           full paths of all current metadata files, in load order
+    :type  paths:           list
+    :param loaded_files:    LoadedFile instances keyed by path
+    :type  loaded_files:    dict
+
+    :return:    dictionaries keyed by table name: "files" is loaded_files,
+                "v1_repos", "images" and "v2_repos" are the response data
+    :rtype:     dict
+    """
+    winners = _select_winners(paths, loaded_files)
+    repo_images = _collect_repo_images(loaded_files)
+    empty = {'winners': {}, 'repo_images': {}, 'v1': None, 'v2': None}
+    v1_repos, v2_repos, images = _patch_response_data(empty, winners, repo_images,
+                                                      set(winners))
+    return {
+        'files': loaded_files,
+        'v1_repos': v1_repos,
+        'images': images,
+        'v2_repos': v2_repos,
+    }
+
+
+def _build_search_index(app, v1_repos, v2_repos):
+    """
+    Index the repositories for crane.search.local.LocalSearch, if that backend
+    is configured.
+
+    :param app:         the flask application
+    :type  app:         flask.Flask
+    :param v1_repos:    v1 repository tuples keyed by repo id
+    :type  v1_repos:    dict
+    :param v2_repos:    v2 repository tuples keyed by repo id
+    :type  v2_repos:    dict
+
+    :return:    index of the repositories, or None if the local search backend
+                is not configured
+    :rtype:     crane.search_index.SearchIndex
+    """
+    if app.config.get(config.SECTION_SEARCH, {}).get(config.KEY_SEARCH_LOCAL) is not True:
+        return None
+    descriptions = dict((repo_id, repo.description) for repo_id, repo in v1_repos.iteritems())
+    for repo_id, repo in v2_repos.iteritems():
+        if repo.description or repo_id not in descriptions:
+            descriptions[repo_id] = repo.description
+    return search_index.SearchIndex(descriptions)
+
+
+def find_metadata_files(data_dir):
+    """
+    Scan the data dir recursively and pick json files.
+
+    :param data_dir:    full path to the directory metadata files are loaded from
+    :type  data_dir:    basestring
+
+    :return:    full paths of all metadata files, in load order, which is sorted
+                so that it does not depend on the order of directory entries
+    :rtype:     list
+    """
+    return sorted(os.path.join(dirpath, f)
+                  for dirpath, dirnames, files in os.walk(data_dir, followlinks=True)
+                  for f in fnmatch.filter(files, '*.json'))
+
+
+def _open_index(app):
+    """
+    :param app: the flask application
+    :type  app: flask.Flask
+
+    :return:    the index configured as "index_path", or None if there is no
+                usable one
+    :rtype:     crane.store.Generation
+    """
+    index_path = app.config.get(config.KEY_INDEX_PATH)
+    if not index_path:
+        return None
+    # imported here because crane.index depends on this module
+    from . import index
+    try:
+        return index.load(index_path, _CACHED_TABLES)
+    except Exception, e:
+        # a broken index must never prevent loading the metadata files themselves
+        logger.error('not using metadata index: %s' % str(e))
+        return None
+
+
+def _load_index(app):
+    """
+    Read the parsed metadata files from the index configured as "index_path", if
+    any, so that files which have not changed since the index was built do not
+    need to be parsed.
+
+    :param app: the flask application
+    :type  app: flask.Flask
+
+    :return:    LoadedFile instances keyed by path; empty if there is no usable index
+    :rtype:     collections.Mapping
+    """
+    loaded_index = _index_generation or _open_index(app)
+    if loaded_index is None:
+        return {}
+    logger.info('using metadata index %s built from %s' %
+                (loaded_index.path, loaded_index.table('info')['data_dir']))
+    return loaded_index.table('files')
+
+
+def _map_index(app, paths):
+    """
+    Serve the response data straight from the index configured as "index_path"
+    for as long as it matches the metadata files. The index is only mapped on
+    the first load; once the metadata has changed, it is loaded from the files.
+
+    :param app:         the flask application
+    :type  app:         flask.Flask
+    :param paths:   full paths of all current metadata files
+    :type  paths:   list
+
+    :return:    True iff the response data is mapped from an index that matches
+                the current metadata files
+    :rtype:     bool
+    """
+    global v2_response_data
+    global v1_response_data
+    global _index_generation
+
+    if _index_generation is None and \
+            (not app.config.get(config.KEY_INDEX_PATH) or _load_state['v1'] is not None):
+        return False
+    digest = source_digest(paths)
+    if _index_generation is not None:
+        if _index_generation.source_digest == digest:
+            logger.info('metadata unchanged')
+            return True
+        logger.info('metadata index %s is stale' % _index_generation.path)
+        return False
+
+    generation = _open_index(app)
+    if generation is None:
+        return False
+    if generation.source_digest != digest:
+        logger.info('metadata index %s is stale' % generation.path)
+        return False
+    # replace old data structure with new
+    v1_response_data = {
+        'repos': generation.table('v1_repos'),
+        'images': generation.table('images'),
+        'generation': digest.encode('hex'),
+        'search_index': _build_search_index(app, generation.table('v1_repos'),
+                                            generation.table('v2_repos')),
+    }
+    v2_response_data = {
+        'repos': generation.table('v2_repos'),
+        'generation': digest.encode('hex'),
+    }
+    _index_generation = generation
+    store.clear_record_caches()
+    logger.info('finished loading metadata from index %s built from %s' %
+                (generation.path, generation.table('info')['data_dir']))
+    return True
+
+
+def load_files(paths, previous_files, changed_paths=None, workers=1):
+    """
+    Parse each metadata file whose fingerprint differs from the one recorded in
+    previous_files, and reuse the previous result for the others. Files that
+    cannot be read or parsed are logged and skipped.
+
+    :param paths:           full paths of all current metadata files
+    :type  paths:           list
+    :param previous_files:  LoadedFile instances from the previous load, keyed by path
+    :type  previous_files:  dict
+    :param changed_paths:   if not None, only these paths are checked for changes
+                            and all others are assumed unchanged
+    :type  changed_paths:   set or None
+    :param workers:         number of processes to parse files with. If 1, or if
+                            called from a thread other than the main thread,
+                            files are parsed in this process.
+    :type  workers:         int
+
+    :return:    LoadedFile instances keyed by path
+    :rtype:     dict
+    """
+    loaded_files = {}
+    to_parse = []
+    for metadata_file_path in paths:
+        if changed_paths is not None and metadata_file_path not in changed_paths and \
+                metadata_file_path in previous_files:
+            loaded_files[metadata_file_path] = previous_files[metadata_file_path]
+            continue
+        try:
+            fingerprint = file_fingerprint(metadata_file_path)
+        except Exception, e:
+            logger.error('skipping current metadata load: %s' % str(e))
+            continue
+        previous = previous_files.get(metadata_file_path)
+        if previous is not None and previous.fingerprint == fingerprint:
+            loaded_files[metadata_file_path] = previous
+        else:
+            to_parse.append((metadata_file_path, fingerprint))
+
+    # forking from the monitor thread would copy the other threads' locks in
+    # whatever state they are in, so only the main thread uses a pool
+    if workers > 1 and len(to_parse) > 1 and \
+            isinstance(threading.current_thread(), threading._MainThread):
+        logger.info('parsing %d metadata files with %d workers' % (len(to_parse), workers))
+        pool = multiprocessing.Pool(workers)
+        try:
+            # map returns results in the order of to_parse, which keeps
+            # the outcome identical to parsing serially
+            results = pool.map(_parse_file, to_parse,
+                               chunksize=len(to_parse) // (workers * 4) + 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = itertools.imap(_parse_file, to_parse)
+
+    for loaded_file, error in results:
+        if error is not None:
+            logger.error('skipping current metadata load: %s' % error)
+        else:
+            loaded_files[loaded_file.path] = loaded_file.result
+    logger.info('parsed %d of %d metadata files' % (len(to_parse), len(paths)))
+    return loaded_files
+
+
+def _parse_file(path_and_fingerprint):
+    """
+    Parse one metadata file. This may run in a worker process, so errors are
+    returned rather than raised or logged.
+
+    :param path_and_fingerprint:    tuple of the full path to a metadata file and
+                                    the fingerprint it had before parsing
+    :type  path_and_fingerprint:    tuple
+
+    :return:    tuple of ParsedFile (or None) and error message (or None)
+    :rtype:     tuple
+    """
+    path, fingerprint = path_and_fingerprint
+    try:
+        logger.debug('loading: %s' % path)
+        repo_id, repo_tuple, image_ids = load_from_file(path)
+    except Exception, e:
+        return None, str(e)
+    return ParsedFile(path, LoadedFile(fingerprint, repo_id, repo_tuple, image_ids)), None
+
+
+def _repo_key(loaded_file):
+    """
+    v1 and v2 repositories live in separate namespaces, so a repo-registry-id
+    alone does not identify which repository a file provides.
+
+    :param loaded_file: result of loading one metadata file
+    :type  loaded_file: LoadedFile
+
+    :return:    tuple of (is_v1 (bool), repo_id (basestring))
+    :rtype:     tuple
+    """
+    return isinstance(loaded_file.repo_tuple, V1Repo), loaded_file.repo_id
+
+
+def _select_winners(paths, loaded_files):
+    """
+    Determine which file provides each repository. When multiple files share a
+    repo-registry-id, the one that comes last in paths wins.
+
+    :param paths:           full paths of all current metadata files, in load order
+    :type  paths:           list
+    :param loaded_files:    LoadedFile instances keyed by path
+    :type  loaded_files:    dict
+
+    :return:    LoadedFile instances keyed by repo key (see _repo_key)
+    :rtype:     dict
+    """
+    winners = {}
+    for path in paths:
+        loaded_file = loaded_files.get(path)
+        if loaded_file is not None:
+            winners[_repo_key(loaded_file)] = loaded_file
+    return winners
+
+
+def _collect_repo_images(loaded_files):
+    """
+    Collect the images of each v1 repository. When multiple files share a
+    repo-registry-id, the images of all of them are served from the repository
+    of the winning file.
+
+    :param loaded_files:    LoadedFile instances keyed by path
+    :type  loaded_files:    dict
+
+    :return:    frozensets of image ids keyed by repo key (see _repo_key)
+    :rtype:     dict
+    """
+    repo_images = {}
+    for loaded_file in loaded_files.itervalues():
+        if loaded_file.image_ids:
+            key = _repo_key(loaded_file)
+            repo_images.setdefault(key, set()).update(loaded_file.image_ids)
+    return dict((key, frozenset(image_ids)) for key, image_ids in repo_images.iteritems())
+
+
+def _patch_response_data(previous, winners, repo_images, affected):
+    """
+    Build new repos and images dictionaries by copying the previously published
+    ones and replacing only the repositories that were affected by a change.
+
+    :param previous:    load state of the previous load
+    :type  previous:    dict
+    :param winners:     LoadedFile instances keyed by repo key
+    :type  winners:     dict
+    :param repo_images: image ids of each v1 repository keyed by repo key, see
+                        _collect_repo_images
+    :type  repo_images: dict
+    :param affected:    repo keys whose files were added, changed or removed
+    :type  affected:    set
+
+    :return:    tuple of v1 repos (dict), v2 repos (dict), images (dict)
+    :rtype:     tuple
+    """
+    if previous['v1'] is None:
+        v1_repos, v2_repos, images = {}, {}, {}
+    else:
+        v1_repos = dict(previous['v1']['repos'])
+        images = dict(previous['v1']['images'])
+        v2_repos = dict(previous['v2']['repos'])
+
+    # images whose repositories were added, changed or removed
+    touched = set()
+    for key in affected:
+        old = previous['winners'].get(key)
+        new = winners.get(key)
+        is_v1, repo_id = key
+        if old is not new:
+            repos = v1_repos if is_v1 else v2_repos
+            if new is None:
+                repos.pop(repo_id, None)
+            else:
+                repos[repo_id] = new.repo_tuple
+
+        if is_v1:
+            old_images = previous['repo_images'].get(key, frozenset())
+            new_images = repo_images.get(key, frozenset())
+            for image_id in old_images - new_images:
+                remaining = images[image_id] - frozenset([repo_id])
+                if remaining:
+                    images[image_id] = remaining
+                else:
+                    del images[image_id]
+            for image_id in new_images - old_images:
+                images[image_id] = images.get(image_id, frozenset()) | frozenset([repo_id])
+            if old is new:
+                touched.update(old_images ^ new_images)
+            else:
+                touched.update(old_images | new_images)
+
+    # the set operations above return plain frozensets, and a changed repo may
+    # have become protected or moved, so rebuild the entries that were touched
+    for image_id in touched:
+        if image_id in images:
+            images[image_id] = ImageRepos(images[image_id], v1_repos)
+
+    return v1_repos, v2_repos, images
@@ -0,0 +1,113 @@
+"""
+Compiled matcher for the content paths an entitlement certificate grants
+access to.
+
+python-rhsm's check_path() walks the certificate's path tree recursively on
+every call, trying every child list of every matching segment and scanning each
+node for "$variable" segments. compile_certificate() flattens that tree once
+into a trie where each node has at most one child per segment plus a single
+merged wildcard child, so that a path can be matched in one pass over its
+segments.
+"""
+import posixpath
+
+from rhsm.pathtree import LISTING, PATH_END
+
+
+class _Node(object):
+    __slots__ = ('children', 'wildcard', 'end')
+
+    def __init__(self):
+        # child nodes keyed by literal path segment
+        self.children = {}
+        # child node for "$variable" segments, which match any segment
+        self.wildcard = None
+        # True iff an entitled path ends at this node
+        self.end = False
+
+
+class PathMatcher(object):
+    """
+    Decides if a path is granted by an entitlement certificate, with the same
+    result as rhsm.certificate2.EntitlementCertificate.check_path().
+    """
+    def __init__(self, tree):
+        """
+        :param tree:    path tree of a v3 entitlement certificate, as found in
+                        rhsm.pathtree.PathTree.path_tree
+        :type  tree:    dict
+        """
+        self._root = _Node()
+        # the rhsm tree shares nodes between paths, so it is a graph; each
+        # (tree node, trie node) pair only needs to be merged once
+        merged = set()
+        pending = [(tree, self._root)]
+        while pending:
+            tree_node, node = pending.pop()
+            if (id(tree_node), id(node)) in merged:
+                continue
+            merged.add((id(tree_node), id(node)))
+            for word, tree_children in tree_node.iteritems():
+                if word == PATH_END:
+                    node.end = True
+                    continue
+                if word.startswith('$'):
+                    if node.wildcard is None:
+                        node.wildcard = _Node()
+                    child = node.wildcard
+                else:
+                    child = node.children.get(word)
+                    if child is None:
+                        child = node.children[word] = _Node()
+                pending.extend((tree_child, child) for tree_child in tree_children)
+
+    def match(self, path):
+        """
+        :param path:    path to which access is being requested
+        :type  path:    basestring
+
+        :return:    True iff the path is granted
+        :rtype:     bool
+
+        :raises ValueError: if the path is not absolute
+        """
+        path = posixpath.normpath(path)
+        if not path.startswith('/'):
+            raise ValueError('path must start with "/"')
+        words = path.strip('/').split('/')
+        last = len(words) - 1
+        nodes = [self._root]
+        for index, word in enumerate(words):
+            next_nodes = []
+            for node in nodes:
+                if node.end:
+                    return True
+                # any directory that leads to an entitled path may be listed
+                if index == last and word == LISTING:
+                    return True
+                child = node.children.get(word)
+                if child is not None:
+                    next_nodes.append(child)
+                if node.wildcard is not None:
+                    next_nodes.append(node.wildcard)
+            if not next_nodes:
+                return False
+            nodes = next_nodes
+        return any(node.end for node in nodes)
+
+
+def compile_certificate(cert):
+    """
+    :param cert:    a parsed entitlement certificate
+    :type  cert:    rhsm.certificate2.EntitlementCertificate
+
+    :return:    matcher for the certificate's content paths, or None if the
+                certificate does not have a path tree, such as certificates
+                older than v3
+    :rtype:     PathMatcher
+    """
+    try:
+        tree = cert._path_tree.path_tree
+    except AttributeError:
+        return None
+    return PathMatcher(tree)
@@ -0,0 +1,149 @@
+"""
+A lightweight serving mode for the requests that make up most of crane's
+traffic: the redirects of "/v2/<name>/manifests/...", "/v2/<name>/blobs/..."
+and "/v1/images/<image_id>/<file>" to the CDN.
+
+Answering such a request takes a dictionary lookup, an authorization check and
+possibly signing a URL, but under Flask most of its time is spent dispatching
+the request, running the blueprint's after_request functions, and building and
+finalizing a response object. FastPath is a WSGI application that wraps the
+Flask app. It uses the request context Flask creates, which matches the URL
+against the app's own routes and gives crane.app_util its request, but answers
+redirects by writing their status and headers directly. They have an empty body
+instead of Flask's short HTML page.
+
+Errors, such as a 404 for an unknown or unauthorized repository, are handled by
+the Flask app's error handlers, so they are the same as without FastPath. All
+other requests, including the admin and search APIs, and all requests when
+content is served locally, are passed to the Flask app.
+
+Use crane.fastpath_wsgi instead of crane.wsgi to enable it.
+"""
+import httplib
+import time
+
+from flask import request
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.urls import iri_to_uri
+
+from crane import app
+from crane import config
+from crane import exceptions
+from crane.api import images
+from crane.views import v1, v2
+
+
+# only paths with these prefixes may be redirects, so other requests are passed
+# to the Flask app without matching them
+PREFIXES = ('/v2/', '/v1/images/')
+
+METHODS = frozenset(['GET', 'HEAD'])
+
+
+def create_app():
+    """
+    Creates the flask app like crane.app.create_app, and wraps it in FastPath.
+
+    :return:    WSGI application
+    :rtype:     FastPath
+    """
+    return FastPath(app.create_app())
+
+
+class FastPath(object):
+    def __init__(self, flask_app):
+        """
+        :param flask_app:   crane's flask app, which handles all requests that
+                            are not redirects
+        :type  flask_app:   flask.Flask
+        """
+        self.app = flask_app
+        # redirect functions keyed by the endpoint of the view they replace
+        self.endpoints = {
+            'v2.name_serve_or_redirect': _v2_redirect,
+            'v1.images_serve_or_redirect': _v1_redirect,
+        }
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith(PREFIXES) or \
+                environ['REQUEST_METHOD'] not in METHODS or \
+                self.app.config.get(config.KEY_SC_ENABLE):
+            return self.app(environ, start_response)
+
+        with self.app.request_context(environ):
+            rule = request.url_rule
+            redirect = self.endpoints.get(rule.endpoint) if rule is not None else None
+            if redirect is None:
+                # not a redirect after all, or the path does not match any route
+                response = None
+            else:
+                try:
+                    status, headers = redirect(**request.view_args)
+                except exceptions.HTTPError, e:
+                    response = self.app.finalize_request(self.app.handle_user_exception(e))
+                except Exception, e:
+                    response = self.app.handle_exception(e)
+                else:
+                    headers.append(('Content-Length', '0'))
+                    start_response('%d %s' % (status, HTTP_STATUS_CODES[status]), headers)
+                    return []
+
+        if response is None:
+            return self.app(environ, start_response)
+        return response(environ, start_response)
+
+
+def _v2_redirect(relative_path):
+    """
+    Replaces crane.views.v2.name_serve_or_redirect.
+
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+
+    :return:    tuple of the status and headers of the redirect
+    :rtype:     tuple
+
+    :raises exceptions.HTTPError:   if the path does not refer to a repository
+                                    the client may access
+    """
+    repo, path_component, used_mediatype, url = v2.locate(relative_path,
+                                                          v2.get_accept_headers(request))
+    # perform CDN rewrites and auth
+    now = time.time()
+    url = v2.cdn_rewrite_redirect_url(url)
+    url = v2.cdn_auth_token_url(url, now)
+    status, headers = v2.redirect_headers(repo, relative_path, now)
+    return status, [('Location', _location(url))] + headers
+
+
+def _v1_redirect(image_id, filename):
+    """
+    Replaces crane.views.v1.images_serve_or_redirect.
+
+    :param image_id:    the full unique ID of a docker image
+    :type  image_id:    basestring
+    :param filename:    one of "ancestry", "json", or "layer".
+    :type  filename:    basestring
+
+    :return:    tuple of the status and headers of the redirect
+    :rtype:     tuple
+
+    :raises exceptions.HTTPError:   if the image or file is not known, or the
+                                    client may not access it
+    """
+    url = images.get_image_file_url(image_id, filename)
+    return httplib.FOUND, [('Location', _location(url))] + list(v1.REGISTRY_HEADERS)
+
+
+def _location(url):
+    """
+    :param url:     absolute URL to redirect to
+    :type  url:     basestring
+
+    :return:    the URL as a native string, converted like werkzeug converts
+                the Location header of a Flask response
+    :rtype:     str
+    """
+    if isinstance(url, unicode):
+        return iri_to_uri(url, safe_conversion=True)
+    return url
@@ -0,0 +1,3 @@
+from .fastpath import create_app
+
+application = create_app()
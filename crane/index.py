@@ -0,0 +1,192 @@
+"""
+Compiled index of the metadata in a data dir.
+
+The index is a memory-mapped file in the format of a crane.store generation. It
+holds the response data tables built from every metadata file ("v1_repos",
+"images" and "v2_repos"), the result of parsing each file along with the
+fingerprint it had when it was parsed ("files"), and a digest of those
+fingerprints in its header.
+
+A web server process that is configured with "index_path" maps the index on
+startup. If the digest matches the current metadata files, the process serves
+requests straight from the mapped tables, so it is ready as soon as it has
+stat'd the files, and all processes on a host share the index's pages through
+the page cache. The data dir monitor compares the digest again on every check.
+Once the metadata has changed, or if the index was stale to begin with, the
+process parses only the files that changed since the index was built, and
+takes the others from the index.
+
+Build it with::
+
+    crane-index build
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from flask import Flask
+
+from . import config
+from . import data
+from . import store
+
+
+_logger = logging.getLogger(__name__)
+
+
+class InvalidIndexError(ValueError):
+    """
+    Raised when an index file is truncated, corrupt, in an unsupported format,
+    or may have been written by another user.
+    """
+    pass
+
+
+def write(index_path, data_dir, source_digest, tables):
+    """
+    Write an index file. The file is written next to index_path and then renamed
+    into place, so readers never see a partially written index.
+
+    :param index_path:      full path the index should be written to
+    :type  index_path:      basestring
+    :param data_dir:        full path to the data dir the files were found in
+    :type  data_dir:        basestring
+    :param source_digest:   digest of the fingerprints of the metadata files,
+                            see crane.data.source_digest
+    :type  source_digest:   str
+    :param tables:          tables as returned by crane.data.build_tables
+    :type  tables:          dict
+    """
+    tables = dict(tables, info={'data_dir': data_dir})
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)),
+                                    prefix='.crane-index-')
+    try:
+        with os.fdopen(fd, 'wb') as index_file:
+            store.write_tables(index_file, source_digest, tables)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, index_path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def load(index_path, cached_tables=()):
+    """
+    Map an index file. Its header is checked before anything is read from it.
+
+    :param index_path:      full path to an index file
+    :type  index_path:      basestring
+    :param cached_tables:   names of the tables whose records are cached, see
+                            crane.store.Generation
+    :type  cached_tables:   collection
+
+    :return:    the index, with the tables "files", "v1_repos", "images",
+                "v2_repos" and "info", which holds the "data_dir" the index was
+                built from
+    :rtype:     crane.store.Generation
+
+    :raises IOError:            if the file cannot be read
+    :raises InvalidIndexError:  if the file is not a valid index
+    """
+    try:
+        loaded_index = store.Generation(index_path, cached_tables)
+    except store.InvalidStoreError, e:
+        raise InvalidIndexError(str(e))
+    if 'files' not in loaded_index.tables or 'info' not in loaded_index.tables:
+        raise InvalidIndexError('%s is not a crane index' % index_path)
+    return loaded_index
+
+
+def build(data_dir, index_path, workers=1):
+    """
+    Parse all metadata files in the data dir and write them to an index. Files
+    that have not changed since the existing index at index_path was built are
+    not parsed again.
+
+    :param data_dir:    full path to the directory metadata files are loaded from
+    :type  data_dir:    basestring
+    :param index_path:  full path the index should be written to
+    :type  index_path:  basestring
+    :param workers:     number of processes to parse files with
+    :type  workers:     int
+
+    :return:    number of metadata files in the index
+    :rtype:     int
+    """
+    try:
+        previous_files = load(index_path).table('files')
+    except (IOError, InvalidIndexError):
+        previous_files = {}
+    paths = data.find_metadata_files(data_dir)
+    source_digest = data.source_digest(paths)
+    files = data.load_files(paths, previous_files, workers=workers)
+    write(index_path, data_dir, source_digest, data.build_tables(paths, files))
+    return len(files)
+
+
+def is_stale(index_path, data_dir):
+    """
+    Determine if metadata files were added, changed or removed since the index
+    was built.
+
+    :param index_path:  full path to an index file
+    :type  index_path:  basestring
+    :param data_dir:    full path to the directory metadata files are loaded from
+    :type  data_dir:    basestring
+
+    :return:    True iff the index does not reflect the current metadata files
+    :rtype:     bool
+
+    :raises IOError:            if the index cannot be read
+    :raises InvalidIndexError:  if the file is not a valid index
+    """
+    source_digest = data.source_digest(data.find_metadata_files(data_dir))
+    return load(index_path).source_digest != source_digest
+
+
+def main(argv=None):
+    """
+    Entry point of the "crane-index" command.
+
+    :param argv:    command line arguments, not including the program name
+    :type  argv:    list
+
+    :return:    exit code
+    :rtype:     int
+    """
+    parser = argparse.ArgumentParser(prog='crane-index',
+                                     description='compile crane metadata into an index')
+    parser.add_argument('command', choices=['build', 'check'],
+                        help='"build" writes the index, "check" exits with 1 if it is stale')
+    parser.add_argument('-o', '--output',
+                        help='path of the index file. defaults to the "index_path" config option')
+    parser.add_argument('-d', '--data-dir',
+                        help='directory to load metadata files from. defaults to the '
+                             '"data_dir" config option')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    app = Flask(__name__)
+    config.load(app)
+    data_dir = args.data_dir or app.config[config.KEY_DATA_DIR]
+    index_path = args.output or app.config.get(config.KEY_INDEX_PATH)
+    if not index_path:
+        parser.error('no index path given and "index_path" is not configured')
+
+    if args.command == 'build':
+        count = build(data_dir, index_path, app.config.get(config.KEY_LOAD_WORKERS, 1))
+        _logger.info('wrote %d metadata files from %s to %s' % (count, data_dir, index_path))
+        return 0
+
+    try:
+        stale = is_stale(index_path, data_dir)
+    except (IOError, InvalidIndexError), e:
+        _logger.error(str(e))
+        return 2
+    if stale:
+        _logger.info('%s is stale' % index_path)
+        return 1
+    _logger.info('%s is up to date' % index_path)
+    return 0
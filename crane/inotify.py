@@ -0,0 +1,261 @@
+"""
+Minimal ctypes binding to the Linux inotify API, used to learn about changes to
+metadata files as soon as they happen instead of polling the data directory.
+"""
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import logging
+import os
+import select
+import struct
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+# flags and event masks from <sys/inotify.h>
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+WATCH_MASK |= IN_DELETE_SELF | IN_MOVE_SELF
+
+# wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # make sure the required symbols exist
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def available():
+    """
+    :return:    True iff inotify can be used on this platform
+    :rtype:     bool
+    """
+    return _libc is not None
+
+
+class InotifyWatcher(object):
+    """
+    Watches a directory tree for changes to metadata files. Watches are added to
+    every directory in the tree, including directories that get created later.
+
+    If the root itself is removed, the watcher polls until it exists again, and
+    then watches the new tree.
+    """
+    def __init__(self, root, pattern='*.json', poll_interval=60):
+        """
+        :param root:            full path to the directory tree that should be watched
+        :type  root:            basestring
+        :param pattern:         fnmatch pattern of the file names that are of interest
+        :type  pattern:         basestring
+        :param poll_interval:   seconds between checks whether the root exists
+                                again after it was removed
+        :type  poll_interval:   int or float
+
+        :raises OSError: if inotify is not available or the root cannot be watched
+        """
+        if not available():
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.root = root
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self._fd = _libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}
+        # True while the root does not exist, and so cannot be watched
+        self._root_removed = False
+        self._add_tree(root)
+
+    def close(self):
+        """
+        Release the inotify file descriptor and all its watches.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def wait_for_changes(self, debounce, timeout=None):
+        """
+        Block until at least one metadata file changed, then keep collecting
+        changes until none have arrived for "debounce" seconds, so that a burst
+        of writes from one publish results in a single reload.
+
+        :param debounce:    seconds of quiet required before returning
+        :type  debounce:    float
+        :param timeout:     seconds to wait for the first change, or None to
+                            wait forever
+        :type  timeout:     float or None
+
+        :return:    set of full paths of metadata files that were added,
+                    changed or removed; None if the extent of the changes is
+                    unknown and the whole tree must be rescanned. An empty set
+                    is returned if the timeout expired.
+        :rtype:     set or None
+        """
+        if self._root_removed:
+            return self._wait_for_root(timeout)
+        changed = set()
+        full_rescan = False
+        wait = timeout
+        while True:
+            readable, _, _ = select.select([self._fd], [], [], wait)
+            if not readable:
+                break
+            for path, mask in self._read_events():
+                if path is None:
+                    full_rescan = True
+                else:
+                    changed.add(path)
+            wait = debounce
+        if full_rescan:
+            return None
+        return changed
+
+    def _wait_for_root(self, timeout=None):
+        """
+        Poll every "poll_interval" seconds until the root exists again, and then
+        watch it.
+
+        :param timeout: seconds to wait for the root, or None to wait forever
+        :type  timeout: float or None
+
+        :return:    None if the root exists again, so the whole tree must be
+                    rescanned; an empty set if the timeout expired
+        :rtype:     set or None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not os.path.isdir(self.root):
+            if deadline is None:
+                time.sleep(self.poll_interval)
+            elif time.time() >= deadline:
+                return set()
+            else:
+                time.sleep(min(self.poll_interval, max(deadline - time.time(), 0)))
+        _logger.info('%s exists again, watching it for changes' % self.root)
+        self._root_removed = False
+        self._add_tree(self.root)
+        return None
+
+    def _read_events(self):
+        """
+        Read all pending events and translate them into changed paths.
+
+        :return:    generator of (path, mask) tuples. path is None for events that
+                    require a full rescan.
+        :rtype:     generator
+        """
+        try:
+            buf = os.read(self._fd, _READ_SIZE)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip('\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                _logger.warning('inotify event queue overflowed')
+                yield None, mask
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # the files that were in this directory are gone as well
+                yield None, mask
+                # a moved directory keeps its watches, which must not report
+                # changes outside the tree as changes to the old paths
+                self._remove_tree(directory)
+                if directory != self.root:
+                    continue
+                if os.path.isdir(self.root):
+                    self._add_tree(self.root)
+                else:
+                    _logger.warning('%s was removed, polling until it exists again' %
+                                    self.root)
+                    self._root_removed = True
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may already exist in a directory that was moved in
+                    for file_path in self._add_tree(path):
+                        yield file_path, mask
+                elif mask & IN_MOVED_FROM:
+                    self._remove_tree(path)
+                    yield None, mask
+            elif fnmatch.fnmatch(name, self.pattern):
+                yield path, mask
+
+    def _add_tree(self, root):
+        """
+        Add a watch to root and every directory below it.
+
+        :param root:    full path to a directory
+        :type  root:    basestring
+
+        :return:    full paths of the metadata files found in the tree
+        :rtype:     list
+        """
+        found = []
+        for dirpath, dirnames, files in os.walk(root, followlinks=True):
+            wd = _libc.inotify_add_watch(self._fd, dirpath, WATCH_MASK)
+            if wd < 0:
+                _logger.error('could not watch %s: %s' %
+                              (dirpath, os.strerror(ctypes.get_errno())))
+                continue
+            self._watches[wd] = dirpath
+            found.extend(os.path.join(dirpath, f) for f in fnmatch.filter(files, self.pattern))
+        return found
+
+    def _remove_tree(self, root):
+        """
+        Remove the watches of root and every directory below it.
+
+        :param root:    full path to a directory
+        :type  root:    basestring
+        """
+        prefix = os.path.join(root, '')
+        for wd, dirpath in self._watches.items():
+            if dirpath == root or dirpath.startswith(prefix):
+                del self._watches[wd]
+                # fails harmlessly if the kernel already removed the watch
+                # because the directory was deleted
+                _libc.inotify_rm_watch(self._fd, wd)
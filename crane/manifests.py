@@ -0,0 +1,139 @@
+"""
+Routing of v2 manifest requests to the published manifest that best matches
+what the client accepts.
+
+The outcome only depends on the repository's metadata, the requested tag or
+digest, and whether the client accepts manifest lists and schema 2 manifests.
+build_routes() therefore resolves every known tag and digest for each of those
+four combinations when the metadata is loaded, and requests are answered with
+a single lookup.
+"""
+import os
+
+
+SCHEMA1_MEDIATYPE = 'application/json'
+SCHEMA2_MEDIATYPE = 'application/vnd.docker.distribution.manifest.v2+json'
+MANIFEST_LIST_MEDIATYPE = 'application/vnd.docker.distribution.manifest.list.v2+json'
+
+MANIFEST = 'manifests'
+
+# media type classes; the index into each entry of a route table
+MEDIA_CLASSES = (
+    frozenset(),
+    frozenset([SCHEMA2_MEDIATYPE]),
+    frozenset([MANIFEST_LIST_MEDIATYPE]),
+    frozenset([SCHEMA2_MEDIATYPE, MANIFEST_LIST_MEDIATYPE]),
+)
+
+
+def media_class(accept_headers):
+    """
+    :param accept_headers:  media types the client accepts
+    :type  accept_headers:  set
+
+    :return:    index into MEDIA_CLASSES of the class the client falls into
+    :rtype:     int
+    """
+    return ((MANIFEST_LIST_MEDIATYPE in accept_headers) << 1) | \
+        (SCHEMA2_MEDIATYPE in accept_headers)
+
+
+def resolve(schema2_tags, manifest_list_tags, manifest_list_amd64, identifier, accept_headers):
+    """
+    Determine which of the published manifests for a tag or digest should be
+    served, based on the media types the client accepts.
+
+    :param schema2_tags:        tags and digests that have schema 2 manifests
+    :type  schema2_tags:        frozenset
+    :param manifest_list_tags:  tags and digests that have manifest lists
+    :type  manifest_list_tags:  frozenset
+    :param manifest_list_amd64: (digest, schema version) of the amd64 image
+                                manifest of each manifest list tag
+    :type  manifest_list_amd64: dict
+    :param identifier:          tag or digest requested by the client
+    :type  identifier:          basestring
+    :param accept_headers:      media types the client accepts
+    :type  accept_headers:      set
+
+    :return:    tuple of the path relative to the repo's URL, and the media type
+                of the manifest at that path
+    :rtype:     tuple
+    """
+    # this is needed for V3Repo which do not have schema2 manifests
+    if not schema2_tags and not manifest_list_tags:
+        return os.path.join(MANIFEST, '1', identifier), SCHEMA1_MEDIATYPE
+
+    # if it is a newer docker client it sets accept headers to manifest schema 1, 2 and list
+    # if it is an older docker client, he doesnot set any of accept headers
+    # check first manifest list type
+    if MANIFEST_LIST_MEDIATYPE in accept_headers and identifier in manifest_list_tags:
+        return os.path.join(MANIFEST, 'list', identifier), MANIFEST_LIST_MEDIATYPE
+    # this is needed for older clients which do not understand manifest list
+    elif identifier in manifest_list_amd64:
+        digest, schema_version = manifest_list_amd64[identifier]
+        if SCHEMA2_MEDIATYPE in accept_headers:
+            used_mediatype = SCHEMA2_MEDIATYPE if schema_version == 2 else SCHEMA1_MEDIATYPE
+            return os.path.join(MANIFEST, str(schema_version), digest), used_mediatype
+        elif schema_version == 1:
+            return os.path.join(MANIFEST, '1', digest), SCHEMA1_MEDIATYPE
+        # this is needed in case when there is no amd64 image manifest, but there are within
+        # one repo manifest list and image manifest with the same tag
+        else:
+            return os.path.join(MANIFEST, '1', identifier), SCHEMA1_MEDIATYPE
+    elif SCHEMA2_MEDIATYPE in accept_headers and identifier in schema2_tags:
+        return os.path.join(MANIFEST, '2', identifier), SCHEMA2_MEDIATYPE
+    return os.path.join(MANIFEST, '1', identifier), SCHEMA1_MEDIATYPE
+
+
+def build_routes(url, schema2_tags, manifest_list_tags, manifest_list_amd64):
+    """
+    Resolve every tag and digest of a repository for each media type class.
+
+    :param url:                 URL of the repository
+    :type  url:                 basestring
+    :param schema2_tags:        see resolve()
+    :type  schema2_tags:        frozenset
+    :param manifest_list_tags:  see resolve()
+    :type  manifest_list_tags:  frozenset
+    :param manifest_list_amd64: see resolve()
+    :type  manifest_list_amd64: dict
+
+    :return:    dictionary keyed by tag or digest, where each value is a tuple
+                indexed by media type class of (path relative to the repo's
+                URL, media type, full URL) tuples
+    :rtype:     dict
+    """
+    base_url = url if url.endswith('/') else url + '/'
+    routes = {}
+    for identifier in schema2_tags | manifest_list_tags | frozenset(manifest_list_amd64):
+        targets = []
+        for accept_headers in MEDIA_CLASSES:
+            path, mediatype = resolve(schema2_tags, manifest_list_tags, manifest_list_amd64,
+                                      identifier, accept_headers)
+            targets.append((path, mediatype, base_url + path))
+        routes[identifier] = tuple(targets)
+    return routes
+
+
+def route(repo, identifier, accept_headers):
+    """
+    Look up the manifest that should be served for a request.
+
+    :param repo:            repository the manifest is requested from
+    :type  repo:            crane.data.V3Repo or crane.data.V4Repo
+    :param identifier:      tag or digest requested by the client
+    :type  identifier:      basestring
+    :param accept_headers:  media types the client accepts
+    :type  accept_headers:  set
+
+    :return:    tuple of the path relative to the repo's URL, the media type of
+                the manifest at that path, and the full URL of the manifest
+    :rtype:     tuple
+    """
+    targets = repo.manifest_routes.get(identifier)
+    if targets is not None:
+        return targets[media_class(accept_headers)]
+    # unknown tags and digests are always looked for as schema 1 manifests
+    path = os.path.join(MANIFEST, '1', identifier)
+    base_url = repo.url if repo.url.endswith('/') else repo.url + '/'
+    return path, SCHEMA1_MEDIATYPE, base_url + path
@@ -2,7 +2,12 @@ import logging
 
 from .. import config
 from .base import SearchBackend
+from .breaker import AdaptiveTimeout, CircuitBreaker
+from .composite import Composite
 from .gsa import GSA
+from .local import LocalSearch
+from .pool import ConnectionPool
+from .results import ResultCache
 from .solr import Solr
 
 
@@ -23,17 +28,177 @@ def load_config(app):
     """
     global backend
 
+    section = app.config.get(config.SECTION_SEARCH, {})
+    names = section.get(config.KEY_BACKENDS)
+    if names:
+        backends = []
+        for name in names:
+            configured = _BACKENDS[name](app)
+            if configured is None:
+                _logger.error('search backend %s is not configured' % name)
+            else:
+                backends.append(configured)
+        if backends:
+            backend = Composite(backends, section.get(config.KEY_DEADLINE, 2))
+            backend.max_results = _max_results(app)
+            _logger.info('using search backends %s' % ', '.join(names))
+            return
+
+    for name in ('gsa', 'solr', 'local'):
+        configured = _BACKENDS[name](app)
+        if configured is not None:
+            backend = configured
+            _logger.info('using %s search backend' % name)
+            return
+
+    # reset to default if the config previously had one configured, but changed.
+    _logger.info('no search backend configured')
+    backend = SearchBackend()
+
+
+def _gsa(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    the GSA backend if one is configured, else None
+    :rtype:     crane.search.gsa.GSA
+    """
     gsa_url = app.config.get(config.SECTION_GSA, {}).get(config.KEY_URL)
     if gsa_url:
-        backend = GSA(gsa_url)
-        _logger.info('using GSA search backend')
-        return
+        gsa = GSA(gsa_url)
+        gsa.result_cache = _result_cache(app)
+        gsa.connection_pool = _connection_pool(app)
+        gsa.circuit_breaker = _circuit_breaker(app)
+        gsa.adaptive_timeout = _adaptive_timeout(app)
+        gsa.max_results = _max_results(app)
+        return gsa
+
+
+def _solr(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    the solr backend if one is configured, else None
+    :rtype:     crane.search.solr.Solr
+    """
     solr_url = app.config.get(config.SECTION_SOLR, {}).get(config.KEY_URL)
     if solr_url:
-        backend = Solr(solr_url)
-        _logger.info('using solr search backend')
-        return
+        solr = Solr(solr_url)
+        solr.result_cache = _result_cache(app)
+        solr.connection_pool = _connection_pool(app)
+        solr.circuit_breaker = _circuit_breaker(app)
+        solr.adaptive_timeout = _adaptive_timeout(app)
+        solr.max_results = _max_results(app)
+        return solr
 
-    # reset to default if the config previously had one configured, but changed.
-    _logger.info('no search backend configured')
-    backend = SearchBackend()
+
+def _local(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    the local backend if it is enabled, else None
+    :rtype:     crane.search.local.LocalSearch
+    """
+    if app.config.get(config.SECTION_SEARCH, {}).get(config.KEY_SEARCH_LOCAL) is True:
+        local = LocalSearch()
+        local.max_results = _max_results(app)
+        return local
+
+
+# functions that create each backend from the config, keyed by the name used
+# in the "backends" setting
+_BACKENDS = {
+    'gsa': _gsa,
+    'solr': _solr,
+    'local': _local,
+}
+
+
+def _result_cache(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    a result cache as configured in the "search" section, or None
+                if caching is disabled
+    :rtype:     crane.search.results.ResultCache
+    """
+    section = app.config.get(config.SECTION_SEARCH, {})
+    ttl = section.get(config.KEY_CACHE_TTL, 0)
+    stale_ttl = section.get(config.KEY_CACHE_STALE_TTL, 0)
+    error_ttl = section.get(config.KEY_CACHE_ERROR_TTL, 0)
+    maxsize = section.get(config.KEY_CACHE_SIZE, 1000)
+    if maxsize <= 0 or (ttl <= 0 and stale_ttl <= 0 and error_ttl <= 0):
+        return None
+    return ResultCache(ttl, stale_ttl, error_ttl, maxsize)
+
+
+def _connection_pool(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    a connection pool as configured in the "search" section
+    :rtype:     crane.search.pool.ConnectionPool
+    """
+    section = app.config.get(config.SECTION_SEARCH, {})
+    return ConnectionPool(section.get(config.KEY_POOL_SIZE, 10),
+                          section.get(config.KEY_POOL_IDLE_TIMEOUT, 30),
+                          section.get(config.KEY_TIMEOUT, 1))
+
+
+def _circuit_breaker(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    a circuit breaker as configured in the "search" section, or
+                None if it is disabled
+    :rtype:     crane.search.breaker.CircuitBreaker
+    """
+    section = app.config.get(config.SECTION_SEARCH, {})
+    threshold = section.get(config.KEY_BREAKER_THRESHOLD, 0)
+    if threshold <= 0:
+        return None
+    return CircuitBreaker(threshold, section.get(config.KEY_BREAKER_RESET_TIMEOUT, 30))
+
+
+def _adaptive_timeout(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    an adaptive timeout as configured in the "search" section, or
+                None if it is disabled
+    :rtype:     crane.search.breaker.AdaptiveTimeout
+    """
+    section = app.config.get(config.SECTION_SEARCH, {})
+    if section.get(config.KEY_ADAPTIVE_TIMEOUT) is not True:
+        return None
+    return AdaptiveTimeout(section.get(config.KEY_TIMEOUT, 1),
+                           section.get(config.KEY_MIN_TIMEOUT, 0.25))
+
+
+def health():
+    """
+    :return:    information about the current search backend for admins,
+                including the state of the circuit breakers and timeouts of
+                backend services
+    :rtype:     dict
+    """
+    return backend.health()
+
+
+def _max_results(app):
+    """
+    :param app: flask application
+    :type  app: flask.Flask
+
+    :return:    maximum number of results a search returns as configured in
+                the "search" section, or 0 for no limit
+    :rtype:     int
+    """
+    return max(app.config.get(config.SECTION_SEARCH, {}).get(config.KEY_MAX_RESULTS, 0), 0)
@@ -1,11 +1,18 @@
 from collections import namedtuple
+import contextlib
 import httplib
+import itertools
 import logging
 import socket
+import time
+import urllib
 import urllib2
+import urlparse
 
 from .. import app_util
+from .. import data
 from .. import exceptions
+from .pool import ConnectionPool
 
 
 _logger = logging.getLogger(__name__)
@@ -14,23 +21,111 @@ _logger = logging.getLogger(__name__)
 class SearchBackend(object):
     """
     Base class that all search backends should inherit from. This defines the
-    search() method signature and provides other functionality that may be
-    useful across different search implementations.
+    search() method and provides other functionality that may be useful across
+    different search implementations. Subclasses implement _fetch().
     """
-    def search(self, query):
+    # crane.search.results.ResultCache for the results of _fetch(), or None
+    result_cache = None
+    # maximum number of results a search returns, or 0 for no limit.
+    # set by crane.search.load_config
+    max_results = 0
+    # True iff the backend service can return one page of results at a time,
+    # see _fetch_page()
+    paginates = False
+
+    def search(self, query, page=None, page_size=None):
+        """
+        Searches a backend service based on a given query parameter. Results
+        may come from the result cache, but are filtered for each call.
+
+        If a page is requested from a backend that paginates, the backend is
+        asked for that page only, and the page holds those of its results that
+        pass the filter. Otherwise the page is taken from the filtered results.
+
+        :param query:       a string representing the search input from a user
+                            that should be passed through to a search service
+        :type  query:       basestring
+        :param page:        number of the page to return, starting at 1, or
+                            None for all results
+        :type  page:        int
+        :param page_size:   number of results per page. required if page is set
+        :type  page_size:   int
+
+        :return:    a collection of search results as a generator of
+                    dictionaries in the form that docker expects. These results
+                    have been filtered to exclude any repositories that are not
+                    being served by this deployment of this app, or that the
+                    user is not authorized to access.
+        :rtype:     generator
         """
-        Searches a backend service based on a given query parameter.
+        # queries that only differ in whitespace share results
+        query = ' '.join(query.split())
+        if page is not None and self.paginates:
+            results = self._get_results((query, page, page_size),
+                                        lambda key: self._fetch_page(*key))
+            results = self._filter_results(results)
+        else:
+            results = self._filter_results(self._get_results(query, self._fetch))
+            if page is not None:
+                start = (page - 1) * page_size
+                results = results[start:start + page_size]
+        if self.max_results > 0:
+            results = itertools.islice(results, self.max_results)
+        return itertools.imap(self._format_result, results)
+
+    def _fetch(self, query):
+        """
+        Gets the unfiltered results for a query from the backend service.
 
         :param query:   a string representing the search input from a user that
                         should be passed through to a search service
         :type  query:   basestring
 
-        :return:    a collection of search results as a generator of
-                    SearchResult instances
-        :rtype:     generator
+        :return:    SearchResult instances
+        :rtype:     list
         """
         raise exceptions.HTTPError(httplib.NOT_FOUND)
 
+    def _fetch_page(self, query, page, page_size):
+        """
+        Gets one page of the unfiltered results for a query from the backend
+        service. Only called if paginates is True.
+
+        :param query:       a string representing the search input from a user
+                            that should be passed through to a search service
+        :type  query:       basestring
+        :param page:        number of the page, starting at 1
+        :type  page:        int
+        :param page_size:   number of results per page
+        :type  page_size:   int
+
+        :return:    SearchResult instances
+        :rtype:     list
+        """
+        raise exceptions.HTTPError(httplib.NOT_FOUND)
+
+    def _get_results(self, key, fetch):
+        """
+        :param key:     normalized query, or anything else that identifies the
+                        results in the result cache
+        :type  key:     hashable
+        :param fetch:   function that takes the key and returns the results
+        :type  fetch:   function
+
+        :return:    SearchResult instances, from the result cache if possible
+        :rtype:     list
+        """
+        if self.result_cache is None:
+            return fetch(key)
+        return self.result_cache.get(key, fetch)
+
+    def health(self):
+        """
+        :return:    information about the backend for admins
+        :rtype:     dict
+        """
+        return {'backend': type(self).__name__}
+
     @staticmethod
     def _format_result(result):
         """
@@ -46,29 +141,67 @@ class SearchBackend(object):
         """
         return dict(result._asdict())
 
-    def _filter_result(self, result):
+    def _collect(self, results):
         """
-        Determines if a given result object, which represents a repository, is
-        both known by this app (aka we have it in the app data), and if the user
-        is authorized to access it.
+        Collects results that a backend's response is parsed into, and stops
+        consuming them once max_results of them are for repositories that this
+        app serves, as decided by _is_served(), so the rest of the response
+        does not need to be read.
 
+        Whether the user is authorized for a repository is not considered,
+        because the collected results may be cached and shared by all users;
+        search() applies max_results again after filtering.
+
+        :param results: unfiltered search results
+        :type  results: iterable of SearchResult
+
+        :return:    SearchResult instances
+        :rtype:     list
+        """
+        if self.max_results <= 0:
+            return list(results)
+        collected = []
+        served = 0
+        for result in results:
+            collected.append(result)
+            if self._is_served(result):
+                served += 1
+                if served >= self.max_results:
+                    break
+        return collected
+
+    def _is_served(self, result):
+        """
         :param result:  one search result
         :type  result:  SearchResult
-        :return:    True iff the repository is known and the user is authorized,
-                    else False
+
+        :return:    True iff the result may pass the filter of this backend,
+                    depending only on the user's authorization
         :rtype:     bool
         """
-        try:
-            # check against repositories in V2 data dict
-            app_util.name_is_authorized(result.name)
+        return not result.should_filter or _is_served(result.name)
 
-        except exceptions.HTTPError:
-            try:
-                # check against repositories in v1 data dict
-                app_util.repo_is_authorized(result.name)
-            except exceptions.HTTPError:
-                return False
-        return True
+    def _filter_results(self, results):
+        """
+        Filters out results for repositories that are not known by this app,
+        or that the user is not authorized to access. Only results whose
+        should_filter is True are authorized; the others are always kept. All
+        results are authorized at once, so the client certificate is looked up
+        only once per search.
+
+        :param results: search results
+        :type  results: iterable of SearchResult
+
+        :return:    the results that either represent a repository that is known
+                    and that the user is authorized to access, or that do not
+                    need to be authorized, in their original order
+        :rtype:     list
+        """
+        results = list(results)
+        allowed = app_util.authorized_names(result.name for result in results
+                                            if result.should_filter)
+        return [result for result in results
+                if not result.should_filter or result.name in allowed]
 
 
 class HTTPBackend(SearchBackend):
@@ -76,12 +209,21 @@ class HTTPBackend(SearchBackend):
     This provides functionality that may be useful across different search
     implementations that use HTTP to communicate with a backend service.
     """
-    @staticmethod
-    def _get_data(url):
+    # keep-alive connections to the backend service, shared by all threads.
+    # replaced with a configured pool by crane.search.load_config
+    connection_pool = ConnectionPool()
+    # crane.search.breaker.CircuitBreaker and AdaptiveTimeout of the backend
+    # service, or None. set by crane.search.load_config
+    circuit_breaker = None
+    adaptive_timeout = None
+
+    def _get_data(self, url):
         """
         Gets data from a URL and handles various HTTP-related error conditions.
         Any search implementation that uses an HTTP-based backend service should
-        be able to use this method for GET requests.
+        be able to use this method for GET requests. Connections are reused
+        from the connection pool, unless a proxy is configured for the URL in
+        the environment.
 
         :param url: a complete URL that will be used for a GET request
         :type  url: basestring
@@ -91,26 +233,226 @@ class HTTPBackend(SearchBackend):
 
         :raises exceptions.HTTPError:   if there is a problem performing the
                                         GET request.
-                                        502: if the response is not 200
-                                        503: if urllib2 raises an exception while
-                                             performing the request
+                                        502: if the response is not 200, or
+                                             is not valid HTTP
+                                        503: if the connection fails, or the
+                                             circuit breaker is open
                                         504: if the backend takes too long
         """
+        with self._guard() as timeout:
+            if _uses_proxy(url):
+                response = self._open_with_proxy(url, timeout)
+                _check_status(response.getcode(), url)
+                with _communication_errors(url):
+                    return response.read()
+            with _communication_errors(url):
+                status, body = self.connection_pool.get(url, timeout)
+            _check_status(status, url)
+            return body
+
+    def _open(self, url):
+        """
+        Like _get_data, but returns the response as soon as its headers have
+        arrived, so that the body can be parsed as it is read.
+
+        :param url: a complete URL that will be used for a GET request
+        :type  url: basestring
+
+        :return:    the response, with a read() method for its body. The caller
+                    must close it.
+        :rtype:     crane.search.pool.PooledResponse, or the file-like object
+                    returned by urllib2.urlopen if a proxy is used
+
+        :raises exceptions.HTTPError:   see _get_data. Errors reading the body
+                                        are raised by the response's read(),
+                                        see _reading.
+        """
+        with self._guard() as timeout:
+            if _uses_proxy(url):
+                response = self._open_with_proxy(url, timeout)
+                status = response.getcode()
+            else:
+                with _communication_errors(url):
+                    response = self.connection_pool.open(url, timeout)
+                status = response.status
+            if status != httplib.OK:
+                response.close()
+            _check_status(status, url)
+            return response
+
+    @contextlib.contextmanager
+    def _guard(self):
+        """
+        Guards one request to the backend service with the circuit breaker, and
+        records how long it took. The request is considered failed if it
+        raises an exception.
+
+        :return:    context manager that provides the number of seconds to wait
+                    for the backend
+        :rtype:     contextlib.GeneratorContextManager
+
+        :raises exceptions.HTTPError:   503: if the circuit breaker is open
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            raise exceptions.HTTPError(httplib.SERVICE_UNAVAILABLE,
+                                       'backend search service is unavailable')
+        if self.adaptive_timeout is None:
+            timeout = self.connection_pool.timeout
+        else:
+            timeout = self.adaptive_timeout.timeout()
+        start = time.time()
+        try:
+            yield timeout
+        except Exception:
+            self._record(False, time.time() - start)
+            raise
+        self._record(True, time.time() - start)
+
+    @contextlib.contextmanager
+    def _reading(self, url):
+        """
+        Guards reading the body of a response returned by _open. Errors
+        communicating with the backend service while the body is read are
+        turned into HTTP errors like those of _get_data, and are recorded as
+        failures with the circuit breaker.
+
+        :param url: the URL that was requested
+        :type  url: basestring
+
+        :return:    context manager
+        :rtype:     contextlib.GeneratorContextManager
+
+        :raises exceptions.HTTPError:   502: if the response is not valid HTTP
+                                        503: if the connection fails
+                                        504: if the backend takes too long
+        """
+        try:
+            with _communication_errors(url):
+                yield
+        except exceptions.HTTPError:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            raise
+
+    def _record(self, success, seconds):
+        """
+        :param success: True iff a request to the backend service succeeded
+        :type  success: bool
+        :param seconds: time the request took
+        :type  seconds: float
+        """
+        if self.adaptive_timeout is not None:
+            self.adaptive_timeout.record(seconds)
+        if self.circuit_breaker is not None:
+            if success:
+                self.circuit_breaker.record_success()
+            else:
+                self.circuit_breaker.record_failure()
+
+    def health(self):
+        """
+        :return:    state of the circuit breaker and timeout of the backend
+                    service
+        :rtype:     dict
+        """
+        health = super(HTTPBackend, self).health()
+        if self.circuit_breaker is not None:
+            health['circuit_breaker'] = self.circuit_breaker.stats()
+        if self.adaptive_timeout is None:
+            health['timeout'] = {'timeout': self.connection_pool.timeout}
+        else:
+            health['timeout'] = self.adaptive_timeout.stats()
+        return health
+
+    @staticmethod
+    def _open_with_proxy(url, timeout):
+        """
+        :param url:     a complete URL that will be used for a GET request
+        :type  url:     basestring
+        :param timeout: number of seconds to wait for the backend
+        :type  timeout: float
+
+        :return:    the response
+        :rtype:     file-like object returned by urllib2.urlopen
+
+        :raises exceptions.HTTPError:   see _get_data
+        """
         try:
-            # one second timeout
-            response = urllib2.urlopen(url, timeout=1)
+            return urllib2.urlopen(url, timeout=timeout)
         except socket.timeout:
             _logger.error('timeout communicating with backend search service')
             raise exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
         except urllib2.URLError, e:
             _logger.error('error communicating with backend search service: %s' % e.reason)
             raise exceptions.HTTPError(httplib.SERVICE_UNAVAILABLE)
-        if response.getcode() != httplib.OK:
-            _logger.error('received http response code %s from backend search service' %
-                          response.getcode())
-            raise exceptions.HTTPError(httplib.BAD_GATEWAY, url)
 
-        return response.read()
+
+@contextlib.contextmanager
+def _communication_errors(url):
+    """
+    Turns errors communicating with a backend service into HTTP errors.
+
+    :param url: the URL being requested
+    :type  url: basestring
+
+    :raises exceptions.HTTPError:   502: if the response is not valid HTTP
+                                    503: if the connection fails
+                                    504: if the backend takes too long
+    """
+    try:
+        yield
+    except socket.timeout:
+        _logger.error('timeout communicating with backend search service')
+        raise exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+    except (socket.error, IOError), e:
+        _logger.error('error communicating with backend search service: %s' % e)
+        raise exceptions.HTTPError(httplib.SERVICE_UNAVAILABLE)
+    except httplib.HTTPException, e:
+        _logger.error('invalid response from backend search service: %r' % e)
+        raise exceptions.HTTPError(httplib.BAD_GATEWAY, url)
+
+
+def _check_status(status, url):
+    """
+    :param status:  status code of a backend service's response
+    :type  status:  int
+    :param url:     the URL that was requested
+    :type  url:     basestring
+
+    :raises exceptions.HTTPError:   502: if the status is not 200
+    """
+    if status != httplib.OK:
+        _logger.error('received http response code %s from backend search service' %
+                      status)
+        raise exceptions.HTTPError(httplib.BAD_GATEWAY, url)
+
+
+def _is_served(name):
+    """
+    Unlike app_util.name_is_authorized, this does not need a request, so it can
+    be used while results are refreshed in the background.
+
+    :param name:    name of a repository
+    :type  name:    basestring
+
+    :return:    True iff a v2 or v1 repository of that name is in the currently
+                loaded metadata
+    :rtype:     bool
+    """
+    return name in data.v2_response_data['repos'] or name in data.v1_response_data['repos']
+
+
+def _uses_proxy(url):
+    """
+    :param url: a complete URL
+    :type  url: basestring
+
+    :return:    True iff the environment configures a proxy for the URL
+    :rtype:     bool
+    """
+    parts = urlparse.urlsplit(url)
+    return parts.scheme in urllib.getproxies() and not urllib.proxy_bypass(parts.hostname)
 
 
 # this data structure should be used to return search results in a uniform
@@ -0,0 +1,162 @@
+"""
+Protection of searches from an unhealthy backend service.
+
+A CircuitBreaker counts consecutive failures of a backend. After "threshold" of
+them it opens, and searches fail at once instead of waiting for the backend,
+unless the result cache still holds results for the query. After
+"reset_timeout" seconds it lets one request through; if that request succeeds
+the breaker closes again, otherwise it stays open for another "reset_timeout"
+seconds.
+
+An AdaptiveTimeout tracks how long a backend takes to answer, and waits for it
+a few times its 99th percentile latency, but no less than a minimum and no
+longer than the configured timeout. A backend that suddenly stops answering is
+then given up on long before the configured timeout.
+"""
+from collections import deque
+import logging
+import math
+import threading
+import time
+
+
+_logger = logging.getLogger(__name__)
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    def __init__(self, threshold=5, reset_timeout=30):
+        """
+        :param threshold:       number of consecutive failures that open the
+                                breaker
+        :type  threshold:       int
+        :param reset_timeout:   number of seconds the breaker stays open before
+                                a request is let through again
+        :type  reset_timeout:   int
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        # number of consecutive failures
+        self.failures = 0
+        self.opened_at = None
+        # True while the request that tests a half-open breaker is in progress
+        self._testing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Call before each request to the backend. If it returns True, the
+        outcome of the request must be recorded with record_success or
+        record_failure.
+
+        :return:    True iff a request may be sent to the backend
+        :rtype:     bool
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+            if self._testing:
+                return False
+            self._testing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                _logger.info('backend search service recovered')
+            self.state = CLOSED
+            self.failures = 0
+            self._testing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._testing = False
+            if self.state == HALF_OPEN or \
+                    (self.state == CLOSED and self.failures >= self.threshold):
+                if self.state == CLOSED:
+                    _logger.error('backend search service failed %d times, not using it for '
+                                  '%d seconds' % (self.failures, self.reset_timeout))
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def stats(self):
+        """
+        :return:    state of the breaker, number of consecutive failures, and
+                    number of seconds until a request is let through again if
+                    it is open
+        :rtype:     dict
+        """
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(self.opened_at + self.reset_timeout - time.time(), 0)
+            return {'state': self.state, 'failures': self.failures, 'retry_in': retry_in}
+
+
+class AdaptiveTimeout(object):
+    # latencies needed before the timeout adapts
+    MIN_SAMPLES = 20
+
+    def __init__(self, maximum, minimum=0.25, factor=2, window=200):
+        """
+        :param maximum: number of seconds to wait at most, and until enough
+                        latencies are known
+        :type  maximum: float
+        :param minimum: number of seconds to wait at least
+        :type  minimum: float
+        :param factor:  multiple of the 99th percentile latency to wait
+        :type  factor:  float
+        :param window:  number of most recent latencies to consider
+        :type  window:  int
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.factor = factor
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds):
+        """
+        :param seconds: time a request took, including requests that timed out
+                        or failed
+        :type  seconds: float
+        """
+        self.latencies.append(seconds)
+
+    def p99(self):
+        """
+        :return:    99th percentile of the recent latencies, or None if there
+                    are not enough of them
+        :rtype:     float
+        """
+        latencies = sorted(self.latencies)
+        if len(latencies) < self.MIN_SAMPLES:
+            return None
+        return latencies[int(math.ceil(0.99 * len(latencies))) - 1]
+
+    def timeout(self):
+        """
+        :return:    number of seconds to wait for the next request
+        :rtype:     float
+        """
+        p99 = self.p99()
+        if p99 is None:
+            return self.maximum
+        return min(max(p99 * self.factor, self.minimum), self.maximum)
+
+    def stats(self):
+        """
+        :return:    current timeout, 99th percentile latency and number of
+                    recent latencies
+        :rtype:     dict
+        """
+        return {'timeout': self.timeout(), 'p99': self.p99(), 'samples': len(self.latencies)}
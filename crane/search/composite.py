@@ -0,0 +1,131 @@
+"""
+A search backend that combines the results of several others, for example
+while moving from one search service to another.
+
+All backends are asked at the same time. Backends that use HTTP run in a pool
+of threads; the others are fast and run in the request's thread, which also
+gives them access to the request's data. A search waits for the backends until
+a deadline, so it takes as long as the slowest backend that answers in time,
+not as long as all backends together. Backends that fail or do not answer in
+time are left out, unless all of them fail.
+"""
+import httplib
+import logging
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+from .. import exceptions
+from .base import HTTPBackend, SearchBackend
+
+
+_logger = logging.getLogger(__name__)
+
+
+# number of threads for each HTTP backend, which limits the number of searches
+# that can wait for a backend at the same time
+THREADS_PER_BACKEND = 10
+
+
+class Composite(SearchBackend):
+    def __init__(self, backends, deadline):
+        """
+        :param backends:    backends to combine, in order of precedence. Each
+                            may have its own result cache.
+        :type  backends:    list of crane.search.base.SearchBackend
+        :param deadline:    number of seconds to wait for the backends
+        :type  deadline:    float
+        """
+        self.backends = backends
+        self.deadline = deadline
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _fetch(self, query):
+        """
+        Searches all backends for a query.
+
+        :param query:   a string representing the search input from a user
+        :type  query:   basestring
+
+        :return:    SearchResult instances, not yet filtered. If several
+                    backends return a result with the same name, only the
+                    first in order of precedence is kept.
+        :rtype:     list
+
+        :raises exceptions.HTTPError:   if no backend returned results
+        """
+        deadline = time.time() + self.deadline
+        pending = []
+        for backend in self.backends:
+            if isinstance(backend, HTTPBackend):
+                pending.append(self._get_pool().apply_async(_get_results, (backend, query)))
+            else:
+                pending.append(None)
+
+        results_by_backend = []
+        errors = []
+        for backend, async_result in zip(self.backends, pending):
+            try:
+                if async_result is None:
+                    results_by_backend.append(_get_results(backend, query))
+                else:
+                    timeout = max(deadline - time.time(), 0)
+                    results_by_backend.append(async_result.get(timeout))
+            except TimeoutError, e:
+                _logger.error('search backend %s did not answer in time' %
+                              type(backend).__name__)
+                errors.append(e)
+            except Exception, e:
+                _logger.error('search backend %s failed: %r' % (type(backend).__name__, e))
+                errors.append(e)
+
+        if not results_by_backend:
+            error = errors[0]
+            if isinstance(error, exceptions.HTTPError):
+                raise error
+            raise exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+
+        merged = []
+        names = set()
+        for results in results_by_backend:
+            for result in results:
+                if result.name not in names:
+                    names.add(result.name)
+                    merged.append(result)
+        return merged
+
+    def health(self):
+        """
+        :return:    information about this backend and each combined backend
+        :rtype:     dict
+        """
+        health = super(Composite, self).health()
+        health['deadline'] = self.deadline
+        health['backends'] = [backend.health() for backend in self.backends]
+        return health
+
+    def _get_pool(self):
+        """
+        :return:    the pool of threads that runs HTTP backends, which is
+                    started on first use, so that it is not shared by forked
+                    processes
+        :rtype:     multiprocessing.pool.ThreadPool
+        """
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    size = len([b for b in self.backends if isinstance(b, HTTPBackend)])
+                    # concurrent searches share the pool
+                    self._pool = ThreadPool(max(size, 1) * THREADS_PER_BACKEND)
+        return self._pool
+
+
+def _get_results(backend, query):
+    """
+    :return:    a backend's unfiltered results for a query, from its result
+                cache if possible
+    :rtype:     list
+    """
+    return list(backend._get_results(query, backend._fetch))
@@ -1,5 +1,4 @@
 import httplib
-import itertools
 import logging
 import urllib
 import urlparse
@@ -35,7 +34,7 @@ class GSA(HTTPBackend):
         self.url_parts = urlparse.urlparse(url)
         self.params = urlparse.parse_qs(self.url_parts.query)
 
-    def search(self, query):
+    def _fetch(self, query):
         """
         Searches a Google Search Appliance based on a given query parameter.
 
@@ -43,17 +42,16 @@ class GSA(HTTPBackend):
                         should be passed through to the GSA
         :type  query:   basestring
 
-        :return:    a collection of search results as a generator of
-                    SearchResult instances. These results have been filtered
-                    to exclude any repositories that are not being served by
-                    this deployment of this app.
-        :rtype:     generator
+        :return:    SearchResult instances, not yet filtered
+        :rtype:     list
         """
         url = self._form_url(query)
-        data = self._get_data(url)
-        result_generator = self._parse_xml(data)
-        filtered_results = itertools.ifilter(self._filter_result, result_generator)
-        return itertools.imap(self._format_result, filtered_results)
+        response = self._open(url)
+        try:
+            with self._reading(url):
+                return self._collect(self._parse_xml(response))
+        finally:
+            response.close()
 
     def _form_url(self, query):
         """
@@ -75,25 +73,40 @@ class GSA(HTTPBackend):
         return urlparse.urlunparse(parts)
 
     @staticmethod
-    def _parse_xml(data):
+    def _parse_xml(response):
         """
         Parses the XML returned by a GSA and turns it into a generator of result
-        instances.
+        instances. The XML is parsed as it is read, so each result is yielded
+        as soon as it has arrived, and elements are discarded once they have
+        been parsed.
 
-        :param data:    XML data returned by a GET request to a Google Search
-                        Appliance
-        :type  data:    basestring
+        :param response:    file-like object with the XML data returned by a
+                            GET request to a Google Search Appliance
+        :type  response:    file
 
         :return:    a collection of search results as a generator of
                     SearchResult instances
         :rtype:     generator
 
-        :raises exceptions.HTTPError: if there is an error parsing the XML
+        :raises exceptions.HTTPError:   if the XML cannot be parsed
+        :raises IOError:                if the response cannot be read
+        :raises httplib.HTTPException:  if the response is not valid HTTP
         """
         try:
-            tree = ET.fromstring(data)
-            # each result is in an element of type "R"
-            for repo in tree.findall('./RES/R'):
+            # the elements that enclose the current one, starting with the root
+            path = []
+            for event, repo in ET.iterparse(response, events=('start', 'end')):
+                if event == 'start':
+                    path.append(repo)
+                    continue
+                path.pop()
+                if 0 < len(path) <= 2:
+                    # parsed results, and the other elements at their level or
+                    # above, are not needed anymore
+                    path[-1].remove(repo)
+                # each result is in an element of type "R" in the "RES" element
+                if repo.tag != 'R' or len(path) != 2 or path[1].tag != 'RES':
+                    continue
                 name = None
                 description = ''
                 # each attribute of the repo is returned in an element of type MT
@@ -103,10 +116,12 @@ class GSA(HTTPBackend):
                         name = mt.attrib['V']
                     elif mt.attrib.get('N') == 'portal_short_description':
                         description = mt.attrib['V']
-
                 if name is not None:
                     yield SearchResult(name, description, **SearchResult.result_defaults)
 
+        except (IOError, httplib.HTTPException):
+            # reading the response failed, not parsing it
+            raise
         except Exception:
             _logger.exception('could not parse xml')
             raise exceptions.HTTPError(httplib.BAD_GATEWAY,
@@ -0,0 +1,26 @@
+from .. import app_util
+from .base import SearchBackend, SearchResult
+
+
+class LocalSearch(SearchBackend):
+    """
+    This backend searches the names and descriptions of the repositories crane
+    serves, using the index that crane.data builds when the metadata is
+    loaded. No other service is involved.
+    """
+    def _fetch(self, query):
+        """
+        Searches the index of the current metadata.
+
+        :param query:   a string representing the search input from a user
+        :type  query:   basestring
+
+        :return:    SearchResult instances, best match first, not yet filtered
+        :rtype:     list
+        """
+        index = app_util.get_data().get('search_index')
+        if index is None:
+            return []
+        return [SearchResult(repo_id, index.descriptions[repo_id] or '',
+                             **SearchResult.result_defaults)
+                for repo_id in index.search(query)]
@@ -0,0 +1,244 @@
+"""
+Keep-alive HTTP connections to search backends.
+
+Opening a connection, and for https URLs doing the TLS handshake, often takes
+longer than the search itself. A ConnectionPool keeps connections open after a
+request, so the next request to the same host can reuse one. The pool is shared
+by all threads of a process; each connection is used by one request at a time.
+
+Response bodies can be read incrementally, so that a backend's results can be
+parsed as they arrive and reading can stop once enough have been parsed.
+"""
+import httplib
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+
+# number of bytes read from a connection at a time when a body is read incrementally
+CHUNK_SIZE = 16384
+
+
+class ConnectionPool(object):
+    def __init__(self, maxsize=10, idle_timeout=30, timeout=1):
+        """
+        :param maxsize:         maximum number of idle connections kept open
+                                per host
+        :type  maxsize:         int
+        :param idle_timeout:    number of seconds after which an idle
+                                connection is closed instead of reused
+        :type  idle_timeout:    int
+        :param timeout:         number of seconds to wait for a connection or
+                                for data from the server
+        :type  timeout:         float
+        """
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        # lists of (connection, time it became idle) keyed by (scheme, host),
+        # most recently used last
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        """
+        Perform a GET request. The response body is decompressed if the server
+        used gzip.
+
+        :param url:     complete http or https URL
+        :type  url:     basestring
+        :param timeout: number of seconds to wait for the server, instead of
+                        the pool's timeout
+        :type  timeout: float
+
+        :return:    tuple of the response status and body
+        :rtype:     tuple
+
+        :raises socket.timeout:         if the server takes too long
+        :raises socket.error:           if the connection fails
+        :raises httplib.HTTPException:  if the response is not valid HTTP
+        """
+        response = self.open(url, timeout)
+        try:
+            return response.status, response.read()
+        finally:
+            response.close()
+
+    def open(self, url, timeout=None):
+        """
+        Perform a GET request, and return the response as soon as its headers
+        have arrived. The caller reads the body and must close the response.
+
+        :param url:     complete http or https URL
+        :type  url:     basestring
+        :param timeout: number of seconds to wait for the server, instead of
+                        the pool's timeout
+        :type  timeout: float
+
+        :return:    the response
+        :rtype:     PooledResponse
+
+        :raises socket.timeout:         if the server takes too long
+        :raises socket.error:           if the connection fails
+        :raises httplib.HTTPException:  if the response is not valid HTTP
+        """
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        headers = {'Accept-Encoding': 'gzip'}
+        if timeout is None:
+            timeout = self.timeout
+
+        connection = self._checkout(key)
+        if connection is not None:
+            try:
+                return self._request(key, connection, path, headers, timeout)
+            except socket.timeout:
+                raise
+            except (socket.error, httplib.HTTPException):
+                # the server may have closed the idle connection, so try once
+                # more with a new one
+                pass
+        return self._request(key, self._connect(parts, timeout), path, headers, timeout)
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.itervalues():
+            for connection, idle_since in connections:
+                connection.close()
+
+    def _connect(self, parts, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if parts.scheme == 'https':
+            return httplib.HTTPSConnection(parts.hostname, parts.port, timeout=timeout)
+        return httplib.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+    def _checkout(self, key):
+        """
+        :return:    an idle connection to the host, or None
+        :rtype:     httplib.HTTPConnection
+        """
+        now = time.time()
+        expired = []
+        connection = None
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                candidate, idle_since = connections.pop()
+                if now - idle_since < self.idle_timeout:
+                    connection = candidate
+                    break
+                expired.append(candidate)
+        for candidate in expired:
+            candidate.close()
+        return connection
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.maxsize:
+                connections.append((connection, time.time()))
+                return
+        connection.close()
+
+    def _request(self, key, connection, path, headers, timeout):
+        try:
+            # an idle connection may have been opened with another timeout
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+        return PooledResponse(self, key, connection, response)
+
+
+class PooledResponse(object):
+    """
+    A response whose body is read from a pooled connection as it is needed.
+    The connection goes back to the pool when the response is closed after its
+    whole body was read; otherwise it is closed.
+    """
+    def __init__(self, pool, key, connection, response):
+        """
+        :param pool:        pool the connection belongs to
+        :type  pool:        ConnectionPool
+        :param key:         (scheme, host) the connection is for
+        :type  key:         tuple
+        :param connection:  connection the request was sent on
+        :type  connection:  httplib.HTTPConnection
+        :param response:    response with its headers read
+        :type  response:    httplib.HTTPResponse
+        """
+        self.status = response.status
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self._decompressor = None
+        if response.getheader('Content-Encoding', '').lower() == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # decompressed bytes that have not been returned by read() yet
+        self._buffer = ''
+        self._done = False
+
+    def read(self, size=-1):
+        """
+        :param size:    maximum number of bytes to return, or a negative number
+                        for the rest of the body
+        :type  size:    int
+
+        :return:    the next bytes of the body, decompressed if the server used
+                    gzip, or an empty string at the end of the body
+        :rtype:     str
+
+        :raises socket.timeout:         if the server takes too long
+        :raises socket.error:           if the connection fails
+        :raises httplib.HTTPException:  if the body is not valid
+        """
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            self._read_chunk()
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        """
+        Release the connection. Closing a response more than once has no effect.
+        """
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        if self._done and not self._response.will_close:
+            self._pool._checkin(self._key, connection)
+        else:
+            connection.close()
+
+    def _read_chunk(self):
+        try:
+            chunk = self._response.read(CHUNK_SIZE)
+            if self._decompressor is None:
+                self._buffer += chunk
+            elif chunk:
+                self._buffer += self._decompressor.decompress(chunk)
+            else:
+                self._buffer += self._decompressor.flush()
+        except zlib.error, e:
+            self.close()
+            raise httplib.HTTPException('invalid gzip body: %s' % e)
+        except Exception:
+            self.close()
+            raise
+        if not chunk:
+            self._done = True
@@ -0,0 +1,149 @@
+"""
+Per-process cache of the results a search backend returned for each query.
+
+Results are fresh for "ttl" seconds. After that they are still served for up to
+"stale_ttl" more seconds while a background thread fetches new results, so
+clients do not wait for the backend. Errors are cached for "error_ttl" seconds,
+so a failing backend is not asked again for every request. If the backend fails
+with an HTTP error, for example because its circuit breaker is open, the last
+results for the query are served instead if they are still held, however old
+they are. Concurrent requests for the same query that are not answered from the
+cache share one fetch.
+
+Only the raw results are cached; authorization is checked on every request.
+"""
+from collections import namedtuple
+import logging
+import threading
+import time
+
+from .. import cache
+from .. import exceptions
+
+
+_logger = logging.getLogger(__name__)
+
+
+# results is a list of SearchResult. If fetching failed with error, results are
+# the previous results for the query, or None. The entry is fresh until
+# "expires", and may be served while it is refreshed until "stale_until".
+_Entry = namedtuple('_Entry', ['results', 'error', 'expires', 'stale_until'])
+
+
+class _Fetch(object):
+    """
+    A fetch in progress, which requests for the same query wait for.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class ResultCache(object):
+    def __init__(self, ttl, stale_ttl=0, error_ttl=0, maxsize=1000):
+        """
+        :param ttl:         number of seconds results are fresh
+        :type  ttl:         int
+        :param stale_ttl:   number of seconds after they expire that results
+                            may be served while they are refreshed
+        :type  stale_ttl:   int
+        :param error_ttl:   number of seconds an error is served again before
+                            the backend is asked again
+        :type  error_ttl:   int
+        :param maxsize:     maximum number of queries to hold results for
+        :type  maxsize:     int
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.entries = cache.LRUCache(maxsize)
+        # fetches in progress keyed by query
+        self._fetches = {}
+        self._lock = threading.Lock()
+
+    def get(self, query, fetch):
+        """
+        :param query:   normalized search query, or a tuple that identifies
+                        one page of the results for a query
+        :type  query:   hashable
+        :param fetch:   function that takes the query and returns its results
+        :type  fetch:   function
+
+        :return:    results for the query
+        :rtype:     list
+
+        :raises exceptions.HTTPError:   if fetching the results failed
+        """
+        now = time.time()
+        entry = self.entries.get(query)
+        if entry is not None:
+            if now < entry.expires:
+                if entry.error is not None and entry.results is None:
+                    raise entry.error
+                return entry.results
+            if entry.error is None and now < entry.stale_until:
+                self._start_fetch(query, fetch, background=True)
+                return entry.results
+
+        current, started = self._start_fetch(query, fetch)
+        if not started:
+            current.done.wait()
+        if current.error is not None:
+            if entry is not None and entry.results is not None and \
+                    isinstance(current.error, exceptions.HTTPError):
+                _logger.warning('serving old search results: backend failed with %d' %
+                                current.error.status_code)
+                return entry.results
+            raise current.error
+        return current.results
+
+    def _start_fetch(self, query, fetch, background=False):
+        """
+        Fetch the results for a query, unless they are already being fetched.
+
+        :param query:       normalized search query
+        :type  query:       basestring
+        :param fetch:       function that takes the query and returns its results
+        :type  fetch:       function
+        :param background:  True iff the results should be fetched in a new
+                            thread instead of the current one
+
+        :return:    tuple of the fetch for the query, and True iff it was
+                    started by this call
+        :rtype:     tuple
+        """
+        with self._lock:
+            current = self._fetches.get(query)
+            if current is not None:
+                return current, False
+            current = self._fetches[query] = _Fetch()
+
+        if background:
+            thread = threading.Thread(target=self._fetch, args=(query, fetch, current, True))
+            thread.daemon = True
+            thread.start()
+        else:
+            self._fetch(query, fetch, current, False)
+        return current, True
+
+    def _fetch(self, query, fetch, current, background):
+        try:
+            current.results = list(fetch(query))
+        except Exception, e:
+            current.error = e
+            # a failed refresh leaves the stale results in place
+            if background:
+                _logger.error('could not refresh search results: %s' % e)
+            elif self.error_ttl > 0 and isinstance(e, exceptions.HTTPError):
+                previous = self.entries.get(query)
+                results = previous.results if previous is not None else None
+                self.entries.set(query, _Entry(results, e, time.time() + self.error_ttl, 0))
+        else:
+            expires = time.time() + self.ttl
+            self.entries.set(query, _Entry(current.results, None, expires,
+                                           expires + self.stale_ttl))
+        finally:
+            with self._lock:
+                del self._fetches[query]
+            current.done.set()
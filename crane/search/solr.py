@@ -1,17 +1,26 @@
 import httplib
-import itertools
 import json
 import logging
+import re
 import urllib
+import urlparse
 
 from .. import exceptions
 from .base import HTTPBackend, SearchResult
+from .pool import CHUNK_SIZE
 
 
 _logger = logging.getLogger(__name__)
 
 
+# fields of each document that are turned into a SearchResult
+FIELDS = ('allTitle', 'c_pull_command', 'documentKind', 'ir_automated', 'ir_description',
+          'ir_official', 'ir_stars', 'publishedAbstract')
+
+
 class Solr(HTTPBackend):
+    paginates = True
+
     def __init__(self, url_template):
         """
         :param url_template:    PEP3101 string that is a URL that will accept a
@@ -21,7 +30,7 @@ class Solr(HTTPBackend):
         """
         self.url_template = url_template
 
-    def search(self, query):
+    def _fetch(self, query):
         """
         Searches a Solr search backend based on a given query parameter.
 
@@ -29,35 +38,81 @@ class Solr(HTTPBackend):
                         should be passed through to the solr backend
         :type  query:   basestring
 
-        :return:    a collection of search results as a generator of
-                    SearchResult instances. These results have been filtered
-                    to exclude any repositories that are not being served by
-                    this deployment of this app.
-        :rtype:     generator
+        :return:    SearchResult instances, not yet filtered
+        :rtype:     list
+        """
+        return self._fetch_page(query, 1, self.max_results)
+
+    def _fetch_page(self, query, page, page_size):
         """
-        quoted_query = urllib.quote(query)
-        url = self.url_template.format(quoted_query)
+        Searches a Solr search backend for one page of results.
+
+        :param query:       a string representing the search input from a user
+                            that should be passed through to the solr backend
+        :type  query:       basestring
+        :param page:        number of the page, starting at 1
+        :type  page:        int
+        :param page_size:   number of documents per page, or 0 for solr's
+                            default
+        :type  page_size:   int
+
+        :return:    SearchResult instances, not yet filtered
+        :rtype:     list
+        """
+        url = self._form_url(query, (page - 1) * page_size, page_size)
         _logger.debug('searching with URL: %s' % url)
 
-        body = self._get_data(url)
+        response = self._open(url)
+        try:
+            with self._reading(url):
+                return self._collect(self._parse(response))
+        finally:
+            response.close()
 
-        results = self._parse(body)
-        filtered_results = itertools.ifilter(self._filter_result, results)
-        return itertools.imap(self._format_result, filtered_results)
+    def _form_url(self, query, start, rows):
+        """
+        Inserts the query into the URL template, and adds the parameters that
+        select the fields crane uses and the requested documents, unless the
+        template already sets them.
 
-    def _parse(self, body):
+        :param query:   a string representing the search input from a user
+        :type  query:   basestring
+        :param start:   index of the first document to return
+        :type  start:   int
+        :param rows:    number of documents to return, or 0 for solr's default
+        :type  rows:    int
+
+        :return:    a full URL that can be used in a GET request
+        :rtype:     basestring
+        """
+        url = self.url_template.format(urllib.quote(query))
+        params = [('fl', ','.join(FIELDS))]
+        if rows > 0:
+            params.extend([('start', start), ('rows', rows)])
+        existing = urlparse.parse_qs(urlparse.urlsplit(url).query)
+        params = [(key, value) for key, value in params if key not in existing]
+        if params:
+            url += ('&' if '?' in url else '?') + urllib.urlencode(params)
+        return url
+
+    def _parse(self, response):
         """
-        Processes the raw response body into search results
+        Processes the response body into search results. The body is parsed as
+        it is read, so each result is yielded as soon as its document has
+        arrived.
 
-        :param body:    body from the web response object
-        :type  body:    str
+        :param response:    file-like object with the body of the web response
+        :type  response:    file
 
         :return:    generator of SearchResult instances
         :rtype:     generator
+
+        :raises exceptions.HTTPError:   if the body cannot be parsed
+        :raises IOError:                if the response cannot be read
+        :raises httplib.HTTPException:  if the response is not valid HTTP
         """
         try:
-            data = json.loads(body)
-            for item in data['response']['docs']:
+            for item in _iter_docs(response):
                 description = item.get('ir_description', item.get('publishedAbstract'))
                 trusted = item.get('ir_automated', SearchResult.result_defaults['is_trusted'])
                 automated = item.get('ir_official', SearchResult.result_defaults['is_official'])
@@ -77,24 +132,169 @@ class Solr(HTTPBackend):
                         else False
                     yield SearchResult(name, description, trusted, automated,
                                        stars, should_filter)
+        except (IOError, httplib.HTTPException):
+            # reading the response failed, not parsing it
+            raise
         except Exception, e:
             _logger.error('could not parse response body: %s' % e)
             _logger.exception('could not parse response')
             raise exceptions.HTTPError(httplib.BAD_GATEWAY,
                                        'error communicating with backend search service')
 
-    def _filter_result(self, result):
+
+def _iter_docs(response):
+    """
+    :param response:    file-like object with the JSON body of a solr response
+    :type  response:    file
+
+    :return:    generator of the documents in "response" > "docs", each
+                decoded as soon as it has been read
+    :rtype:     generator
+
+    :raises ValueError: if the body is not valid JSON, or has no documents
+    """
+    reader = _JSONReader(response)
+    found = False
+    reader.expect('{')
+    for key in reader.members():
+        if key != 'response':
+            reader.decode()
+            continue
+        reader.expect('{')
+        for response_key in reader.members():
+            if response_key != 'docs':
+                reader.decode()
+                continue
+            found = True
+            reader.expect('[')
+            for doc in reader.elements():
+                yield doc
+    reader.expect_end()
+    if not found:
+        raise ValueError('response has no docs')
+
+
+class _JSONReader(object):
+    """
+    Reads a JSON document from a file-like object as it is needed. The caller
+    walks the document's objects and arrays, and decodes each value it does
+    not walk into.
+    """
+    _WHITESPACE = ' \t\n\r'
+    # what may be left of the buffer after a number that is not complete yet
+    _NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+    def __init__(self, response):
+        """
+        :param response:    file-like object with a JSON document
+        :type  response:    file
+        """
+        self._response = response
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def expect(self, char):
+        """
+        Consume the next character that is not whitespace.
+
+        :raises ValueError: if it is not the expected one
+        """
+        if self._next() != char:
+            raise ValueError('expected %r' % char)
+
+    def expect_end(self):
+        """
+        :raises ValueError: if there is anything but whitespace left
+        """
+        if self._peek() != '':
+            raise ValueError('extra data')
+
+    def members(self):
+        """
+        Iterate over the members of the object whose "{" was just consumed.
+        Each value must be decoded or walked before the next key is requested.
+
+        :return:    generator of the keys of the object
+        :rtype:     generator
         """
-        Overrides _filter_result of HTTPBackend. If the result object does not represent an ISV
-        repository, authorize it otherwise skip authorization
+        if self._peek() == '}':
+            self._next()
+            return
+        while True:
+            key = self.decode()
+            if not isinstance(key, basestring):
+                raise ValueError('expected a key')
+            self.expect(':')
+            yield key
+            char = self._next()
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('expected "," or "}"')
 
-        :param result:  one search result
-        :type  result:  SearchResult
-        :return:    True if either the repository is known and the user is authorized or
-                    if authorization can be skipped else False
-        :rtype:     bool
+    def elements(self):
         """
-        if result.should_filter:
-            return super(Solr, self)._filter_result(result)
-        else:
-            return True
+        Iterate over the elements of the array whose "[" was just consumed.
+
+        :return:    generator of the decoded elements of the array
+        :rtype:     generator
+        """
+        if self._peek() == ']':
+            self._next()
+            return
+        while True:
+            yield self.decode()
+            char = self._next()
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('expected "," or "]"')
+
+    def decode(self):
+        """
+        :return:    the next value
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+            else:
+                # a number might continue in the data that has not been read
+                # yet, even after a "." or an exponent that was not decoded
+                if self._eof or not isinstance(value, (int, long, float)) or \
+                        not self._NUMBER_TAIL.match(self._buffer, end):
+                    self._pos = end
+                    return value
+            self._read()
+
+    def _peek(self):
+        """
+        :return:    the next character that is not whitespace, without
+                    consuming it, or an empty string at the end of the data
+        :rtype:     str
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return self._buffer[self._pos:self._pos + 1]
+            self._read()
+
+    def _next(self):
+        char = self._peek()
+        self._pos += len(char)
+        return char
+
+    def _read(self):
+        if self._eof:
+            return
+        chunk = self._response.read(CHUNK_SIZE)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        if not chunk:
+            self._eof = True
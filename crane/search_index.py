@@ -0,0 +1,122 @@
+"""
+In-memory inverted index over the names and descriptions of the repositories
+crane serves, used by crane.search.local.LocalSearch.
+
+Repository ids are split into words at "/", "-", "_", "." and ":", so
+"redhat/rhel7-atomic" can be found by "redhat", "rhel7", "atomic" or any prefix
+of those. Queries that match no words are matched as substrings of repository
+ids instead.
+"""
+import bisect
+import re
+
+
+# characters that separate the words of a repository id or description
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+# weights of a query word matching a word of a repository id or its description
+NAME_WEIGHT = 4
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    """
+    :param text:    a repository id, description or query
+    :type  text:    basestring
+
+    :return:    distinct lowercase words in the text
+    :rtype:     set
+    """
+    return set(word for word in _SEPARATORS.split(text.lower()) if word)
+
+
+class SearchIndex(object):
+    """
+    Maps words to the repositories whose id or description contains them.
+    Instances must not be modified after they are built.
+    """
+    def __init__(self, repos):
+        """
+        :param repos:   descriptions keyed by repository id. A description may
+                        be None.
+        :type  repos:   dict
+        """
+        self.descriptions = dict(repos)
+        # weights of each repository keyed by word
+        self._postings = {}
+        for repo_id, description in self.descriptions.iteritems():
+            for word in tokenize(description or ''):
+                self._postings.setdefault(word, {})[repo_id] = DESCRIPTION_WEIGHT
+            # the namespace, which is the part of the id before a "/", is a word too
+            for word in tokenize(repo_id):
+                self._postings.setdefault(word, {})[repo_id] = NAME_WEIGHT
+        self._words = sorted(self._postings)
+        self._lowercase_ids = sorted((repo_id.lower(), repo_id) for repo_id in self.descriptions)
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def search(self, query):
+        """
+        Find the repositories that contain every word of the query, either as
+        a word or as the prefix of a word. If there are none, find the
+        repositories whose id contains the query.
+
+        Results are ranked by how well they match: an id equal to the query
+        comes first, then ids that start with it, then by the sum of the
+        weights of the matched words, where a whole word counts twice as much
+        as a prefix. Ties are broken by repository id.
+
+        :param query:   search input from a user
+        :type  query:   basestring
+
+        :return:    ids of matching repositories, best match first
+        :rtype:     list
+        """
+        query = query.strip().lower()
+        words = tokenize(query)
+        if not words:
+            return []
+
+        scores = None
+        for word in words:
+            word_scores = self._match_word(word)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict((repo_id, score + word_scores[repo_id])
+                              for repo_id, score in scores.iteritems()
+                              if repo_id in word_scores)
+            if not scores:
+                break
+
+        if not scores:
+            scores = dict((repo_id, 0) for lowercase_id, repo_id in self._lowercase_ids
+                          if query in lowercase_id)
+
+        return sorted(scores, key=lambda repo_id: self._rank(repo_id, query, scores[repo_id]))
+
+    def _match_word(self, word):
+        """
+        :param word:    one word of a query
+        :type  word:    basestring
+
+        :return:    scores of the repositories that have a word starting with
+                    the given one, keyed by repository id
+        :rtype:     dict
+        """
+        scores = {}
+        start = bisect.bisect_left(self._words, word)
+        for index in xrange(start, len(self._words)):
+            indexed_word = self._words[index]
+            if not indexed_word.startswith(word):
+                break
+            factor = 2 if indexed_word == word else 1
+            for repo_id, weight in self._postings[indexed_word].iteritems():
+                scores[repo_id] = max(scores.get(repo_id, 0), weight * factor)
+        return scores
+
+    @staticmethod
+    def _rank(repo_id, query, score):
+        lowercase_id = repo_id.lower()
+        return (lowercase_id != query, not lowercase_id.startswith(query), -score, repo_id)
@@ -0,0 +1,404 @@
+"""
+Read-only metadata tables that live in a memory-mapped file, so that every web
+server process on a host shares one copy of the repository and image data
+through the page cache instead of each holding its own.
+
+A store directory holds one file per generation of the data and a "current"
+symlink that points at the newest one. A new generation is written to a new
+file and published by atomically replacing the symlink; processes that still
+have an older generation mapped keep using it until they reload.
+
+Each generation file contains a header, the pickled records of every table, and
+for each table an array of (key hash, offset, length) entries sorted by hash,
+which is binary searched on lookup. The same format is used for the metadata
+index, see crane.index.
+
+Unpickling data can run arbitrary code, so a generation file is only opened if
+no user other than root and the current one can have written it.
+
+Unpickling a record costs time in proportion to its size, which for a repository
+with many tags is far more than the rest of a request. The records found by key
+are therefore kept in a small LRU cache in each process, so that only the
+repositories that are requested most often exist in every process. Each table
+that is opened with caching gets a cache of its own, so that a burst of lookups
+in one table cannot evict the records of another.
+"""
+import collections
+from contextlib import contextmanager
+import cPickle
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+
+from . import cache
+
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = 'CRANESTR'
+# bump this whenever the file layout or the pickled values change, including
+# changes to the namedtuples in crane.data
+FORMAT_VERSION = 7
+# magic, format version, source digest, directory offset, directory length
+HEADER = struct.Struct('!8sI32sQQ')
+# key hash, record offset, record length
+ENTRY = struct.Struct('!QQI')
+
+CURRENT_LINK = 'current'
+LOCK_FILE = 'lock'
+GENERATION_PREFIX = 'generation-'
+
+# caches of decoded (key, value) records keyed by table name. Each cache is keyed
+# by (generation path, key), and must be cleared when a process switches to
+# another generation.
+record_caches = {}
+# maximum number of records in each cache in record_caches
+record_cache_size = 1000
+
+
+class InvalidStoreError(ValueError):
+    """
+    Raised when a generation file is truncated, corrupt or in an unsupported format.
+    """
+    pass
+
+
+def _key_hash(key):
+    """
+    :param key: key of a table entry
+    :type  key: basestring
+
+    :return:    64 bit hash of the key that is stable across processes
+    :rtype:     int
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return struct.unpack('!Q', hashlib.sha1(key).digest()[:8])[0]
+
+
+def record_cache(name):
+    """
+    :param name:    name of a table
+    :type  name:    basestring
+
+    :return:    the cache of decoded records of the tables with that name,
+                created on first use
+    :rtype:     crane.cache.LRUCache
+    """
+    records = record_caches.get(name)
+    if records is None:
+        records = record_caches.setdefault(name, cache.LRUCache(record_cache_size))
+    return records
+
+
+def resize_record_caches(size):
+    """
+    :param size:    maximum number of records in each table's cache. 0
+                    disables caching.
+    :type  size:    int
+    """
+    global record_cache_size
+    record_cache_size = size
+    for records in record_caches.values():
+        records.resize(size)
+
+
+def clear_record_caches():
+    for records in record_caches.values():
+        records.clear()
+
+
+def fingerprint_digest(fingerprints):
+    """
+    :param fingerprints:    fingerprint of each metadata file, keyed by path
+    :type  fingerprints:    dict
+
+    :return:    sha256 digest identifying the exact set and versions of the files
+    :rtype:     str
+    """
+    digest = hashlib.sha256()
+    for path in sorted(fingerprints):
+        digest.update('%s\0%r\0' % (path, fingerprints[path]))
+    return digest.digest()
+
+
+class MappedTable(collections.Mapping):
+    """
+    Read-only dictionary whose items are unpickled from a memory-mapped
+    generation file on access.
+    """
+    def __init__(self, mapped, offset, count, records=None, path=None):
+        """
+        :param mapped:  memory map of a generation file
+        :type  mapped:  mmap.mmap
+        :param offset:  offset of this table's entry array in the file
+        :type  offset:  int
+        :param count:   number of entries in the table
+        :type  count:   int
+        :param records: cache to keep the records found by key in, or None
+        :type  records: crane.cache.LRUCache
+        :param path:    path of the generation file, which identifies the
+                        table's records in the cache
+        :type  path:    basestring
+        """
+        self._mapped = mapped
+        self._offset = offset
+        self._count = count
+        self._records = records
+        self._path = path
+
+    def _entry(self, index):
+        return ENTRY.unpack_from(self._mapped, self._offset + index * ENTRY.size)
+
+    def _record(self, index):
+        key_hash, offset, length = self._entry(index)
+        return cPickle.loads(self._mapped[offset:offset + length])
+
+    def _find(self, key):
+        """
+        :return:    tuple of (key, value) for the given key, or None if not found
+        :rtype:     tuple
+        """
+        if self._records is None:
+            return self._search(key)
+        cache_key = (self._path, key)
+        record = self._records.get(cache_key)
+        if record is None:
+            record = self._search(key)
+            # unknown keys are not cached, so requests for made-up names
+            # cannot push out the records of real repositories
+            if record is not None:
+                self._records.set(cache_key, record)
+        return record
+
+    def _search(self, key):
+        """
+        :return:    tuple of (key, value) for the given key, unpickled from the
+                    mapped file, or None if not found
+        :rtype:     tuple
+        """
+        key_hash = _key_hash(key)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key_hash:
+                low = middle + 1
+            else:
+                high = middle
+        # different keys may share a hash, so compare the actual keys
+        while low < self._count and self._entry(low)[0] == key_hash:
+            record = self._record(low)
+            if record[0] == key:
+                return record
+            low += 1
+        return None
+
+    def __getitem__(self, key):
+        record = self._find(key)
+        if record is None:
+            raise KeyError(key)
+        return record[1]
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for key, value in self.iteritems():
+            yield key
+
+    def iteritems(self):
+        for index in xrange(self._count):
+            yield self._record(index)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [value for key, value in self.iteritems()]
+
+
+class Generation(object):
+    """
+    One memory-mapped generation file.
+    """
+    def __init__(self, path, cached_tables=()):
+        """
+        :param path:            full path to a generation file
+        :type  path:            basestring
+        :param cached_tables:   names of the tables whose records are cached
+                                after they are found by key, see record_cache()
+        :type  cached_tables:   collection
+
+        :raises IOError:            if the file cannot be read
+        :raises InvalidStoreError:  if the file is not a valid generation file
+        """
+        self.path = path
+        with open(path, 'rb') as generation_file:
+            _check_owner(path, os.fstat(generation_file.fileno()))
+            try:
+                self._mapped = mmap.mmap(generation_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                raise InvalidStoreError('%s is not a crane store' % path)
+        if len(self._mapped) < HEADER.size:
+            raise InvalidStoreError('%s is not a crane store' % path)
+        magic, version, self.source_digest, offset, length = HEADER.unpack_from(self._mapped)
+        if magic != MAGIC:
+            raise InvalidStoreError('%s is not a crane store' % path)
+        if version != FORMAT_VERSION:
+            raise InvalidStoreError('store format version %d not supported' % version)
+        if offset + length > len(self._mapped):
+            raise InvalidStoreError('%s is truncated' % path)
+        directory = cPickle.loads(self._mapped[offset:offset + length])
+        self.tables = {}
+        for name, (table_offset, count) in directory.iteritems():
+            records = record_cache(name) if name in cached_tables else None
+            self.tables[name] = MappedTable(self._mapped, table_offset, count, records, path)
+
+    def table(self, name):
+        """
+        :param name:    name the table was published with
+        :type  name:    basestring
+
+        :return:    the table
+        :rtype:     MappedTable
+        """
+        return self.tables[name]
+
+
+def _check_owner(path, file_stat):
+    """
+    :param path:        full path to a generation file
+    :type  path:        basestring
+    :param file_stat:   result of stat'ing the open file
+    :type  file_stat:   posix.stat_result
+
+    :raises InvalidStoreError:  if a user other than root and the current one
+                                owns the file or may write to it
+    """
+    if file_stat.st_uid not in (0, os.geteuid()) or \
+            file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise InvalidStoreError('%s may be written by other users' % path)
+
+
+def open_current(store_dir, cached_tables=()):
+    """
+    Open the generation that is currently published in the store directory.
+
+    :param store_dir:       full path to the store directory
+    :type  store_dir:       basestring
+    :param cached_tables:   names of the tables whose records are cached, see
+                            Generation
+    :type  cached_tables:   collection
+
+    :return:    the current generation, or None if there is no usable one
+    :rtype:     Generation
+    """
+    try:
+        return Generation(os.path.realpath(os.path.join(store_dir, CURRENT_LINK)),
+                          cached_tables)
+    except (IOError, InvalidStoreError), e:
+        _logger.info('no usable generation in %s: %s' % (store_dir, str(e)))
+        return None
+
+
+@contextmanager
+def lock(store_dir):
+    """
+    Hold an exclusive lock on the store directory, so that only one process at
+    a time decides whether a new generation needs to be published.
+
+    :param store_dir:   full path to the store directory
+    :type  store_dir:   basestring
+    """
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    with open(os.path.join(store_dir, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def publish(store_dir, source_digest, tables):
+    """
+    Write a new generation file and make it the current one. Generation files
+    other than the new and the previous one are removed; processes that still
+    have them mapped are not affected.
+
+    :param store_dir:       full path to the store directory
+    :type  store_dir:       basestring
+    :param source_digest:   digest of the metadata files the tables were built
+                            from, see fingerprint_digest()
+    :type  source_digest:   str
+    :param tables:          dictionaries to publish, keyed by table name
+    :type  tables:          dict
+
+    :return:    full path to the new generation file
+    :rtype:     basestring
+    """
+    fd, path = tempfile.mkstemp(dir=store_dir, prefix=GENERATION_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as generation_file:
+            write_tables(generation_file, source_digest, tables)
+        os.chmod(path, 0o644)
+    except Exception:
+        os.unlink(path)
+        raise
+
+    current_link = os.path.join(store_dir, CURRENT_LINK)
+    previous = os.path.realpath(current_link)
+    tmp_link = '%s.%d' % (current_link, os.getpid())
+    os.symlink(os.path.basename(path), tmp_link)
+    os.rename(tmp_link, current_link)
+
+    for name in os.listdir(store_dir):
+        old_path = os.path.join(store_dir, name)
+        if name.startswith(GENERATION_PREFIX) and old_path not in (path, previous):
+            try:
+                os.unlink(old_path)
+            except OSError:
+                pass
+    return path
+
+
+def write_tables(generation_file, source_digest, tables):
+    """
+    Write the contents of a generation file.
+
+    :param generation_file: empty file opened for writing in binary mode
+    :type  generation_file: file
+    :param source_digest:   digest of the metadata files the tables were built
+                            from, see fingerprint_digest()
+    :type  source_digest:   str
+    :param tables:          dictionaries to write, keyed by table name
+    :type  tables:          dict
+    """
+    generation_file.write('\0' * HEADER.size)
+    offset = HEADER.size
+    directory = {}
+    for name, table in tables.iteritems():
+        entries = []
+        for key, value in table.iteritems():
+            record = cPickle.dumps((key, value), cPickle.HIGHEST_PROTOCOL)
+            generation_file.write(record)
+            entries.append((_key_hash(key), offset, len(record)))
+            offset += len(record)
+        entries.sort()
+        directory[name] = (offset, len(entries))
+        for entry in entries:
+            generation_file.write(ENTRY.pack(*entry))
+        offset += len(entries) * ENTRY.size
+    serialized_directory = cPickle.dumps(directory, cPickle.HIGHEST_PROTOCOL)
+    generation_file.write(serialized_directory)
+    generation_file.seek(0)
+    generation_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, source_digest, offset,
+                                      len(serialized_directory)))
@@ -1,13 +1,42 @@
 """
 Non-public view for use by admins to see a list of repositories served by crane.
 """
+import bisect
+from collections import OrderedDict
+import httplib
+import urllib
+
 from flask import Blueprint, current_app, json, render_template, request
 
-from .. import app_util
+from .. import app_util, cache, cdn, compression, data, exceptions
+from .. import search as search_package
 
 
 section = Blueprint('crane', __name__, url_prefix='/crane')
 
+# number of repositories per page if only "page" is given
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+# number of rendered pages kept for each listing
+RENDERED_PAGES = 64
+
+# the listing of the most recent generation of the data, keyed by "v1" or "v2"
+_listings = {}
+
+
+@section.after_request
+def compress(response):
+    """
+    Compress large bodies if the client accepts it.
+
+    :param response:    flask response object for a request
+    :type  response:    flask.Response
+
+    :return:    the response
+    :rtype:     flask.Response
+    """
+    return compression.compress_response(response, app_util.get_data().get('generation'))
+
 
 @section.route('/repositories')
 @section.route('/repositories/v1')
@@ -19,12 +48,8 @@ def repositories():
     :return:    json string containing a list of docker repositories
     :rtype:     basestring
     """
-    repos_json = app_util.get_repositories()
-    if 'Accept' in request.headers and request.headers['Accept'] == 'application/json':
-        response = current_app.make_response(json.dumps(repos_json))
-        response.headers['Content-Type'] = 'application/json'
-        return response
-    return render_template("repositories.html", repos_json=repos_json, repo_type='v1')
+    return _repositories_response(app_util.get_data().get('generation'),
+                                  app_util.get_repositories, 'v1')
 
 
 @section.route('/repositories/v2')
@@ -36,9 +61,226 @@ def repositories_v2():
     :return:    json string containing a list of docker repositories
     :rtype:     basestring
     """
-    repos_json = app_util.get_v2_repositories()
-    if 'Accept' in request.headers and request.headers['Accept'] == 'application/json':
-        response = current_app.make_response(json.dumps(repos_json))
-        response.headers['Content-Type'] = 'application/json'
-        return response
-    return render_template("repositories.html", repos_json=repos_json, repo_type='v2')
+    return _repositories_response(app_util.get_v2_data().get('generation'),
+                                  app_util.get_v2_repositories, 'v2')
+
+
+def _repositories_response(generation, get_repositories, repo_type):
+    """
+    Render a listing of repositories as json or html depending on the Accept
+    header. Responds with 304 if the client already has the listing of the
+    current generation of the data.
+
+    The listing can be limited to repositories whose id starts with the
+    "prefix" query parameter, and split into pages with the "page" and
+    "per_page" query parameters. The number of matching repositories is sent in
+    the X-Total-Count header, and links to the neighbouring pages in the Link
+    header.
+
+    :param generation:          generation of the data the listing is made from
+    :type  generation:          basestring
+    :param get_repositories:    function that returns the listing
+    :type  get_repositories:    function
+    :param repo_type:           "v1" or "v2"
+    :type  repo_type:           basestring
+
+    :return:    response
+    :rtype:     flask.Response
+
+    :raises exceptions.HTTPError:   with 400 if the pagination parameters are invalid
+    """
+    as_json = 'Accept' in request.headers and request.headers['Accept'] == 'application/json'
+    prefix = request.args.get('prefix', u'')
+    page, per_page = _pagination()
+    etag = None
+    if generation:
+        etag = data.etag(u'%s\0%s\0%s\0%s\0%s\0%s' % (
+            generation, repo_type, as_json, prefix, page, per_page))
+    response = app_util.not_modified(etag)
+    if response is None:
+        listing = _get_listing(repo_type, generation, get_repositories)
+        body, total = listing.render(as_json, prefix, page, per_page)
+        response = current_app.make_response(body)
+        if as_json:
+            response.headers['Content-Type'] = 'application/json'
+        if etag:
+            response.set_etag(etag)
+        response.headers['X-Total-Count'] = str(total)
+        links = ['<%s?%s>; rel="%s"' % (request.base_url, query, rel)
+                 for rel, query in listing.neighbours(prefix, page, per_page, total)]
+        if links:
+            response.headers['Link'] = ', '.join(links)
+    response.vary.add('Accept')
+    return response
+
+
+def _pagination():
+    """
+    :return:    tuple of the requested page, starting at 1, and the number of
+                repositories per page; both None if the whole listing was requested
+    :rtype:     tuple
+
+    :raises exceptions.HTTPError:   with 400 if the parameters are invalid
+    """
+    if 'page' not in request.args and 'per_page' not in request.args:
+        return None, None
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', DEFAULT_PER_PAGE))
+    except ValueError:
+        raise exceptions.HTTPError(httplib.BAD_REQUEST, 'page and per_page must be integers')
+    if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+        message = 'page must be at least 1 and per_page between 1 and %d' % MAX_PER_PAGE
+        raise exceptions.HTTPError(httplib.BAD_REQUEST, message)
+    return page, per_page
+
+
+def _page_query(prefix, page, per_page):
+    """
+    :return:    query string that selects a page of a listing
+    :rtype:     str
+    """
+    args = [('page', page), ('per_page', per_page)]
+    if prefix:
+        args.insert(0, ('prefix', prefix.encode('utf-8')))
+    return urllib.urlencode(args)
+
+
+def _get_listing(repo_type, generation, get_repositories):
+    """
+    :return:    the listing of the given generation of the data, which is built
+                once per generation
+    :rtype:     _Listing
+    """
+    cached = _listings.get(repo_type)
+    if generation is not None and cached is not None and cached.generation == generation:
+        return cached
+    listing = _Listing(generation, repo_type, get_repositories())
+    if generation is not None:
+        _listings[repo_type] = listing
+    return listing
+
+
+class _Listing(object):
+    """
+    Listing of the repositories of one generation of the data, which renders
+    each requested page only once.
+    """
+    def __init__(self, generation, repo_type, repos_json):
+        """
+        :param generation:  generation of the data the listing is made from
+        :type  generation:  basestring
+        :param repo_type:   "v1" or "v2"
+        :type  repo_type:   basestring
+        :param repos_json:  information about each repository, keyed by repo id
+        :type  repos_json:  dict
+        """
+        self.generation = generation
+        self.repo_type = repo_type
+        self.repos_json = repos_json
+        self.names = sorted(repos_json)
+        self.rendered = cache.LRUCache(RENDERED_PAGES)
+
+    def render(self, as_json, prefix, page, per_page):
+        """
+        :param as_json:     True to render json, False to render html
+        :type  as_json:     bool
+        :param prefix:      only list repositories whose id starts with this
+        :type  prefix:      basestring
+        :param page:        page to render, starting at 1, or None for all
+        :type  page:        int
+        :param per_page:    number of repositories per page
+        :type  per_page:    int
+
+        :return:    tuple of the rendered body and the number of repositories
+                    that match the prefix
+        :rtype:     tuple
+        """
+        key = (as_json, prefix, page, per_page)
+        rendered = self.rendered.get(key)
+        if rendered is not None:
+            return rendered
+
+        start, end = self._prefix_range(prefix)
+        total = end - start
+        if page is not None:
+            start = min(start + (page - 1) * per_page, end)
+            end = min(start + per_page, end)
+        if page is None and not prefix:
+            repos_json = self.repos_json
+        else:
+            repos_json = OrderedDict((name, self.repos_json[name])
+                                     for name in self.names[start:end])
+        if as_json:
+            body = json.dumps(repos_json)
+        else:
+            neighbours = dict(self.neighbours(prefix, page, per_page, total))
+            body = render_template("repositories.html", repos_json=repos_json,
+                                   repo_type=self.repo_type, prev_query=neighbours.get('prev'),
+                                   next_query=neighbours.get('next'))
+        rendered = (body, total)
+        self.rendered.set(key, rendered)
+        return rendered
+
+    @staticmethod
+    def neighbours(prefix, page, per_page, total):
+        """
+        :return:    list of ("prev" or "next", query string) tuples for the
+                    pages before and after the given one, if they exist
+        :rtype:     list
+        """
+        if page is None:
+            return []
+        neighbours = []
+        if page > 1:
+            neighbours.append(('prev', _page_query(prefix, page - 1, per_page)))
+        if page * per_page < total:
+            neighbours.append(('next', _page_query(prefix, page + 1, per_page)))
+        return neighbours
+
+    def _prefix_range(self, prefix):
+        """
+        :return:    start and end index in self.names of the ids that start with prefix
+        :rtype:     tuple
+        """
+        start = bisect.bisect_left(self.names, prefix)
+        # matching ids are contiguous in sorted order
+        low, high = start, len(self.names)
+        while low < high:
+            middle = (low + high) // 2
+            if self.names[middle].startswith(prefix):
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+
+@section.route('/stats')
+def stats():
+    """
+    Returns a json document with the hit and miss counters of the caches in the
+    web server process that handled the request.
+
+    :return:    json string containing the counters, keyed by cache name
+    :rtype:     basestring
+    """
+    cache_stats = app_util.cache_stats()
+    cache_stats['cdn_tokens'] = cdn.signer().tokens.stats()
+    response = current_app.make_response(json.dumps(cache_stats))
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+@section.route('/search')
+def search_health():
+    """
+    Returns a json document with the state of the search backend in the web
+    server process that handled the request, including whether its circuit
+    breaker is open and how long it waits for the backend service.
+
+    :return:    json string describing the search backend
+    :rtype:     basestring
+    """
+    response = current_app.make_response(json.dumps(search_package.health()))
+    response.headers['Content-Type'] = 'application/json'
+    return response
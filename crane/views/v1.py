@@ -3,6 +3,7 @@ import httplib
 from flask import Blueprint, json, current_app, redirect, request, send_file
 
 from .. import app_util
+from .. import compression
 from .. import config
 from .. import exceptions
 from ..api import repository, images
@@ -10,6 +11,20 @@ from .. import search as search_package
 
 section = Blueprint('v1', __name__, url_prefix='/v1')
 
+# number of search results per page if a page is requested without "n", and
+# the largest "n" allowed, as in docker's registry
+DEFAULT_SEARCH_PAGE_SIZE = 25
+MAX_SEARCH_PAGE_SIZE = 100
+
+# headers that make this app look like the actual docker-registry
+REGISTRY_HEADERS = (
+    # current stable release of docker-registry
+    ('X-Docker-Registry-Version', '0.6.6'),
+    # "common" is documented by docker-registry as a valid config, but I am
+    # just guessing that it will work in our case.
+    ('X-Docker-Registry-Config', 'common'),
+)
+
 
 @section.after_request
 def add_common_headers(response):
@@ -20,6 +35,7 @@ def add_common_headers(response):
     and all others retain their default.
 
     Headers are added to make this app look like the actual docker-registry.
+    Large bodies are compressed if the client accepts it.
 
     :param response:    flask response object for a request
     :type  response:    flask.Response
@@ -32,13 +48,10 @@ def add_common_headers(response):
     content_type = response.headers.get('Content-Type', '')
     if response.status_code == 200 and not content_type.startswith('application/'):
         response.headers['Content-Type'] = 'application/json'
-    # current stable release of docker-registry
-    response.headers['X-Docker-Registry-Version'] = '0.6.6'
-    # "common" is documented by docker-registry as a valid config, but I am
-    # just guessing that it will work in our case.
-    response.headers['X-Docker-Registry-Config'] = 'common'
+    for header, value in REGISTRY_HEADERS:
+        response.headers[header] = value
 
-    return response
+    return compression.compress_response(response, app_util.get_data().get('generation'))
 
 
 @section.route('/_ping')
@@ -73,7 +86,8 @@ def repo_images(repo_id):
     Returns a json document containing a list of image IDs that are in the
     repository with the given repo_id.
 
-    Adds the "X-Docker-Endpoints" header.
+    Adds the "X-Docker-Endpoints" header. Responds with 304 if the client
+    already has the current list.
 
     :param repo_id: unique ID for the repository. May contain 0 or 1 of the "/"
                     character.
@@ -84,8 +98,8 @@ def repo_images(repo_id):
     """
     repo_id = app_util.validate_and_transform_repoid(repo_id)
 
-    images_in_repo = repository.get_images_for_repo(repo_id)
-    response = current_app.make_response(images_in_repo)
+    repo = repository.get_repo(repo_id)
+    response = _stored_json_response(repo.images_json, repo.images_etag, repo.images_gzip)
     # use the configured endpoint if any, otherwise default to the host of
     # the current request.
     configured_endpoint = current_app.config.get(config.KEY_ENDPOINT)
@@ -97,7 +111,7 @@ def repo_images(repo_id):
 def repo_tags(repo_id):
     """
     Returns a json document containing an object that maps tag names to image
-    IDs.
+    IDs. Responds with 304 if the client already has the current tags.
 
     :param repo_id: unique ID for the repository. May contain 0 or 1 of the "/"
                     character. For repo IDs that do not contain a slash, the
@@ -110,7 +124,43 @@ def repo_tags(repo_id):
     """
     repo_id = app_util.validate_and_transform_repoid(repo_id)
 
-    return repository.get_tags_for_repo(repo_id)
+    repo = repository.get_repo(repo_id)
+    return _stored_json_response(repo.tags_json, repo.tags_etag, repo.tags_gzip)
+
+
+def _stored_json_response(body, body_etag, gzipped):
+    """
+    Make a response from a json body that was serialized when the metadata was
+    loaded, see crane.data.encode_body. The stored bytes are passed to the
+    server as they are. If the client accepts gzip and a compressed body is
+    available, that is sent instead, with its own entity tag. Responds with 304
+    if the client already has the body.
+
+    :param body:        json body
+    :type  body:        str
+    :param body_etag:   strong entity tag of the body, or None
+    :type  body_etag:   str
+    :param gzipped:     gzip compressed body, or None
+    :type  gzipped:     str
+
+    :return:    response for the body
+    :rtype:     flask.Response
+    """
+    use_gzip = gzipped is not None and request.accept_encodings['gzip'] > 0
+    if use_gzip:
+        body = gzipped
+        if body_etag:
+            body_etag += '-gzip'
+    response = app_util.not_modified(body_etag)
+    if response is None:
+        response = current_app.response_class(body, mimetype='application/json')
+        if body_etag:
+            response.set_etag(body_etag)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    if gzipped is not None:
+        response.vary.add('Accept-Encoding')
+    return response
 
 
 @section.route('/repositories/<path:repo_id>/tags/<tag_name>')
@@ -150,22 +200,49 @@ def search():
     :rtype:     basestring
 
     :raises exceptions.HTTPError:   if "q" is missing in the url's parameters,
-                                    raises with 400 response coce
+                                    or "n" or "page" are invalid, raises with
+                                    400 response coce
     """
     query = request.args.get('q', '')
 
     if not query:
         raise exceptions.HTTPError(httplib.BAD_REQUEST, message='parameter "q" is required')
 
-    data = list(search_package.backend.search(query))
+    page, page_size = _search_pagination()
+    data = list(search_package.backend.search(query, page, page_size))
     response = {
         'query': query,
         'num_results': len(data),
         'results': data,
     }
+    if page is not None:
+        response['page'] = page
+        response['page_size'] = page_size
     return json.dumps(response)
 
 
+def _search_pagination():
+    """
+    :return:    tuple of the requested page of search results, starting at 1,
+                and the number of results per page; both None if all results
+                were requested
+    :rtype:     tuple
+
+    :raises exceptions.HTTPError:   with 400 if the parameters are invalid
+    """
+    if 'page' not in request.args and 'n' not in request.args:
+        return None, None
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('n', DEFAULT_SEARCH_PAGE_SIZE))
+    except ValueError:
+        raise exceptions.HTTPError(httplib.BAD_REQUEST, 'page and n must be integers')
+    if page < 1 or not 1 <= page_size <= MAX_SEARCH_PAGE_SIZE:
+        message = 'page must be at least 1 and n between 1 and %d' % MAX_SEARCH_PAGE_SIZE
+        raise exceptions.HTTPError(httplib.BAD_REQUEST, message)
+    return page, page_size
+
+
 @section.route('/images/<image_id>/<filename>')
 def images_serve_or_redirect(image_id, filename):
     """
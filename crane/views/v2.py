@@ -2,11 +2,11 @@ from __future__ import absolute_import
 import httplib
 import logging
 import os
-import urlparse
 import time
 from flask import Blueprint, json, current_app, redirect, request, send_file
+from werkzeug.http import http_date
 
-from crane import app_util, exceptions, config
+from crane import app_util, cdn, compression, exceptions, config, data, manifests
 from crane.api import repository
 
 log = logging.getLogger(__name__)
@@ -22,6 +22,7 @@ def add_common_headers(response):
     and all others retain their default.
 
     Headers are added to make this app look like the actual docker-registry.
+    Large bodies are compressed if the client accepts it.
 
     :param response:    flask response object for a request
     :type  response:    flask.Response
@@ -36,7 +37,7 @@ def add_common_headers(response):
         if not content_type.startswith('application/'):
             response.headers['Content-Type'] = 'application/json'
         response.headers['Docker-Distribution-API-Version'] = 'registry/2.0'
-    return response
+    return compression.compress_response(response, app_util.get_v2_data().get('generation'))
 
 
 @section.route('/')
@@ -62,67 +63,15 @@ def name_serve_or_redirect(relative_path):
     :param relative_path: the relative path after /v2/.
     :type relative_path:  basestring
 
-    :return:    302 redirect response
+    :return:    redirect response
     :rtype:     flask.Response
     """
-    components = app_util.validate_and_transform_repo_name(relative_path)
-    name_component, path_component, component_type = components
-    base_url = repository.get_path_for_repo(name_component)
-    if not base_url.endswith('/'):
-        base_url += '/'
-    schema2_data = repository.get_schema2_data_for_repo(name_component)
-    used_mediatype = 'application/json' if component_type != 'blobs' else 'application/octet-stream'
-
-    if component_type == 'manifests' and schema2_data is not None:
-        manifest_list_data = repository.get_manifest_list_data_for_repo(name_component)
-        manifest_list_amd64_tags = repository.get_manifest_list_amd64_for_repo(name_component)
-        if schema2_data:
-            schema2_data = json.loads(schema2_data)
-        if manifest_list_data:
-            manifest_list_data = json.loads(manifest_list_data)
-        if manifest_list_amd64_tags:
-            manifest_list_amd64_tags = json.loads(manifest_list_amd64_tags)
-        manifest, identifier = path_component.split('/')
-        if schema2_data or manifest_list_data:
-            # if it is a newer docker client it sets accept headers to manifest schema 1, 2 and list
-            # if it is an older docker client, he doesnot set any of accept headers
-            accept_headers = get_accept_headers(request)
-            schema2_mediatype = 'application/vnd.docker.distribution.manifest.v2+json'
-            manifest_list_mediatype = 'application/vnd.docker.distribution.manifest.list.v2+json'
-            # check first manifest list type
-            if manifest_list_mediatype in accept_headers and identifier in manifest_list_data:
-                path_component = os.path.join(manifest, 'list', identifier)
-                used_mediatype = manifest_list_mediatype
-            # this is needed for older clients which do not understand manifest list
-            elif identifier in manifest_list_amd64_tags.keys():
-                if schema2_mediatype in accept_headers:
-                    schema_version = manifest_list_amd64_tags[identifier][1]
-                    if schema_version == 2:
-                        used_mediatype = schema2_mediatype
-                    path_component = os.path.join(
-                        manifest, str(schema_version),
-                        manifest_list_amd64_tags[identifier][0])
-                elif manifest_list_amd64_tags[identifier][1] == 1:
-                    path_component = os.path.join(
-                        manifest, '1', manifest_list_amd64_tags[identifier][0])
-                # this is needed in case when there is no amd64 image manifest, but there are within
-                # one repo manifest list and image manifest with the same tag
-                else:
-                    path_component = os.path.join(manifest, '1', identifier)
-            elif schema2_mediatype in accept_headers and identifier in schema2_data:
-                path_component = os.path.join(manifest, '2', identifier)
-                used_mediatype = schema2_mediatype
-            else:
-                path_component = os.path.join(manifest, '1', identifier)
-        # this is needed for V3Repo which do not have schema2 manifests
-        else:
-            path_component = os.path.join(manifest, '1', identifier)
+    repo, path_component, used_mediatype, url = locate(relative_path, get_accept_headers(request))
 
     serve_content = current_app.config.get(config.KEY_SC_ENABLE)
     if serve_content:
         base_path = current_app.config.get(config.KEY_SC_CONTENT_DIR_V2)
-        repo_name = repository.get_pulp_repository_name(name_component)
-        result = os.path.join(base_path, repo_name, path_component)
+        result = os.path.join(base_path, repo.repository, path_component)
 
         try:
             return send_file(result, mimetype=used_mediatype,
@@ -130,18 +79,76 @@ def name_serve_or_redirect(relative_path):
         except OSError:
             raise exceptions.HTTPError(httplib.NOT_FOUND)
     else:
-        url = base_url + path_component
-
         # perform CDN rewrites and auth
+        now = time.time()
         url = cdn_rewrite_redirect_url(url)
-        url = cdn_auth_token_url(url)
-        return redirect(url)
+        url = cdn_auth_token_url(url, now)
+        return cacheable_redirect(url, repo, relative_path, now)
+
+
+def locate(relative_path, accept_headers):
+    """
+    Find the file a path below /v2/ refers to.
+
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+    :param accept_headers:  media types the client accepts
+    :type  accept_headers:  set
+
+    :return:    tuple of the repository, the path of the file relative to the
+                repository, its media type, and the URL it is available at
+                before CDN rewrites and auth
+    :rtype:     tuple
+
+    :raises exceptions.HTTPError:   with 404 if the path does not refer to a
+                                    repository the client may access
+    """
+    components = app_util.validate_and_transform_repo_name(relative_path)
+    name_component, path_component, component_type = components
+    repo = repository.get_v2_repo(name_component)
+    used_mediatype = 'application/json' if component_type != 'blobs' else 'application/octet-stream'
+
+    # V2Repo does not know about manifest schemas
+    if component_type == 'manifests' and isinstance(repo, (data.V3Repo, data.V4Repo)):
+        identifier = path_component.split('/')[1]
+        path_component, used_mediatype, url = manifests.route(repo, identifier, accept_headers)
+    else:
+        base_url = repo.url
+        if not base_url.endswith('/'):
+            base_url += '/'
+        url = base_url + path_component
+
+    return repo, path_component, used_mediatype, url
+
+
+def is_content_addressed(relative_path):
+    """
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+
+    :return:    True iff the path requests content by digest
+    :rtype:     bool
+    """
+    return relative_path.rsplit('/', 1)[-1].startswith('sha256:')
+
+
+def is_negotiated(relative_path):
+    """
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+
+    :return:    True iff the file the path refers to may depend on the media
+                types the client accepts, as manifests do
+    :rtype:     bool
+    """
+    return app_util.validate_and_transform_repo_name(relative_path)[2] == 'manifests'
 
 
 @section.errorhandler(exceptions.HTTPError)
 def handle_error(error):
     """
-    Creates a v2 compatible error response.
+    Creates a v2 compatible error response. Like other responses, it is
+    compressed by add_common_headers if it is large enough.
 
     :param error:   exception raised to indicate that an HTTP error response
                     should be generated and returned.
@@ -196,14 +203,10 @@ def cdn_rewrite_redirect_url(url):
     :return:    rewritten URL (if configured)
     :rtype:     string
     """
-    url_match = current_app.config.get(config.SECTION_CDN, {}).get(config.KEY_URL_MATCH)
-    url_replace = current_app.config.get(config.SECTION_CDN, {}).get(config.KEY_URL_REPLACE)
-    if url_match and url_replace:
-        return url.replace(url_match, url_replace)
-    return url
+    return cdn.signer().rewrite(url)
 
 
-def cdn_auth_token_url(url):
+def cdn_auth_token_url(url, now=None):
     """
     Adds the token auth param to the redirect URL following Akamai's Auth Token
     2.0 Specification.
@@ -213,20 +216,99 @@ def cdn_auth_token_url(url):
 
     :param url:    URL for redirect
     :type  url:    string
+    :param now:    unix timestamp the token's lifetime starts at. defaults to
+                   the current time
+    :type  now:    float
 
     :return:    URL with authorization token (if configured)
     :rtype:     string
     """
-    auth_secret = current_app.config.get(config.SECTION_CDN, {}).get(config.KEY_URL_AUTH_SECRET)
-    if auth_secret:
-        cdn_path = urlparse.urlparse(url).path
-        auth_param = current_app.config.get(config.SECTION_CDN, {}).get(config.KEY_URL_AUTH_PARAM)
-        auth_ttl = current_app.config.get(config.SECTION_CDN, {}).get(config.KEY_URL_AUTH_TTL)
-        auth_exp = int(time.time()) + auth_ttl
-        auth_algo = current_app.config.get(config.SECTION_CDN, {}).\
-            get(config.KEY_URL_AUTH_ALGO).lower()
-
-        auth_token = app_util.generate_cdn_url_token(cdn_path, auth_secret, auth_exp, auth_algo)
-        auth_qs = '?%s=%s' % (auth_param, auth_token)
-        return url + auth_qs
-    return url
+    return cdn.signer().sign(url, now)
+
+
+def cacheable_redirect(url, repo, relative_path, now):
+    """
+    Create a redirect response with the caching headers of redirect_headers.
+
+    :param url:             URL to redirect to
+    :type  url:             basestring
+    :param repo:            repository the content belongs to
+    :type  repo:            crane.data.V2Repo, crane.data.V3Repo or crane.data.V4Repo
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+    :param now:             unix timestamp the URL was signed at
+    :type  now:             float
+
+    :return:    redirect response
+    :rtype:     flask.Response
+    """
+    status, headers = redirect_headers(repo, relative_path, now)
+    response = redirect(url, code=status)
+    for name, value in headers:
+        response.headers[name] = value
+    return response
+
+
+def redirect_headers(repo, relative_path, now):
+    """
+    Decide the status and caching headers of a redirect, so that clients and
+    caches in front of crane can reuse it, for as long as redirect_caching
+    allows. Redirects for protected repositories may only be cached by the
+    client, because they depend on its entitlements. Redirects that depend on
+    the Accept header say so, so that caches do not give them to clients that
+    accept other media types.
+
+    Both the v2 view and crane.fastpath use this, so they answer alike.
+
+    :param repo:            repository the content belongs to
+    :type  repo:            crane.data.V2Repo, crane.data.V3Repo or crane.data.V4Repo
+    :param relative_path:   the relative path after /v2/
+    :type  relative_path:   basestring
+    :param now:             unix timestamp the URL was signed at
+    :type  now:             float
+
+    :return:    tuple of the redirect's status code and a list of its caching
+                headers as (name, value) tuples
+    :rtype:     tuple
+    """
+    status, max_age = redirect_caching(is_content_addressed(relative_path), now)
+    headers = [
+        ('Cache-Control', '%s, max-age=%d' % ('private' if repo.protected else 'public',
+                                              max_age)),
+        ('Expires', http_date(int(now) + max_age)),
+    ]
+    if is_negotiated(relative_path):
+        headers.append(('Vary', 'Accept'))
+    return status, headers
+
+
+def redirect_caching(content_addressed, now):
+    """
+    Decide the status of a redirect and how long it may be cached.
+
+    Redirects to content that is requested by digest can be reused for
+    "redirect_max_age" seconds, others only for "data_dir_polling_interval"
+    seconds since the tag may be moved by the next metadata update. Neither may
+    outlive the token in a signed URL.
+
+    :param content_addressed:   True iff the content was requested by digest
+    :type  content_addressed:   bool
+    :param now:                 unix timestamp the URL was signed at
+    :type  now:                 float
+
+    :return:    tuple of the redirect's status code and the number of seconds
+                it may be cached
+    :rtype:     tuple
+    """
+    status = current_app.config.get(config.KEY_REDIRECT_STATUS, httplib.FOUND)
+    if content_addressed:
+        max_age = current_app.config.get(config.KEY_REDIRECT_MAX_AGE, 0)
+    else:
+        max_age = current_app.config.get(config.KEY_DATA_POLLING_INTERVAL, 0)
+        # a permanent redirect is only correct for content that cannot change
+        if status == 308:
+            status = httplib.TEMPORARY_REDIRECT
+    token_max_age = cdn.signer().max_age(now)
+    if token_max_age is not None:
+        max_age = min(max_age, token_max_age)
+    return status, max_age
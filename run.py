@@ -1,3 +1,13 @@
+import sys
+
+from werkzeug.serving import run_simple
+
 from crane.app import create_app
+from crane import fastpath
+
 
-create_app().run(port=5001)
+if '--fastpath' in sys.argv[1:]:
+    # serve redirects with crane.fastpath, as crane.fastpath_wsgi does
+    run_simple('localhost', 5001, fastpath.create_app())
+else:
+    create_app().run(port=5001)
@@ -23,6 +23,9 @@ setup(
     install_requires=requirements,
     tests_require=test_requirements,
     test_suite='unittest2.collector',
+    entry_points={
+        'console_scripts': ['crane-index = crane.index:main'],
+    },
     package_data={
         'crane': ['data/*.conf', 'templates/*.html', 'static/css/*', 'static/js/*',
                   'static/fonts/*', 'static/img/*']
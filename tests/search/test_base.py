@@ -7,6 +7,10 @@ import mock
 
 from crane import exceptions
 from crane.search import base
+from crane.search.breaker import AdaptiveTimeout, CircuitBreaker
+from crane.search.pool import ConnectionPool
+from crane.search.results import ResultCache
+import http_server
 
 
 class TestSearchBackend(unittest2.TestCase):
@@ -22,6 +26,86 @@ class TestSearchBackend(unittest2.TestCase):
         # cause a 404 to be returned for every call.
         self.assertEqual(assertion.exception.status_code, httplib.NOT_FOUND)
 
+    def test_search_page(self):
+        self.backend.paginates = True
+
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend.search('foo', 1, 10)
+
+        self.assertEqual(assertion.exception.status_code, httplib.NOT_FOUND)
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set())
+    @mock.patch('crane.search.base.SearchBackend._fetch', spec_set=True)
+    def test_search_normalizes_query(self, mock_fetch, mock_filter):
+        mock_fetch.return_value = []
+
+        list(self.backend.search('  foo \t bar '))
+
+        mock_fetch.assert_called_once_with('foo bar')
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    @mock.patch('crane.search.base.SearchBackend._fetch', spec_set=True)
+    def test_search_cached_results_filtered(self, mock_fetch, mock_filter):
+        result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
+                                   **base.SearchResult.result_defaults)
+        mock_fetch.return_value = [result]
+        self.backend.result_cache = ResultCache(60)
+
+        mock_filter.return_value = set(['rhel'])
+        self.assertEqual(len(list(self.backend.search('foo'))), 1)
+        mock_filter.return_value = set()
+        self.assertEqual(len(list(self.backend.search('foo'))), 0)
+
+        # the backend is only asked once, but each search is filtered
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual(mock_filter.call_count, 2)
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    @mock.patch('crane.search.base.SearchBackend._fetch', spec_set=True)
+    def test_search_page_of_filtered_results(self, mock_fetch, mock_authorized):
+        mock_fetch.return_value = [
+            base.SearchResult('repo%d' % i, '', **base.SearchResult.result_defaults)
+            for i in range(10)]
+        mock_authorized.return_value = set('repo%d' % i for i in range(0, 10, 2))
+
+        results = list(self.backend.search('foo', 2, 2))
+
+        self.assertEqual([result['name'] for result in results], ['repo4', 'repo6'])
+        mock_fetch.assert_called_once_with('foo')
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    @mock.patch('crane.search.base.SearchBackend._fetch', spec_set=True)
+    def test_search_authorizes_once(self, mock_fetch, mock_authorized):
+        mock_fetch.return_value = [
+            base.SearchResult(name, '', **base.SearchResult.result_defaults)
+            for name in ('rhel', 'fedora', 'centos')]
+        mock_authorized.return_value = set(['centos', 'rhel'])
+
+        results = list(self.backend.search('foo'))
+
+        # order is kept and all names are authorized in one call
+        self.assertEqual([result['name'] for result in results], ['rhel', 'centos'])
+        self.assertEqual(mock_authorized.call_count, 1)
+        self.assertEqual(sorted(mock_authorized.call_args[0][0]), ['centos', 'fedora', 'rhel'])
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set(['rhel']))
+    def test_filter_results_skips_unfiltered(self, mock_authorized):
+        results = [base.SearchResult('rhel', '', False, False, 0, True),
+                   base.SearchResult('centos', '', False, False, 0, True),
+                   base.SearchResult('fedora', '', False, False, 0, False)]
+
+        ret_val = self.backend._filter_results(results)
+
+        self.assertEqual([result.name for result in ret_val], ['rhel', 'fedora'])
+        self.assertEqual(sorted(mock_authorized.call_args[0][0]), ['centos', 'rhel'])
+
+    @mock.patch('crane.search.base._is_served', spec_set=True, return_value=False)
+    def test_is_served_unfiltered(self, mock_is_served):
+        self.assertTrue(self.backend._is_served(base.SearchResult('fedora', '', False, False,
+                                                                  0, False)))
+        self.assertFalse(self.backend._is_served(base.SearchResult('rhel', '', False, False,
+                                                                   0, True)))
+
     def test_format_result(self):
         result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
                                    **base.SearchResult.result_defaults)
@@ -52,58 +136,134 @@ class TestSearchBackend(unittest2.TestCase):
             'should_filter': False,
         })
 
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    def test_filter_authorized_result(self, mock_name_is_authorized, mock_is_authorized):
-        result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
-                                   **base.SearchResult.result_defaults)
-        mock_name_is_authorized.side_effect = exceptions.HTTPError(
-            mock.Mock(status=404), 'not found')
-        ret = self.backend._filter_result(result)
 
-        self.assertIs(ret, True)
-        mock_is_authorized.assert_called_once_with(result.name)
+class TestHTTPBackend(unittest2.TestCase):
+    def setUp(self):
+        super(TestHTTPBackend, self).setUp()
+        self.server = http_server.Server()
+        self.server.responses = {
+            '/search': (200, 'results', {}),
+            '/slow': (200, 'results', {}),
+        }
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.backend = base.HTTPBackend()
+        self.backend.connection_pool = ConnectionPool(timeout=0.2)
+        self.addCleanup(self.backend.connection_pool.clear)
+        self.url = self.server.url + '/search'
 
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    def test_filter_authorized_result_v2(self, mock_v2_is_authorized, mock_v1_authorized):
-        result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
-                                   True, True, 8, True)
-        mock_v1_authorized.side_effect = exceptions.HTTPError(mock.Mock(status=404), 'not found')
-        ret = self.backend._filter_result(result)
+    def test_returns_response_body(self):
+        ret = self.backend._get_data(self.url)
 
-        self.assertIs(ret, True)
-        mock_v2_is_authorized.assert_called_once_with(result.name)
+        self.assertEqual(ret, 'results')
 
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    def test_filter_non_authorized_result_v2(self, mock_v2_is_authorized, mock_v1_authorized):
-        result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
-                                   True, True, 8, True)
-        mock_v1_authorized.side_effect = exceptions.HTTPError(mock.Mock(status=404), 'not found')
-        mock_v2_is_authorized.side_effect = exceptions.HTTPError(mock.Mock(status=404), 'not found')
-        ret = self.backend._filter_result(result)
+    def test_reuses_connection(self):
+        self.backend._get_data(self.url)
+        self.backend._get_data(self.url)
 
-        self.assertIs(ret, False)
-        mock_v2_is_authorized.assert_called_once_with(result.name)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.connections, 1)
 
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    def test_filter_nonauthorized_result(self, mock_name_authorized, mock_is_authorized):
-        result = base.SearchResult('rhel', 'Red Hat Enterprise Linux',
-                                   **base.SearchResult.result_defaults)
-        mock_is_authorized.side_effect = exceptions.HTTPError(httplib.NOT_FOUND)
-        mock_name_authorized.side_effect = exceptions.HTTPError(httplib.NOT_FOUND)
-        ret = self.backend._filter_result(result)
+    def test_non_200(self):
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._get_data(self.server.url + '/missing')
+
+        # bad gateway is the correct response if the backend service returns a
+        # non-200 response code.
+        self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
 
-        self.assertIs(ret, False)
-        mock_is_authorized.assert_called_once_with(result.name)
+    def test_timeout(self):
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._get_data(self.server.url + '/slow')
+
+        # make sure that a timeout talking to the backend results in the
+        # timeout error code
+        self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
 
+    def test_connection_refused(self):
+        self.server.stop()
 
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._get_data(self.url)
+
+        # make sure that a failure to connect results in the service unavailable
+        # error code
+        self.assertEqual(assertion.exception.status_code, httplib.SERVICE_UNAVAILABLE)
+
+    def test_open(self):
+        response = self.backend._open(self.url)
+        try:
+            self.assertEqual(response.read(), 'results')
+        finally:
+            response.close()
+
+    def test_open_non_200(self):
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._open(self.server.url + '/missing')
+
+        self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
+        # the rejected response does not keep its connection checked out
+        self.backend._get_data(self.url)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_circuit_breaker_opens(self):
+        self.backend.circuit_breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        self.server.stop()
+        for i in range(2):
+            with self.assertRaises(exceptions.HTTPError) as assertion:
+                self.backend._get_data(self.url)
+            self.assertEqual(assertion.exception.status_code, httplib.SERVICE_UNAVAILABLE)
+
+        with mock.patch('crane.search.pool.ConnectionPool.open', spec_set=True) as mock_open:
+            with self.assertRaises(exceptions.HTTPError) as assertion:
+                self.backend._open(self.url)
+
+        # the backend is not asked while the breaker is open
+        self.assertEqual(assertion.exception.status_code, httplib.SERVICE_UNAVAILABLE)
+        self.assertFalse(mock_open.called)
+        self.assertEqual(self.backend.health()['circuit_breaker']['state'], 'open')
+
+    def test_circuit_breaker_success(self):
+        self.backend.circuit_breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        self.assertRaises(exceptions.HTTPError, self.backend._get_data,
+                          self.server.url + '/missing')
+
+        self.backend._get_data(self.url)
+
+        self.assertEqual(self.backend.circuit_breaker.failures, 0)
+
+    def test_adaptive_timeout(self):
+        self.backend.adaptive_timeout = AdaptiveTimeout(maximum=1, minimum=0.05)
+        for i in range(AdaptiveTimeout.MIN_SAMPLES):
+            self.backend.adaptive_timeout.record(0.01)
+
+        # the slow response takes 0.5s, much more than the latencies so far
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._get_data(self.server.url + '/slow')
+
+        self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
+        self.assertEqual(len(self.backend.adaptive_timeout.latencies),
+                         AdaptiveTimeout.MIN_SAMPLES + 1)
+
+    def test_health(self):
+        self.assertEqual(self.backend.health(),
+                         {'backend': 'HTTPBackend', 'timeout': {'timeout': 0.2}})
+
+    @mock.patch('crane.search.pool.ConnectionPool.get', spec_set=True)
+    def test_invalid_response(self, mock_get):
+        mock_get.side_effect = httplib.BadStatusLine('')
+
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.backend._get_data(self.url)
+
+        self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
+
+
+@mock.patch.dict('os.environ', {'http_proxy': 'http://proxy.example.com:3128'})
 @mock.patch('urllib2.urlopen', spec_set=True)
-class TestHTTPBackend(unittest2.TestCase):
+class TestHTTPBackendProxy(unittest2.TestCase):
     def setUp(self):
-        super(TestHTTPBackend, self).setUp()
+        super(TestHTTPBackendProxy, self).setUp()
         self.backend = base.HTTPBackend()
         self.url = 'http://pulpproject.org/search'
 
@@ -127,8 +287,6 @@ class TestHTTPBackend(unittest2.TestCase):
         with self.assertRaises(exceptions.HTTPError) as assertion:
             self.backend._get_data(self.url)
 
-        # bad gateway is the correct response if the backend service returns a
-        # non-200 response code.
         self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
 
     def test_timeout(self, mock_urlopen):
@@ -137,8 +295,6 @@ class TestHTTPBackend(unittest2.TestCase):
         with self.assertRaises(exceptions.HTTPError) as assertion:
             self.backend._get_data(self.url)
 
-        # make sure that a timeout talking to the backend results in the
-        # timeout error code
         self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
 
     def test_urlerror(self, mock_urlopen):
@@ -147,6 +303,12 @@ class TestHTTPBackend(unittest2.TestCase):
         with self.assertRaises(exceptions.HTTPError) as assertion:
             self.backend._get_data(self.url)
 
-        # make sure that a failure to connect results in the service unavailable
-        # error code
         self.assertEqual(assertion.exception.status_code, httplib.SERVICE_UNAVAILABLE)
+
+    @mock.patch.dict('os.environ', {'no_proxy': 'pulpproject.org'})
+    def test_no_proxy(self, mock_urlopen):
+        with mock.patch('crane.search.pool.ConnectionPool.get', spec_set=True,
+                        return_value=(httplib.OK, 'results')):
+            self.assertEqual(self.backend._get_data(self.url), 'results')
+
+        self.assertFalse(mock_urlopen.called)
@@ -0,0 +1,102 @@
+import mock
+import unittest2
+
+from crane.search import breaker
+from crane.search.breaker import AdaptiveTimeout, CircuitBreaker
+
+
+@mock.patch('crane.search.breaker.time')
+class TestCircuitBreaker(unittest2.TestCase):
+    def setUp(self):
+        super(TestCircuitBreaker, self).setUp()
+        self.breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+
+    def test_closed(self, mock_time):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+
+    def test_success_resets_failures(self, mock_time):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+        self.assertEqual(self.breaker.failures, 1)
+
+    def test_opens(self, mock_time):
+        mock_time.time.return_value = 1000
+        for i in range(3):
+            self.breaker.record_failure()
+
+        mock_time.time.return_value = 1029
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats(),
+                         {'state': breaker.OPEN, 'failures': 3, 'retry_in': 1})
+
+    def test_half_open_allows_one_request(self, mock_time):
+        mock_time.time.return_value = 1000
+        for i in range(3):
+            self.breaker.record_failure()
+        mock_time.time.return_value = 1030
+
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, breaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, breaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_failure_reopens(self, mock_time):
+        mock_time.time.return_value = 1000
+        for i in range(3):
+            self.breaker.record_failure()
+        mock_time.time.return_value = 1030
+        self.breaker.allow()
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+        mock_time.time.return_value = 1059
+        self.assertFalse(self.breaker.allow())
+        mock_time.time.return_value = 1060
+        self.assertTrue(self.breaker.allow())
+
+
+class TestAdaptiveTimeout(unittest2.TestCase):
+    def setUp(self):
+        super(TestAdaptiveTimeout, self).setUp()
+        self.timeout = AdaptiveTimeout(maximum=2, minimum=0.1, factor=2, window=100)
+
+    def test_maximum_until_enough_samples(self):
+        for i in range(AdaptiveTimeout.MIN_SAMPLES - 1):
+            self.timeout.record(0.01)
+
+        self.assertIsNone(self.timeout.p99())
+        self.assertEqual(self.timeout.timeout(), 2)
+
+    def test_p99(self):
+        for i in range(100):
+            self.timeout.record(i / 100.0)
+
+        self.assertEqual(self.timeout.p99(), 0.98)
+        self.assertEqual(self.timeout.timeout(), 1.96)
+
+    def test_minimum(self):
+        for i in range(100):
+            self.timeout.record(0.001)
+
+        self.assertEqual(self.timeout.timeout(), 0.1)
+
+    def test_window(self):
+        for i in range(100):
+            self.timeout.record(10)
+        for i in range(100):
+            self.timeout.record(0.2)
+
+        self.assertEqual(self.timeout.timeout(), 0.4)
+        self.assertEqual(self.timeout.stats(), {'timeout': 0.4, 'p99': 0.2, 'samples': 100})
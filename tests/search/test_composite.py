@@ -0,0 +1,118 @@
+import httplib
+import threading
+import time
+
+import mock
+import unittest2
+
+from crane import exceptions
+from crane.search.base import HTTPBackend, SearchBackend, SearchResult
+from crane.search.composite import Composite
+from crane.search.results import ResultCache
+
+
+def result(name, should_filter=True):
+    return SearchResult(name, '', False, False, 0, should_filter)
+
+
+class FakeHTTPBackend(HTTPBackend):
+    def __init__(self, results=None, error=None, delay=0):
+        self.results = results or []
+        self.error = error
+        self.delay = delay
+        self.threads = []
+
+    def _fetch(self, query):
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+
+class FakeLocalBackend(SearchBackend):
+    def __init__(self, results):
+        self.results = results
+        self.threads = []
+
+    def _fetch(self, query):
+        self.threads.append(threading.current_thread())
+        return self.results
+
+
+class TestFetch(unittest2.TestCase):
+    def test_merges_in_order(self):
+        first = FakeHTTPBackend([result('a'), result('b')])
+        second = FakeHTTPBackend([result('b', False), result('c')])
+        local = FakeLocalBackend([result('d'), result('a')])
+        composite = Composite([first, second, local], 1)
+
+        results = composite._fetch('foo')
+
+        self.assertEqual(results, [result('a'), result('b'), result('c'), result('d')])
+        # HTTP backends run in the pool, others in the calling thread
+        self.assertIsNot(first.threads[0], threading.current_thread())
+        self.assertIs(local.threads[0], threading.current_thread())
+
+    def test_concurrent(self):
+        backends = [FakeHTTPBackend([result(name)], delay=0.2) for name in 'abc']
+        composite = Composite(backends, 1)
+
+        start = time.time()
+        results = composite._fetch('foo')
+
+        self.assertEqual(len(results), 3)
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_partial_failure(self):
+        failing = FakeHTTPBackend(error=exceptions.HTTPError(httplib.BAD_GATEWAY))
+        slow = FakeHTTPBackend([result('b')], delay=0.5)
+        composite = Composite([failing, FakeHTTPBackend([result('a')]), slow], 0.1)
+
+        start = time.time()
+        results = composite._fetch('foo')
+
+        self.assertEqual(results, [result('a')])
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_all_fail(self):
+        composite = Composite([
+            FakeHTTPBackend(error=exceptions.HTTPError(httplib.SERVICE_UNAVAILABLE)),
+            FakeHTTPBackend(error=exceptions.HTTPError(httplib.BAD_GATEWAY)),
+        ], 1)
+
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            composite._fetch('foo')
+
+        self.assertEqual(assertion.exception.status_code, httplib.SERVICE_UNAVAILABLE)
+
+    def test_all_time_out(self):
+        composite = Composite([FakeHTTPBackend([result('a')], delay=0.5)], 0.05)
+
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            composite._fetch('foo')
+
+        self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
+
+    def test_backend_caches_used(self):
+        backend = FakeHTTPBackend([result('a')])
+        backend.result_cache = ResultCache(60)
+        composite = Composite([backend], 1)
+
+        composite._fetch('foo')
+        composite._fetch('foo')
+
+        self.assertEqual(len(backend.threads), 1)
+
+
+class TestSearch(unittest2.TestCase):
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    def test_filters_merged_results(self, mock_authorized):
+        mock_authorized.return_value = set(['b'])
+        composite = Composite([FakeHTTPBackend([result('a'), result('b')]),
+                               FakeHTTPBackend([result('c', False)])], 1)
+
+        results = list(composite.search('foo'))
+
+        self.assertEqual([r['name'] for r in results], ['b', 'c'])
+        self.assertEqual(sorted(mock_authorized.call_args[0][0]), ['a', 'b'])
@@ -1,12 +1,15 @@
 import httplib
 import inspect
 import os
+import socket
+from StringIO import StringIO
 import urlparse
 import unittest2
 import mock
 
 from crane import exceptions
 from crane.search.base import SearchResult
+from crane.search.breaker import CircuitBreaker
 from crane.search.gsa import GSA
 
 
@@ -37,8 +40,8 @@ class TestInit(BaseGSATest):
 
 
 class TestSearch(BaseGSATest):
-    @mock.patch('crane.search.gsa.GSA._filter_result', spec_set=True, return_value=True)
-    @mock.patch('crane.search.gsa.GSA._get_data', spec_set=True)
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set(['rhel']))
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
     @mock.patch('crane.search.gsa.GSA._parse_xml')
     def test_workflow_filter_true(self, mock_parse_xml, mock_get_data, mock_filter):
         mock_parse_xml.return_value = [SearchResult('rhel', 'Red Hat Enterprise Linux',
@@ -56,8 +59,8 @@ class TestSearch(BaseGSATest):
             'should_filter': True,
         })
 
-    @mock.patch('crane.search.gsa.GSA._filter_result', spec_set=True, return_value=False)
-    @mock.patch('crane.search.gsa.GSA._get_data', spec_set=True)
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set())
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
     @mock.patch('crane.search.gsa.GSA._parse_xml')
     def test_workflow_filter_false(self, mock_parse_xml, mock_get_data, mock_filter):
         mock_parse_xml.return_value = [SearchResult('rhel', 'Red Hat Enterprise Linux',
@@ -68,6 +71,68 @@ class TestSearch(BaseGSATest):
         mock_get_data.assert_called_once_with('http://pulpproject.org/search?q=foo')
         self.assertEqual(len(list(ret)), 0)
 
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
+    def test_response_parsed_and_closed(self, mock_open):
+        mock_open.return_value = StringIO(rhel70_xml)
+        mock_open.return_value.close = mock.Mock()
+
+        results = self.gsa._fetch('foo')
+
+        self.assertEqual([result.name for result in results], ['rhel7.0', 'redhat/rhel7.0'])
+        mock_open.return_value.close.assert_called_once_with()
+
+    @mock.patch('crane.search.base._is_served', spec_set=True)
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
+    def test_max_results_stops_reading(self, mock_open, mock_is_served):
+        response = mock_open.return_value = RecordingReader(rhel70_xml)
+        mock_is_served.side_effect = lambda name: name == 'rhel7.0'
+        self.gsa.max_results = 1
+
+        results = self.gsa._fetch('foo')
+
+        self.assertEqual([result.name for result in results], ['rhel7.0'])
+        # the second result was never read
+        self.assertNotIn('redhat/rhel7.0', response.consumed)
+        self.assertTrue(response.closed)
+
+    @mock.patch('crane.search.base._is_served', spec_set=True)
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
+    def test_max_results_counts_served(self, mock_open, mock_is_served):
+        mock_open.return_value = RecordingReader(rhel70_xml)
+        mock_is_served.side_effect = lambda name: name == 'redhat/rhel7.0'
+        self.gsa.max_results = 1
+
+        results = self.gsa._fetch('foo')
+
+        self.assertEqual([result.name for result in results], ['rhel7.0', 'redhat/rhel7.0'])
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
+    def test_max_results_after_filtering(self, mock_open, mock_authorized):
+        mock_open.return_value = RecordingReader(rhel70_xml)
+        mock_authorized.return_value = set(['rhel7.0', 'redhat/rhel7.0'])
+        self.gsa.max_results = 1
+
+        with mock.patch('crane.search.base._is_served', return_value=False):
+            results = list(self.gsa.search('foo'))
+
+        self.assertEqual([result['name'] for result in results], ['rhel7.0'])
+
+    @mock.patch('crane.search.gsa.GSA._open', spec_set=True)
+    def test_read_errors(self, mock_open):
+        self.gsa.circuit_breaker = CircuitBreaker()
+        for error, status in ((socket.timeout, httplib.GATEWAY_TIMEOUT),
+                              (IOError, httplib.SERVICE_UNAVAILABLE),
+                              (httplib.IncompleteRead(''), httplib.BAD_GATEWAY)):
+            mock_open.return_value.read.side_effect = error
+
+            with self.assertRaises(exceptions.HTTPError) as assertion:
+                self.gsa._fetch('foo')
+
+            self.assertEqual(assertion.exception.status_code, status)
+        self.assertEqual(self.gsa.circuit_breaker.failures, 3)
+        self.assertEqual(mock_open.return_value.close.call_count, 3)
+
 
 class TestFormURL(unittest2.TestCase):
     def test_adds_query_param(self):
@@ -91,9 +156,28 @@ class TestFormURL(unittest2.TestCase):
         self.assertDictEqual(params, {'q': ['foo'], 'x': ['1'], 'y': ['2']})
 
 
+class RecordingReader(object):
+    """
+    File-like object that returns its data in small pieces and remembers how
+    much of it was read.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.consumed = ''
+        self.closed = False
+
+    def read(self, size=-1):
+        chunk = self.data[len(self.consumed):len(self.consumed) + 64]
+        self.consumed += chunk
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
 class TestParseXML(BaseGSATest):
     def test_success(self):
-        generator = self.gsa._parse_xml(rhel70_xml)
+        generator = self.gsa._parse_xml(StringIO(rhel70_xml))
 
         self.assertTrue(inspect.isgenerator(generator))
 
@@ -108,7 +192,7 @@ class TestParseXML(BaseGSATest):
 
     def test_no_description(self):
         """test when the description is missing from the XML"""
-        generator = self.gsa._parse_xml(rhel70_no_desc_xml)
+        generator = self.gsa._parse_xml(StringIO(rhel70_no_desc_xml))
         items = list(generator)
 
         self.assertListEqual(items, [
@@ -117,6 +201,24 @@ class TestParseXML(BaseGSATest):
 
     def test_handle_exception(self):
         with self.assertRaises(exceptions.HTTPError) as assertion:
-            list(self.gsa._parse_xml('this is not xml'))
+            list(self.gsa._parse_xml(StringIO('this is not xml')))
 
         self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
+
+    def test_yields_before_end_of_response(self):
+        response = RecordingReader(rhel70_xml)
+        generator = self.gsa._parse_xml(response)
+
+        first = next(generator)
+
+        self.assertEqual(first.name, 'rhel7.0')
+        self.assertLess(len(response.consumed), len(rhel70_xml))
+        self.assertEqual(len(list(generator)), 1)
+
+    def test_read_error(self):
+        response = mock.Mock()
+        response.read.side_effect = IOError
+
+        # errors reading the response are handled by the caller
+        with self.assertRaises(IOError):
+            list(self.gsa._parse_xml(response))
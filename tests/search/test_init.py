@@ -4,7 +4,7 @@ import unittest2
 import mock
 
 from crane import config, search
-from crane.search import SearchBackend, GSA, Solr
+from crane.search import Composite, SearchBackend, GSA, LocalSearch, Solr
 
 
 class TestLoadConfig(unittest2.TestCase):
@@ -43,3 +43,139 @@ class TestLoadConfig(unittest2.TestCase):
 
         self.assertIsInstance(search.backend, Solr)
         self.assertEqual(search.backend.url_template, fake_url)
+
+    def test_result_cache(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_SOLR: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_CACHE_TTL: 60, config.KEY_CACHE_STALE_TTL: 300,
+                                    config.KEY_CACHE_ERROR_TTL: 5, config.KEY_CACHE_SIZE: 10},
+        }
+
+        search.load_config(mock_app)
+
+        result_cache = search.backend.result_cache
+        self.assertIsInstance(result_cache, search.ResultCache)
+        self.assertEqual(result_cache.ttl, 60)
+        self.assertEqual(result_cache.stale_ttl, 300)
+        self.assertEqual(result_cache.error_ttl, 5)
+        self.assertEqual(result_cache.entries.maxsize, 10)
+
+    def test_result_cache_disabled(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_CACHE_TTL: 60, config.KEY_CACHE_SIZE: 0},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertIsNone(search.backend.result_cache)
+
+    def test_connection_pool(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_POOL_SIZE: 3, config.KEY_POOL_IDLE_TIMEOUT: 10,
+                                    config.KEY_TIMEOUT: 2.5},
+        }
+
+        search.load_config(mock_app)
+
+        pool = search.backend.connection_pool
+        self.assertIsInstance(pool, search.ConnectionPool)
+        self.assertEqual((pool.maxsize, pool.idle_timeout, pool.timeout), (3, 10, 2.5))
+
+    def test_breaker_and_adaptive_timeout(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_SOLR: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_BREAKER_THRESHOLD: 3,
+                                    config.KEY_BREAKER_RESET_TIMEOUT: 10,
+                                    config.KEY_ADAPTIVE_TIMEOUT: True,
+                                    config.KEY_TIMEOUT: 2.5, config.KEY_MIN_TIMEOUT: 0.5},
+        }
+
+        search.load_config(mock_app)
+
+        breaker = search.backend.circuit_breaker
+        self.assertEqual((breaker.threshold, breaker.reset_timeout), (3, 10))
+        timeout = search.backend.adaptive_timeout
+        self.assertEqual((timeout.maximum, timeout.minimum), (2.5, 0.5))
+        self.assertEqual(search.health()['circuit_breaker']['state'], 'closed')
+
+    def test_breaker_and_adaptive_timeout_disabled(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_BREAKER_THRESHOLD: 0,
+                                    config.KEY_ADAPTIVE_TIMEOUT: False},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertIsNone(search.backend.circuit_breaker)
+        self.assertIsNone(search.backend.adaptive_timeout)
+
+    def test_max_results(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_MAX_RESULTS: 25},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertEqual(search.backend.max_results, 25)
+
+    def test_local(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_SEARCH: {config.KEY_SEARCH_LOCAL: True},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertIsInstance(search.backend, LocalSearch)
+        self.assertIsNone(search.backend.result_cache)
+
+    def test_external_backend_preferred_to_local(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_SOLR: {config.KEY_URL: 'http://pulpproject.org/search'},
+            config.SECTION_SEARCH: {config.KEY_SEARCH_LOCAL: True},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertIsInstance(search.backend, Solr)
+
+    def test_composite(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/gsa'},
+            config.SECTION_SOLR: {config.KEY_URL: 'http://pulpproject.org/solr?q={0}'},
+            config.SECTION_SEARCH: {config.KEY_SEARCH_LOCAL: True,
+                                    config.KEY_BACKENDS: ['solr', 'gsa', 'local'],
+                                    config.KEY_DEADLINE: 1.5, config.KEY_CACHE_TTL: 60},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertIsInstance(search.backend, Composite)
+        self.assertEqual([type(b) for b in search.backend.backends], [Solr, GSA, LocalSearch])
+        self.assertEqual(search.backend.deadline, 1.5)
+        # each remote backend caches its own results
+        self.assertIsNone(search.backend.result_cache)
+        self.assertIsInstance(search.backend.backends[0].result_cache, search.ResultCache)
+
+    def test_composite_skips_unconfigured(self):
+        mock_app = mock.MagicMock()
+        mock_app.config = {
+            config.SECTION_GSA: {config.KEY_URL: 'http://pulpproject.org/gsa'},
+            config.SECTION_SEARCH: {config.KEY_BACKENDS: ['solr', 'gsa']},
+        }
+
+        search.load_config(mock_app)
+
+        self.assertEqual([type(b) for b in search.backend.backends], [GSA])
@@ -0,0 +1,44 @@
+import mock
+import unittest2
+
+from crane.search.local import LocalSearch
+from crane.search_index import SearchIndex
+
+
+@mock.patch('crane.app_util.get_data')
+class TestSearch(unittest2.TestCase):
+    def setUp(self):
+        super(TestSearch, self).setUp()
+        self.backend = LocalSearch()
+        self.index = SearchIndex({'redhat/rhel7': 'Red Hat Enterprise Linux 7',
+                                  'redhat/rhel7-atomic': None})
+
+    @mock.patch('crane.app_util.authorized_names',
+                return_value=set(['redhat/rhel7', 'redhat/rhel7-atomic']))
+    def test_results(self, mock_filter, mock_get_data):
+        mock_get_data.return_value = {'search_index': self.index}
+
+        results = list(self.backend.search('rhel7'))
+
+        self.assertEqual(results, [
+            {'name': 'redhat/rhel7', 'description': 'Red Hat Enterprise Linux 7',
+             'is_trusted': False, 'is_official': False, 'star_count': 0,
+             'should_filter': True},
+            {'name': 'redhat/rhel7-atomic', 'description': '',
+             'is_trusted': False, 'is_official': False, 'star_count': 0,
+             'should_filter': True},
+        ])
+
+    @mock.patch('crane.app_util.authorized_names', return_value=set(['redhat/rhel7-atomic']))
+    def test_filtered(self, mock_filter, mock_get_data):
+        mock_get_data.return_value = {'search_index': self.index}
+
+        results = list(self.backend.search('rhel7'))
+
+        self.assertEqual([result['name'] for result in results], ['redhat/rhel7-atomic'])
+        self.assertEqual(mock_filter.call_count, 1)
+
+    def test_no_index(self, mock_get_data):
+        mock_get_data.return_value = {'search_index': None}
+
+        self.assertEqual(list(self.backend.search('rhel7')), [])
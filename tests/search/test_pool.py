@@ -0,0 +1,121 @@
+import httplib
+import socket
+
+import mock
+import unittest2
+
+from crane.search.pool import ConnectionPool
+import http_server
+
+
+class TestConnectionPool(unittest2.TestCase):
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        self.server = http_server.Server()
+        self.server.responses = {
+            '/search?q=foo': (200, 'results', {}),
+            '/gzip': (200, 'compressed results', {'Content-Encoding': 'gzip'}),
+            '/close': (200, 'results', {'Connection': 'close'}),
+            '/slow': (200, 'results', {}),
+        }
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.pool = ConnectionPool(maxsize=2, idle_timeout=30, timeout=0.2)
+        self.addCleanup(self.pool.clear)
+
+    def test_get(self):
+        status, body = self.pool.get(self.server.url + '/search?q=foo')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, 'results')
+        self.assertEqual(self.server.requests, [('/search?q=foo', 'gzip')])
+
+    def test_status(self):
+        status, body = self.pool.get(self.server.url + '/missing')
+
+        self.assertEqual(status, 404)
+
+    def test_reuses_connection(self):
+        for i in range(3):
+            self.assertEqual(self.pool.get(self.server.url + '/search?q=foo')[1], 'results')
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_gzip(self):
+        status, body = self.pool.get(self.server.url + '/gzip')
+
+        self.assertEqual(body, 'compressed results')
+
+    def test_server_closes(self):
+        self.pool.get(self.server.url + '/close')
+        self.pool.get(self.server.url + '/close')
+
+        self.assertEqual(self.server.connections, 2)
+
+    def test_idle_timeout(self):
+        self.pool.get(self.server.url + '/search?q=foo')
+        with mock.patch('crane.search.pool.time.time', return_value=10 ** 10):
+            self.pool.get(self.server.url + '/search?q=foo')
+
+        self.assertEqual(self.server.connections, 2)
+
+    def test_stale_connection_retried(self):
+        self.pool.get(self.server.url + '/search?q=foo')
+        # the server closes the idle connection
+        for connections in self.pool._idle.values():
+            for connection, idle_since in connections:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+
+        status, body = self.pool.get(self.server.url + '/search?q=foo')
+
+        self.assertEqual(body, 'results')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_maxsize(self):
+        connections = [self.pool._connect(mock.MagicMock(scheme='http', hostname='127.0.0.1',
+                                                         port=1))
+                       for i in range(3)]
+        for connection in connections:
+            self.pool._checkin(('http', 'host'), connection)
+
+        self.assertEqual(len(self.pool._idle[('http', 'host')]), 2)
+
+    def test_timeout(self):
+        self.assertRaises(socket.timeout, self.pool.get, self.server.url + '/slow')
+
+    def test_connection_refused(self):
+        self.server.stop()
+
+        self.assertRaises(socket.error, self.pool.get, self.server.url + '/search?q=foo')
+
+    def test_invalid_gzip(self):
+        self.server.responses['/bad'] = (200, 'x', {'Content-Encoding': 'gzip'})
+        with mock.patch('crane.search.pool.zlib.decompressobj') as mock_decompressobj:
+            mock_decompressobj.return_value.decompress.side_effect = http_server.zlib.error
+            self.assertRaises(httplib.HTTPException, self.pool.get, self.server.url + '/bad')
+
+    def test_open_reads_incrementally(self):
+        self.server.responses['/large'] = (200, 'x' * 100000, {'Content-Encoding': 'gzip'})
+        response = self.pool.open(self.server.url + '/large')
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(10), 'x' * 10)
+        self.assertEqual(len(response.read()), 100000 - 10)
+        self.assertEqual(response.read(10), '')
+        response.close()
+        response.close()
+
+        # the whole body was read, so the connection is reused
+        self.pool.get(self.server.url + '/search?q=foo')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_open_closed_early(self):
+        self.server.responses['/large'] = (200, 'x' * 100000, {})
+        response = self.pool.open(self.server.url + '/large')
+        response.read(10)
+        response.close()
+
+        # the rest of the body was not read, so the connection can not be reused
+        self.assertEqual(self.pool.get(self.server.url + '/search?q=foo')[1], 'results')
+        self.assertEqual(self.server.connections, 2)
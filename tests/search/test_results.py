@@ -0,0 +1,179 @@
+import httplib
+import threading
+
+import mock
+import unittest2
+
+from crane import exceptions
+from crane.search.results import ResultCache
+
+
+@mock.patch('crane.search.results.time')
+class TestResultCache(unittest2.TestCase):
+    def setUp(self):
+        super(TestResultCache, self).setUp()
+        self.cache = ResultCache(ttl=60, stale_ttl=300, error_ttl=5)
+        self.fetch = mock.MagicMock(return_value=iter(['result']))
+
+    def test_fetch(self, mock_time):
+        mock_time.time.return_value = 1000
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+
+        self.fetch.assert_called_once_with('foo')
+
+    def test_fresh(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 1059
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_keyed_by_query(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.fetch.side_effect = lambda query: [query]
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['foo'])
+        self.assertEqual(self.cache.get('bar', self.fetch), ['bar'])
+
+    def test_expired(self, mock_time):
+        self.cache.stale_ttl = 0
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 1060
+        self.fetch.return_value = ['new']
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['new'])
+
+    def test_stale_while_revalidate(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 1100
+        release = threading.Event()
+
+        def fetch(query):
+            release.wait()
+            return ['new']
+
+        # the stale results are returned without waiting for the new ones
+        self.assertEqual(self.cache.get('foo', fetch), ['result'])
+        current = self.cache._fetches['foo']
+        release.set()
+        current.done.wait(5)
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['new'])
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_failed_refresh_keeps_stale(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 1100
+        release = threading.Event()
+
+        def fetch(query):
+            release.wait()
+            raise exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+
+        self.cache.get('foo', fetch)
+        current = self.cache._fetches['foo']
+        release.set()
+        current.done.wait(5)
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+
+    def test_too_stale(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 1360
+        self.fetch.return_value = ['new']
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['new'])
+
+    def test_error_cached(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.fetch.side_effect = exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+
+        for i in range(2):
+            with self.assertRaises(exceptions.HTTPError) as assertion:
+                self.cache.get('foo', self.fetch)
+            self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
+
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_error_expired(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.fetch.side_effect = exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+        self.assertRaises(exceptions.HTTPError, self.cache.get, 'foo', self.fetch)
+        mock_time.time.return_value = 1005
+        self.fetch.side_effect = None
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+
+    def test_error_not_cached(self, mock_time):
+        self.cache.error_ttl = 0
+        mock_time.time.return_value = 1000
+        self.fetch.side_effect = exceptions.HTTPError(httplib.GATEWAY_TIMEOUT)
+
+        self.assertRaises(exceptions.HTTPError, self.cache.get, 'foo', self.fetch)
+        self.assertRaises(exceptions.HTTPError, self.cache.get, 'foo', self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_old_results_served_on_error(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        # too old to be served while refreshing
+        mock_time.time.return_value = 2000
+        self.fetch.side_effect = exceptions.HTTPError(httplib.SERVICE_UNAVAILABLE)
+
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+        # the error is cached, but the old results are still served
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+        self.assertEqual(self.fetch.call_count, 2)
+        mock_time.time.return_value = 2005
+        self.assertEqual(self.cache.get('foo', self.fetch), ['result'])
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_old_results_not_served_on_other_errors(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.get('foo', self.fetch)
+        mock_time.time.return_value = 2000
+        self.fetch.side_effect = ValueError
+
+        self.assertRaises(ValueError, self.cache.get, 'foo', self.fetch)
+
+    def test_other_errors_not_cached(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.fetch.side_effect = ValueError
+
+        self.assertRaises(ValueError, self.cache.get, 'foo', self.fetch)
+        self.assertRaises(ValueError, self.cache.get, 'foo', self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_coalesced(self, mock_time):
+        mock_time.time.return_value = 1000
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch(query):
+            calls.append(query)
+            started.set()
+            release.wait()
+            return ['result']
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(self.cache.get('foo', fetch)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(self.cache.get('foo', fetch)))
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(calls, ['foo'])
+        self.assertEqual(results, [['result'], ['result']])
@@ -1,12 +1,15 @@
 import httplib
 import json
+import socket
+from StringIO import StringIO
 
 import mock
 import unittest2
 
 from crane import exceptions
-from crane.search import Solr
+from crane.search import Solr, solr
 from crane.search.base import SearchResult
+from crane.search.breaker import CircuitBreaker
 
 
 class BaseSolrTest(unittest2.TestCase):
@@ -21,15 +24,20 @@ class TestInit(BaseSolrTest):
         self.assertEqual(self.solr.url_template, self.url)
 
 
+fields = 'fl=allTitle%2Cc_pull_command%2CdocumentKind%2Cir_automated%2Cir_description' \
+    '%2Cir_official%2Cir_stars%2CpublishedAbstract'
+
+
 class TestSearch(BaseSolrTest):
-    @mock.patch('crane.search.solr.Solr._get_data')
-    def test_quotes_query(self, mock_parse):
+    @mock.patch('crane.search.solr.Solr._open')
+    def test_quotes_query(self, mock_open):
+        mock_open.return_value = StringIO('{"response": {"docs": []}}')
         self.solr.search('hi mom')
 
-        mock_parse.assert_called_once_with(self.url.format('hi%20mom'))
+        mock_open.assert_called_once_with(self.url.format('hi%20mom') + '&' + fields)
 
-    @mock.patch('crane.search.solr.Solr._filter_result', spec_set=True, return_value=True)
-    @mock.patch('crane.search.solr.Solr._get_data', spec_set=True)
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set(['rhel']))
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
     @mock.patch('crane.search.solr.Solr._parse')
     def test_workflow_filter_true(self, mock_parse, mock_get_data, mock_filter):
         mock_parse.return_value = [
@@ -38,7 +46,7 @@ class TestSearch(BaseSolrTest):
 
         ret = self.solr.search('foo')
 
-        mock_get_data.assert_called_once_with('http://pulpproject.org/search?q=foo')
+        mock_get_data.assert_called_once_with('http://pulpproject.org/search?q=foo&' + fields)
         self.assertDictEqual(list(ret)[0], {
             'name': 'rhel',
             'description': 'Red Hat Enterprise Linux',
@@ -48,8 +56,8 @@ class TestSearch(BaseSolrTest):
             'should_filter': True
         })
 
-    @mock.patch('crane.search.solr.Solr._filter_result', spec_set=True, return_value=False)
-    @mock.patch('crane.search.solr.Solr._get_data', spec_set=True)
+    @mock.patch('crane.app_util.authorized_names', spec_set=True, return_value=set())
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
     @mock.patch('crane.search.solr.Solr._parse')
     def test_workflow_filter_true_with_defaults(self, mock_parse, mock_get_data, mock_filter):
         mock_parse.return_value = [SearchResult('rhel', 'Red Hat Enterprise Linux',
@@ -57,78 +65,13 @@ class TestSearch(BaseSolrTest):
 
         ret = self.solr.search('foo')
 
-        mock_get_data.assert_called_once_with('http://pulpproject.org/search?q=foo')
+        mock_get_data.assert_called_once_with('http://pulpproject.org/search?q=foo&' + fields)
         self.assertEqual(len(list(ret)), 0)
 
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True, return_value=True)
-    def test_workflow_filter_true_with_image_repository_document_kind(self, mock_is_authorized,
-                                                                      mock_name_authorized):
-        """
-        When the should_filter attribute of SearchResult instance is True,
-        the base implementation of the filter_results should be called and
-        the return value should be the value returned by the mocked app_util.repo_is_authorized
-        """
-        mock_name_authorized.side_effect = exceptions.HTTPError(
-            mock.Mock(status=404), 'not found')
-        result = SearchResult(
-            'rhel', 'Red Hat Enterprise Linux', False, False, 0, True)
-        ret_val = self.solr._filter_result(result)
-        self.assertEquals(ret_val, True)
-
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    def test_workflow_filter_false_with_image_repository_document_kind(self, mock_is_authorized,
-                                                                       mock_name_authorized):
-        """
-        When the should_filter attribute of SearchResult instance is True,
-        the base implementation of the filter_results should be called and
-        the return value should be based on the value returned/exception raised
-        by the mocked app_util.repo_is_authorized
-        """
-        mock_is_authorized.side_effect = exceptions.HTTPError(
-            httplib.NOT_FOUND)
-        mock_name_authorized.side_effect = exceptions.HTTPError(
-            httplib.NOT_FOUND)
-        result = SearchResult(
-            'rhel', 'Red Hat Enterprise Linux', False, False, 0, True)
-        ret_val = self.solr._filter_result(result)
-        self.assertEquals(ret_val, False)
-
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    def test_workflow_filter_false_with_should_filter_false(self, mock_is_authorized):
-        """
-        When the should_filter attribute of SearchResult instance is True,
-        the base implementation of the filter_results should be called and
-        the return value should be based on the value returned/exception raised
-        by the mocked app_util.repo_is_authorized
-        """
-        mock_is_authorized.side_effect = exceptions.HTTPError(
-            httplib.NOT_FOUND)
-        result = SearchResult(
-            'rhel', 'Red Hat Enterprise Linux', False, False, 0, False)
-        ret_val = self.solr._filter_result(result)
-        self.assertEquals(ret_val, True)
-
-    @mock.patch('crane.app_util.name_is_authorized', spec_set=True)
-    @mock.patch('crane.app_util.repo_is_authorized', spec_set=True)
-    def test_workflow_filter_true_with_image_repository_with_defaults(self, mock_is_authorized,
-                                                                      mock_name_is_authorised):
-        """
-        When the should_filter attribute of SearchResult instance is default which is False,
-        the base implementation of the filter_results is not called
-        """
-        mock_name_is_authorised.side_effect = exceptions.HTTPError(
-            mock.Mock(status=404), 'not found')
-        result = SearchResult('rhel', 'Red Hat Enterprise Linux',
-                              **SearchResult.result_defaults)
-        ret_val = self.solr._filter_result(result)
-        self.assertEquals(ret_val, True)
-
 
 class TestParse(BaseSolrTest):
     def test_normal(self):
-        result = list(self.solr._parse(json.dumps(fake_body)))
+        result = list(self.solr._parse(StringIO(json.dumps(fake_body))))
 
         self.assertEqual(len(result), 1)
 
@@ -142,7 +85,7 @@ class TestParse(BaseSolrTest):
 
     def test_normal_with_document_kind_image_repository(self):
         result = list(
-            self.solr._parse(json.dumps(fake_body_with_document_kind_image_repository)))
+            self.solr._parse(StringIO(json.dumps(fake_body_with_document_kind_image_repository))))
 
         self.assertEqual(len(result), 1)
 
@@ -156,7 +99,7 @@ class TestParse(BaseSolrTest):
 
     def test_normal_with_document_kind_certified_software(self):
         result = list(
-            self.solr._parse(json.dumps(fake_body_with_document_kind_certified_software)))
+            self.solr._parse(StringIO(json.dumps(fake_body_with_document_kind_certified_software))))
 
         self.assertEqual(len(result), 1)
 
@@ -170,8 +113,8 @@ class TestParse(BaseSolrTest):
 
     def test_normal_with_document_kind_certified_software_multiple_pull(self):
         result = list(
-            self.solr._parse(json.dumps(
-                fake_body_with_document_kind_certified_software_multiple_pull)))
+            self.solr._parse(StringIO(json.dumps(
+                fake_body_with_document_kind_certified_software_multiple_pull))))
 
         self.assertEqual(len(result), 2)
 
@@ -192,12 +135,12 @@ class TestParse(BaseSolrTest):
         self.assertEqual(result[1].star_count, 7)
 
     def test_normal_with_document_kind_certified_software_no_pull_command(self):
-        result = list(self.solr._parse(
-            json.dumps(fake_body_with_document_kind_certified_software_no_pull_command)))
+        result = list(self.solr._parse(StringIO(
+            json.dumps(fake_body_with_document_kind_certified_software_no_pull_command))))
         self.assertEqual(len(result), 0)
 
     def test_normal_with_abstract(self):
-        result = list(self.solr._parse(json.dumps(fake_body_with_abstract)))
+        result = list(self.solr._parse(StringIO(json.dumps(fake_body_with_abstract))))
 
         self.assertEqual(len(result), 1)
 
@@ -210,8 +153,8 @@ class TestParse(BaseSolrTest):
         self.assertEqual(result[0].star_count, 7)
 
     def test_normal_with_abstract_and_document_kind_image_repository(self):
-        result = list(self.solr._parse(
-            json.dumps(fake_body_with_abstract_and_document_kind_image_repository)))
+        result = list(self.solr._parse(StringIO(
+            json.dumps(fake_body_with_abstract_and_document_kind_image_repository))))
 
         self.assertEqual(len(result), 1)
         self.assertTrue(isinstance(result[0], SearchResult))
@@ -223,8 +166,8 @@ class TestParse(BaseSolrTest):
         self.assertEqual(result[0].star_count, 7)
 
     def test_normal_with_abstract_and_document_kind_certified_software(self):
-        result = list(self.solr._parse(
-            json.dumps(fake_body_with_abstract_and_document_kind_certified_software)))
+        result = list(self.solr._parse(StringIO(
+            json.dumps(fake_body_with_abstract_and_document_kind_certified_software))))
 
         self.assertEqual(len(result), 1)
         self.assertTrue(isinstance(result[0], SearchResult))
@@ -236,7 +179,7 @@ class TestParse(BaseSolrTest):
         self.assertEqual(result[0].star_count, 7)
 
     def test_with_defaults(self):
-        result = list(self.solr._parse(json.dumps(fake_body_with_defaults)))
+        result = list(self.solr._parse(StringIO(json.dumps(fake_body_with_defaults))))
 
         self.assertEqual(len(result), 1)
 
@@ -252,8 +195,8 @@ class TestParse(BaseSolrTest):
             result[0].star_count, SearchResult.result_defaults['star_count'])
 
     def test_with_defaults_and_document_kind_image_repository(self):
-        result = list(self.solr._parse(
-            json.dumps(fake_body_with_defaults_and_document_kind_image_repository)))
+        result = list(self.solr._parse(StringIO(
+            json.dumps(fake_body_with_defaults_and_document_kind_image_repository))))
 
         self.assertEqual(len(result), 1)
 
@@ -269,8 +212,8 @@ class TestParse(BaseSolrTest):
             result[0].star_count, SearchResult.result_defaults['star_count'])
 
     def test_with_defaults_and_document_kind_certified_software(self):
-        result = list(self.solr._parse(
-            json.dumps(fake_body_with_defaults_and_document_kind_certified_software)))
+        result = list(self.solr._parse(StringIO(
+            json.dumps(fake_body_with_defaults_and_document_kind_certified_software))))
 
         self.assertEqual(len(result), 1)
 
@@ -287,7 +230,7 @@ class TestParse(BaseSolrTest):
 
     def test_with_defaults_and_abstract(self):
         result = list(
-            self.solr._parse(json.dumps(fake_body_with_defaults_and_abstract)))
+            self.solr._parse(StringIO(json.dumps(fake_body_with_defaults_and_abstract))))
 
         self.assertEqual(len(result), 1)
 
@@ -303,8 +246,8 @@ class TestParse(BaseSolrTest):
             result[0].star_count, SearchResult.result_defaults['star_count'])
 
     def test_with_defaults_and_abstract_and_document_kind_image_repository(self):
-        result = list(self.solr._parse(json.dumps(
-            fake_body_with_defaults_and_abstract_and_document_kind_image_repository)))
+        result = list(self.solr._parse(StringIO(json.dumps(
+            fake_body_with_defaults_and_abstract_and_document_kind_image_repository))))
 
         self.assertEqual(len(result), 1)
 
@@ -320,8 +263,8 @@ class TestParse(BaseSolrTest):
             result[0].star_count, SearchResult.result_defaults['star_count'])
 
     def test_with_defaults_and_abstract_and_document_kind_certified_software(self):
-        result = list(self.solr._parse(json.dumps(
-            fake_body_with_defaults_and_abstract_and_document_kind_certified_software)))
+        result = list(self.solr._parse(StringIO(json.dumps(
+            fake_body_with_defaults_and_abstract_and_document_kind_certified_software))))
 
         self.assertEqual(len(result), 1)
 
@@ -341,7 +284,7 @@ class TestParse(BaseSolrTest):
         when an exception occurs, it should raise an HTTPError
         """
         with self.assertRaises(exceptions.HTTPError) as assertion:
-            list(self.solr._parse('this is not valid json'))
+            list(self.solr._parse(StringIO('this is not valid json')))
 
         self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
 
@@ -350,10 +293,148 @@ class TestParse(BaseSolrTest):
         when an exception occurs, it should raise an HTTPError
         """
         with self.assertRaises(exceptions.HTTPError) as assertion:
-            list(self.solr._parse(json.dumps({})))
+            list(self.solr._parse(StringIO(json.dumps({}))))
+
+        self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
+
+    def test_truncated(self):
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            list(self.solr._parse(StringIO(json.dumps(fake_body)[:-10])))
 
         self.assertEqual(assertion.exception.status_code, httplib.BAD_GATEWAY)
 
+    def test_other_members(self):
+        body = {
+            'responseHeader': {'status': 0, 'params': {'q': '"docs": [{"allTitle": "x"}]'}},
+            'response': {'numFound': 1234567, 'start': 0, 'docs': fake_body['response']['docs']},
+            'facet_counts': {'facet_fields': {'documentKind': ['ImageRepository', 1]}},
+        }
+
+        result = list(self.solr._parse(PieceReader(json.dumps(body, indent=2), 7)))
+
+        self.assertEqual([item.name for item in result], ['foo/bar'])
+
+    def test_yields_before_end_of_response(self):
+        docs = [{'allTitle': 'foo/%d' % i, 'documentKind': 'ImageRepository'}
+                for i in range(1000)]
+        response = PieceReader(json.dumps({'response': {'docs': docs}}), 100)
+        generator = self.solr._parse(response)
+
+        self.assertEqual(next(generator).name, 'foo/0')
+        self.assertLess(response.offset, len(response.data))
+        self.assertEqual(len(list(generator)), 999)
+        self.assertEqual(response.offset, len(response.data))
+
+    def test_numbers_split_between_reads(self):
+        # values that are not walked into are decoded on their own, so a number
+        # must not be decoded before all of it has been read
+        body = ('{"maxScore": 1.5, "response": {"numFound": 10, "start": -12.25E-3, '
+                '"docs": [{"allTitle": "foo/bar"}], "score": 2e+10}, "qTime": 0}')
+        expected = json.loads(body)['response']['docs']
+
+        for offset in range(1, len(body)):
+            response = PieceReader(body, [offset, len(body)])
+
+            self.assertEqual(list(solr._iter_docs(response)), expected,
+                             'split at offset %d' % offset)
+
+
+class TestFetchPage(BaseSolrTest):
+    def setUp(self):
+        super(TestFetchPage, self).setUp()
+        docs = [{'allTitle': 'foo/%d' % i, 'documentKind': 'ImageRepository'}
+                for i in range(1000)]
+        self.body = json.dumps({'response': {'docs': docs}})
+
+    def test_form_url(self):
+        url = self.solr._form_url('foo', 50, 25)
+
+        self.assertEqual(url, 'http://pulpproject.org/search?q=foo&%s&start=50&rows=25' % fields)
+
+    def test_form_url_template_params_kept(self):
+        solr = Solr('http://pulpproject.org/search?q={0}&rows=5&fl=allTitle')
+
+        url = solr._form_url('foo', 0, 25)
+
+        self.assertEqual(url, 'http://pulpproject.org/search?q=foo&rows=5&fl=allTitle&start=0')
+
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
+    def test_page_requested(self, mock_open):
+        mock_open.return_value = StringIO(self.body)
+
+        results = self.solr._fetch_page('foo', 3, 10)
+
+        mock_open.assert_called_once_with(self.solr._form_url('foo', 20, 10))
+        self.assertEqual(len(results), 1000)
+
+    @mock.patch('crane.search.base._is_served', spec_set=True, return_value=True)
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
+    def test_max_results_stops_reading(self, mock_open, mock_is_served):
+        response = mock_open.return_value = PieceReader(self.body, 100)
+        response.close = mock.Mock()
+        self.solr.max_results = 5
+
+        results = self.solr._fetch('foo')
+
+        mock_open.assert_called_once_with(self.solr._form_url('foo', 0, 5))
+        self.assertEqual([result.name for result in results], ['foo/%d' % i for i in range(5)])
+        self.assertLess(response.offset, len(self.body))
+        response.close.assert_called_once_with()
+
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
+    def test_read_timeout(self, mock_open):
+        mock_open.return_value.read.side_effect = socket.timeout
+        self.solr.circuit_breaker = CircuitBreaker()
+
+        with self.assertRaises(exceptions.HTTPError) as assertion:
+            self.solr._fetch_page('foo', 1, 10)
+
+        self.assertEqual(assertion.exception.status_code, httplib.GATEWAY_TIMEOUT)
+        self.assertEqual(self.solr.circuit_breaker.failures, 1)
+        mock_open.return_value.close.assert_called_once_with()
+
+    @mock.patch('crane.search.base._is_served', spec_set=True, return_value=False)
+    def test_unfiltered_results_count(self, mock_is_served):
+        self.solr.max_results = 2
+        results = [SearchResult('foo/%d' % i, '', False, False, 0, i % 2 == 0)
+                   for i in range(10)]
+
+        collected = self.solr._collect(iter(results))
+
+        self.assertEqual(collected, results[:4])
+
+    @mock.patch('crane.app_util.authorized_names', spec_set=True)
+    @mock.patch('crane.search.solr.Solr._open', spec_set=True)
+    def test_search_page(self, mock_open, mock_authorized):
+        mock_open.return_value = StringIO(json.dumps(fake_body_with_document_kind_image_repository))
+        mock_authorized.return_value = set(['foo/bar'])
+
+        results = list(self.solr.search('foo', 2, 10))
+
+        mock_open.assert_called_once_with(self.solr._form_url('foo', 10, 10))
+        self.assertEqual([result['name'] for result in results], ['foo/bar'])
+
+
+class PieceReader(object):
+    """
+    File-like object that returns its data in pieces of a fixed size, or of
+    the sizes in a list, followed by the rest of the data.
+    """
+    def __init__(self, data, size):
+        self.data = data
+        self.sizes = size if isinstance(size, list) else None
+        self.size = size
+        self.offset = 0
+
+    def read(self, size=-1):
+        if self.sizes is not None:
+            size = self.sizes.pop(0) if self.sizes else len(self.data)
+        else:
+            size = self.size
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
 
 fake_body = {
     'response': {
@@ -5,6 +5,8 @@ from rhsm import certificate, certificate2
 import unittest2 as unittest
 
 from crane import app_util
+from crane import data
+from crane import entitlement
 from crane import exceptions
 from crane.data import V1Repo, V2Repo, V3Repo
 import demo_data
@@ -191,6 +193,113 @@ class TestAuthorizeImageId(FlaskContextBase):
         self.assertEquals(assertion.exception.status_code, httplib.NOT_FOUND)
 
 
+class TestAuthorizeImageIdRepoChoice(FlaskContextBase):
+
+    def setUp(self):
+        super(TestAuthorizeImageIdRepoChoice, self).setUp()
+        self.repos = {
+            'a': V1Repo('', 'a', '[]', '{}', '/content/a', True),
+            'b': V1Repo('', 'b', '[]', '{}', '/content/shared', True),
+            'c': V1Repo('', 'c', '[]', '{}', '/content/shared', True),
+            'd': V1Repo('', 'd', '[]', '{}', '/content/d', False),
+        }
+        self.ctx.request.crane_data = {'repos': self.repos, 'images': {}}
+
+    def _set_image(self, repo_ids):
+        self.ctx.request.crane_data['images']['img'] = data.ImageRepos(repo_ids, self.repos)
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_unprotected_without_cert_check(self, mock_get_cert):
+        self._set_image(['a', 'd'])
+        result = app_util.authorize_image_id(lambda image_id, repo: repo)('img')
+        self.assertTrue(result is self.repos['d'])
+        self.assertEqual(mock_get_cert.call_count, 0)
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_each_path_checked_once(self, mock_get_cert):
+        cert = mock_get_cert.return_value
+        cert.check_path.return_value = False
+        self._set_image(['a', 'b', 'c'])
+        with self.assertRaises(exceptions.HTTPError):
+            app_util.authorize_image_id(lambda image_id, repo: repo)('img')
+        self.assertEqual(sorted(c[0][0] for c in cert.check_path.call_args_list),
+                         ['/content/a', '/content/shared'])
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_lowest_authorized_repo(self, mock_get_cert):
+        cert = mock_get_cert.return_value
+        cert.check_path.side_effect = lambda path: path == '/content/shared'
+        self._set_image(['c', 'b', 'a'])
+        result = app_util.authorize_image_id(lambda image_id, repo: repo)('img')
+        self.assertTrue(result is self.repos['b'])
+
+
+class TestAuthorizedNames(FlaskContextBase):
+
+    def setUp(self):
+        super(TestAuthorizedNames, self).setUp()
+        self.ctx.request.crane_data = {'repos': {
+            'a': V1Repo('', 'a', '[]', '{}', '/content/a', True),
+            'b': V1Repo('', 'b', '[]', '{}', '/content/shared', True),
+            'c': V1Repo('', 'c', '[]', '{}', '/content/shared', True),
+            'd': V1Repo('', 'd', '[]', '{}', '/content/d', False),
+            'both': V1Repo('', 'both', '[]', '{}', '/content/v1', True),
+        }}
+        self.ctx.request.crane_data_v2 = {'repos': {
+            'v2': V2Repo('', 'v2', '/content/v2', True),
+            'both': V2Repo('', 'both', '/content/v2', True),
+        }}
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_unprotected_without_cert(self, mock_get_cert):
+        self.assertEqual(app_util.authorized_names(['d', 'unknown']), set(['d']))
+        self.assertEqual(mock_get_cert.call_count, 0)
+
+    @mock.patch('crane.app_util._get_certificate', return_value=None)
+    def test_protected_without_cert(self, mock_get_cert):
+        self.assertEqual(app_util.authorized_names(['a', 'b', 'v2', 'd']), set(['d']))
+        self.assertEqual(mock_get_cert.call_count, 1)
+
+    @mock.patch('crane.app_util._check_path')
+    @mock.patch('crane.app_util._get_certificate')
+    def test_cert_read_once(self, mock_get_cert, mock_check_path):
+        mock_check_path.side_effect = lambda cert, path: path != '/content/a'
+
+        result = app_util.authorized_names(['a', 'b', 'c', 'v2', 'a'])
+
+        self.assertEqual(result, set(['b', 'c', 'v2']))
+        self.assertEqual(mock_get_cert.call_count, 1)
+        # b and c share a path, which is only checked once
+        self.assertEqual(sorted(call[0][1] for call in mock_check_path.call_args_list),
+                         ['/content/a', '/content/shared', '/content/v2'])
+
+    @mock.patch('crane.app_util._check_path')
+    @mock.patch('crane.app_util._get_certificate')
+    def test_falls_back_to_v1(self, mock_get_cert, mock_check_path):
+        mock_check_path.side_effect = lambda cert, path: path == '/content/v1'
+
+        self.assertEqual(app_util.authorized_names(['both']), set(['both']))
+
+    @mock.patch('crane.app_util._check_path')
+    @mock.patch('crane.app_util._get_certificate')
+    def test_same_as_single_checks(self, mock_get_cert, mock_check_path):
+        mock_check_path.side_effect = lambda cert, path: path in ('/content/shared', '/content/v1')
+        names = ['a', 'b', 'c', 'd', 'v2', 'both', 'unknown']
+
+        expected = set()
+        for name in names:
+            try:
+                app_util.name_is_authorized(name)
+            except exceptions.HTTPError:
+                try:
+                    app_util.repo_is_authorized(name)
+                except exceptions.HTTPError:
+                    continue
+            expected.add(name)
+
+        self.assertEqual(app_util.authorized_names(names), expected)
+
+
 class TestHandler(unittest.TestCase):
 
     def test_default_message(self):
@@ -208,6 +317,11 @@ class TestHandler(unittest.TestCase):
 
 class TestGetCertificate(FlaskContextBase):
 
+    def setUp(self):
+        super(TestGetCertificate, self).setUp()
+        app_util.certificate_cache.clear()
+        app_util.certificate_path_cache.clear()
+
     def test_empty_cert(self):
         cert = app_util._get_certificate()
         self.assertEquals(cert, None)
@@ -226,6 +340,50 @@ class TestGetCertificate(FlaskContextBase):
         cert = app_util._get_certificate()
         self.assertTrue(isinstance(cert, certificate2.EntitlementCertificate))
 
+    @mock.patch('rhsm.certificate.create_from_pem', wraps=certificate.create_from_pem)
+    def test_cert_cached(self, mock_create):
+        with open(demo_data.demo_entitlement_cert_path) as test_cert:
+            self.ctx.request.environ['SSL_CLIENT_CERT'] = test_cert.read()
+        cert = app_util._get_certificate()
+        self.assertTrue(app_util._get_certificate() is cert)
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(app_util.certificate_cache.stats()['hits'], 1)
+
+    @mock.patch('rhsm.certificate.create_from_pem', wraps=certificate.create_from_pem)
+    def test_expired_cert_not_cached(self, mock_create):
+        with open(demo_data.demo_entitlement_cert_path) as test_cert:
+            self.ctx.request.environ['SSL_CLIENT_CERT'] = test_cert.read()
+        # well after the test certificate expires
+        with mock.patch('time.time', return_value=4102444800):
+            app_util._get_certificate()
+            app_util._get_certificate()
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertEqual(len(app_util.certificate_cache), 0)
+
+    def test_check_path_memoized(self):
+        with open(demo_data.demo_entitlement_cert_path) as test_cert:
+            self.ctx.request.environ['SSL_CLIENT_CERT'] = test_cert.read()
+        cert = app_util._get_certificate()
+        with mock.patch.object(entitlement.PathMatcher, 'match',
+                               return_value=True) as mock_match:
+            self.assertTrue(app_util._check_path(cert, '/content/foo'))
+            self.assertTrue(app_util._check_path(cert, '/content/foo'))
+        self.assertEqual(mock_match.call_count, 1)
+
+    def test_check_path_matches_cert(self):
+        with open(demo_data.demo_entitlement_cert_path) as test_cert:
+            self.ctx.request.environ['SSL_CLIENT_CERT'] = test_cert.read()
+        cert = app_util._get_certificate()
+        for path in ('/foo/path', '/foo/path/always', '/foo/bar', '/bar/path'):
+            self.assertEqual(app_util._check_path(cert, path), cert.check_path(path))
+
+    def test_check_path_uncached_cert(self):
+        cert = mock.MagicMock()
+        cert.check_path.return_value = False
+        self.assertFalse(app_util._check_path(cert, '/content/foo'))
+        self.assertFalse(app_util._check_path(cert, '/content/foo'))
+        self.assertEqual(cert.check_path.call_count, 2)
+
 
 class TestValidateAndTransformRepoID(unittest.TestCase):
     def test_more_than_one_slash(self):
@@ -299,6 +457,18 @@ class TestValidateGetRepositories(unittest.TestCase):
         ret = app_util.get_repositories()
         self.assertEqual(ret, {})
 
+    @mock.patch('crane.app_util.get_data')
+    def test_get_repositories_cached_per_generation(self, mock_get_data):
+        repo = V1Repo(url='', repository='test-repo', images_json='[]', tags_json='{}',
+                      url_path='', protected=False)
+        mock_get_data.return_value = {'repos': {'test-repo': repo}, 'generation': 'one'}
+        first = app_util.get_repositories()
+        mock_get_data.return_value = {'repos': {}, 'generation': 'one'}
+        self.assertTrue(app_util.get_repositories() is first)
+
+        mock_get_data.return_value = {'repos': {}, 'generation': 'two'}
+        self.assertEqual(app_util.get_repositories(), {})
+
 
 class TestValidateGetV2Repositories(unittest.TestCase):
 
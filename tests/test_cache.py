@@ -0,0 +1,58 @@
+import unittest2
+
+from crane import cache
+
+
+class TestLRUCache(unittest2.TestCase):
+    def setUp(self):
+        self.cache = cache.LRUCache(2)
+
+    def test_get_missing(self):
+        self.assertTrue(self.cache.get('a') is None)
+        self.assertEqual(self.cache.get('a', 'default'), 'default')
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_set_get(self):
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        # "a" becomes the most recently used
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertTrue(self.cache.get('b') is None)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_disabled(self):
+        disabled = cache.LRUCache(0)
+        disabled.set('a', 1)
+        self.assertEqual(len(disabled), 0)
+
+    def test_pop_and_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(self.cache.pop('a'), 1)
+        self.assertTrue(self.cache.pop('a') is None)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_resize(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.resize(1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_stats(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2})
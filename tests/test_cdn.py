@@ -0,0 +1,66 @@
+import mock
+import unittest2
+
+from crane import app_util, cdn, config
+
+
+CDN_CONFIG = {
+    config.KEY_URL_AUTH_SECRET: 'abc123',
+    config.KEY_URL_AUTH_PARAM: '_auth_',
+    config.KEY_URL_AUTH_TTL: 300,
+    config.KEY_URL_AUTH_ALGO: 'sha256',
+    config.KEY_URL_AUTH_CACHE_SIZE: 10,
+}
+
+
+class TestURLSigner(unittest2.TestCase):
+    def test_rewrite(self):
+        signer = cdn.URLSigner({config.KEY_URL_MATCH: 'cdn.redhat.com',
+                                config.KEY_URL_REPLACE: 'cdn.fedora.com'})
+        self.assertEqual(signer.rewrite('http://cdn.redhat.com/foo'), 'http://cdn.fedora.com/foo')
+
+    def test_rewrite_not_configured(self):
+        signer = cdn.URLSigner({config.KEY_URL_MATCH: 'cdn.redhat.com'})
+        self.assertEqual(signer.rewrite('http://cdn.redhat.com/foo'), 'http://cdn.redhat.com/foo')
+
+    def test_sign_not_configured(self):
+        signer = cdn.URLSigner({})
+        self.assertEqual(signer.sign('http://cdn.redhat.com/foo'), 'http://cdn.redhat.com/foo')
+
+    def test_token_matches_generate_cdn_url_token(self):
+        for algorithm in config.VALID_AUTH_ALGO:
+            signer = cdn.URLSigner(dict(CDN_CONFIG, url_auth_algo=algorithm))
+            self.assertEqual(signer.token('/content/repo/manifests/123', 1933027200),
+                             app_util.generate_cdn_url_token('/content/repo/manifests/123',
+                                                             'abc123', 1933027200, algorithm))
+
+    @mock.patch('time.time', return_value=1000000.5)
+    def test_sign(self, mock_time):
+        signer = cdn.URLSigner(CDN_CONFIG)
+        url = signer.sign('http://cdn.redhat.com/content/foo')
+        token = app_util.generate_cdn_url_token('/content/foo', 'abc123', 1000300, 'sha256')
+        self.assertEqual(url, 'http://cdn.redhat.com/content/foo?_auth_=%s' % token)
+
+    def test_expiration(self):
+        signer = cdn.URLSigner(CDN_CONFIG)
+        self.assertEqual(signer.expiration(1000.9), 1300)
+
+    def test_expiration_bucket(self):
+        signer = cdn.URLSigner(dict(CDN_CONFIG, url_auth_bucket=60))
+        self.assertEqual(signer.expiration(1000), 1320)
+        self.assertEqual(signer.expiration(1020), 1320)
+        self.assertEqual(signer.expiration(1021), 1380)
+
+    def test_token_cached_within_bucket(self):
+        signer = cdn.URLSigner(dict(CDN_CONFIG, url_auth_bucket=60))
+        with mock.patch.object(signer, 'token', wraps=signer.token) as mock_token:
+            with mock.patch('time.time', return_value=1000):
+                first = signer.sign('http://cdn.redhat.com/content/foo')
+            with mock.patch('time.time', return_value=1015):
+                second = signer.sign('http://cdn.redhat.com/content/foo')
+            with mock.patch('time.time', return_value=1030):
+                third = signer.sign('http://cdn.redhat.com/content/foo')
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+        self.assertEqual(mock_token.call_count, 2)
@@ -0,0 +1,146 @@
+import zlib
+
+from flask import Flask
+import mock
+import unittest2
+
+from crane import compression
+
+
+def gunzip(body):
+    return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+
+class TestGzip(unittest2.TestCase):
+    def test_round_trip(self):
+        self.assertEqual(gunzip(compression.gzip('abc' * 1000)), 'abc' * 1000)
+
+    def test_deterministic(self):
+        self.assertEqual(compression.gzip('abc' * 1000), compression.gzip('abc' * 1000))
+
+
+class TestVariantCache(unittest2.TestCase):
+    def setUp(self):
+        self.cache = compression.VariantCache(10)
+        self.encoder = mock.MagicMock(return_value='compressed')
+        patcher = mock.patch.dict(compression.ENCODERS, {'gzip': self.encoder})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compressed_once(self):
+        self.assertEqual(self.cache.get('gen1', 'body', 'gzip'), 'compressed')
+        self.assertEqual(self.cache.get('gen1', 'body', 'gzip'), 'compressed')
+
+        self.encoder.assert_called_once_with('body')
+
+    def test_keyed_by_body(self):
+        self.cache.get('gen1', 'body1', 'gzip')
+        self.cache.get('gen1', 'body2', 'gzip')
+
+        self.assertEqual(self.encoder.call_count, 2)
+
+    def test_cleared_for_new_generation(self):
+        self.cache.get('gen1', 'body', 'gzip')
+        self.cache.get('gen2', 'body', 'gzip')
+
+        self.assertEqual(self.encoder.call_count, 2)
+        self.assertEqual(self.cache.generation, 'gen2')
+        self.assertEqual(len(self.cache.variants), 1)
+
+    def test_disabled(self):
+        self.cache.variants.resize(0)
+
+        self.cache.get('gen1', 'body', 'gzip')
+        self.cache.get('gen1', 'body', 'gzip')
+
+        self.assertEqual(self.encoder.call_count, 2)
+
+
+class TestEtags(unittest2.TestCase):
+    def test_etags(self):
+        self.assertEqual(compression.etags('abc'),
+                         ['abc'] + ['abc-%s' % encoding for encoding in compression.ENCODERS])
+        self.assertTrue('abc-gzip' in compression.etags('abc'))
+
+
+class TestCompressResponse(unittest2.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.body = '{"ids":[%s]}' % ','.join('"%064d"' % i for i in range(20))
+        patcher = mock.patch.object(compression, 'variant_cache', compression.VariantCache(10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _compress(self, response, accept_encoding='gzip'):
+        with self.app.test_request_context(headers={'Accept-Encoding': accept_encoding}):
+            return compression.compress_response(response, 'gen1')
+
+    def _response(self, body=None, **kwargs):
+        kwargs.setdefault('mimetype', 'application/json')
+        return self.app.response_class(self.body if body is None else body, **kwargs)
+
+    def test_gzip(self):
+        response = self._response()
+        response.set_etag('abc')
+
+        response = self._compress(response)
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.headers['ETag'], '"abc-gzip"')
+        self.assertEqual(gunzip(response.get_data()), self.body)
+        self.assertEqual(int(response.headers['Content-Length']), len(response.get_data()))
+
+    def test_html(self):
+        response = self._compress(self._response(mimetype='text/html'))
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_not_accepted(self):
+        response = self._compress(self._response(), accept_encoding='identity')
+
+        self.assertFalse('Content-Encoding' in response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.get_data(), self.body)
+
+    def test_preference(self):
+        encoders = compression.OrderedDict([('br', lambda body: 'brotli'),
+                                            ('gzip', compression.gzip)])
+        with mock.patch.object(compression, 'ENCODERS', encoders):
+            response = self._compress(self._response(), accept_encoding='gzip, br')
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+            self.assertEqual(response.get_data(), 'brotli')
+
+            response = self._compress(self._response(), accept_encoding='gzip, br;q=0.5')
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_small(self):
+        response = self._compress(self._response('{}'))
+
+        self.assertFalse('Content-Encoding' in response.headers)
+        self.assertFalse('Vary' in response.headers)
+
+    def test_error(self):
+        response = self._compress(self._response(status=502))
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gunzip(response.get_data()), self.body)
+
+    def test_skipped(self):
+        for response in (self._response(status=304),
+                         self._response(status=307),
+                         self._response(mimetype='application/octet-stream'),
+                         self._response(headers={'Content-Encoding': 'gzip'})):
+            body = response.get_data()
+
+            response = self._compress(response)
+
+            self.assertEqual(response.get_data(), body)
+            self.assertFalse('Vary' in response.headers)
+
+    def test_direct_passthrough(self):
+        response = self._response(direct_passthrough=True)
+
+        response = self._compress(response)
+
+        self.assertFalse('Content-Encoding' in response.headers)
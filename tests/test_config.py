@@ -1,4 +1,6 @@
+from ConfigParser import ConfigParser
 import os
+from StringIO import StringIO
 import unittest
 
 import mock
@@ -36,10 +38,29 @@ class TestLoad(unittest.TestCase):
         self.assertEqual(self.app.config.get(config.KEY_SC_CONTENT_DIR_V2),
                          '/var/www/pub/docker/v2/web/')
         self.assertEqual(self.app.config.get(config.KEY_DATA_POLLING_INTERVAL), 60)
+        self.assertEqual(self.app.config.get(config.KEY_DATA_WATCHER), 'poll')
+        self.assertEqual(self.app.config.get(config.KEY_DATA_WATCHER_DEBOUNCE), 250)
+        self.assertEqual(self.app.config.get(config.KEY_LOAD_WORKERS), 1)
+        self.assertEqual(self.app.config.get(config.KEY_CERT_CACHE_SIZE), 1000)
+        self.assertEqual(self.app.config.get(config.KEY_COMPRESSED_CACHE_SIZE), 1000)
+        self.assertEqual(self.app.config.get(config.KEY_SHARED_STORE_CACHE_SIZE), 1000)
+        self.assertEqual(self.app.config.get(config.KEY_REDIRECT_STATUS), 302)
+        self.assertEqual(self.app.config.get(config.KEY_REDIRECT_MAX_AGE), 86400)
+        self.assertEqual(self.app.config.get(config.KEY_INDEX_PATH), '')
+        self.assertEqual(self.app.config.get(config.KEY_SHARED_STORE_DIR), '')
         configured_gsa_url = self.app.config.get(config.SECTION_GSA, {}).get(config.KEY_URL)
         self.assertEqual(configured_gsa_url, '')
         configured_solr_url = self.app.config.get(config.SECTION_SOLR, {}).get(config.KEY_URL)
         self.assertEqual(configured_solr_url, '')
+        self.assertEqual(self.app.config.get(config.SECTION_SEARCH),
+                         {config.KEY_SEARCH_LOCAL: False,
+                          config.KEY_CACHE_TTL: 0, config.KEY_CACHE_STALE_TTL: 0,
+                          config.KEY_CACHE_ERROR_TTL: 0, config.KEY_CACHE_SIZE: 1000,
+                          config.KEY_POOL_SIZE: 10, config.KEY_POOL_IDLE_TIMEOUT: 30,
+                          config.KEY_TIMEOUT: 1.0, config.KEY_MAX_RESULTS: 0,
+                          config.KEY_BACKENDS: [], config.KEY_DEADLINE: 2.0,
+                          config.KEY_BREAKER_THRESHOLD: 0, config.KEY_BREAKER_RESET_TIMEOUT: 30,
+                          config.KEY_ADAPTIVE_TIMEOUT: False, config.KEY_MIN_TIMEOUT: 0.25})
 
     @mock.patch('os.environ.get', new={config.CONFIG_ENV_NAME: solr_config_path}.get,
                 spec_set=True)
@@ -57,6 +78,38 @@ class TestLoad(unittest.TestCase):
         self.assertEqual(self.app.config.get(config.SECTION_GSA, {}).get(config.KEY_URL),
                          'http://foo/bar')
 
+    @mock.patch.object(config._logger, 'error', spec_set=True)
+    def test_search_backends(self, mock_error):
+        parser = ConfigParser()
+        parser.readfp(StringIO('[search]\nbackends: Solr, gsa,, foo ,local\ndeadline: 0.5\n'))
+
+        config.read_config(self.app, parser)
+
+        section = self.app.config[config.SECTION_SEARCH]
+        self.assertEqual(section[config.KEY_BACKENDS], ['solr', 'gsa', 'local'])
+        self.assertEqual(section[config.KEY_DEADLINE], 0.5)
+        self.assertEqual(mock_error.call_count, 1)
+
+    def test_redirect_status(self):
+        parser = ConfigParser()
+        parser.readfp(StringIO('[general]\ndebug: false\nredirect_status: 308\n'))
+
+        config.read_config(self.app, parser)
+
+        self.assertEqual(self.app.config[config.KEY_REDIRECT_STATUS], 308)
+
+    @mock.patch.object(config._logger, 'error', spec_set=True)
+    def test_redirect_status_not_supported(self, mock_error):
+        parser = ConfigParser()
+        parser.readfp(StringIO('[general]\ndebug: false\nredirect_status: 308\n'))
+
+        with mock.patch.dict(config.HTTP_STATUS_CODES):
+            del config.HTTP_STATUS_CODES[308]
+            config.read_config(self.app, parser)
+
+        self.assertEqual(self.app.config[config.KEY_REDIRECT_STATUS], 307)
+        self.assertEqual(mock_error.call_count, 1)
+
     @mock.patch('os.environ.get',
                 new={config.CONFIG_ENV_NAME: os.path.join(serve_content_path, 'crane.conf')}.get,
                 spec_set=True)
@@ -1,13 +1,16 @@
+import cPickle
 import json
 import os
 import shutil
 import tempfile
+import threading
 import time
 import unittest
+import zlib
 
 import mock
 
-from crane import config, data
+from crane import compression, config, data
 import demo_data
 
 
@@ -40,6 +43,10 @@ class TestLoadFromFile(unittest.TestCase):
         self.assertTrue({'id': 'xyz789'} in images)
         tags = json.loads(repo_tuple.tags_json)
         self.assertEqual(tags.get('latest'), 'abc123')
+        self.assertEqual(repo_tuple.images_etag, data.etag(repo_tuple.images_json))
+        self.assertEqual(repo_tuple.tags_etag, data.etag(repo_tuple.tags_json))
+        self.assertNotEqual(repo_tuple.images_etag, repo_tuple.tags_etag)
+        self.assertTrue(repo_tuple.description is None)
 
     def test_demo_file_v2(self):
         repo_id, repo_tuple, image_ids = data.load_from_file(demo_data.foo_v2_metadata_path)
@@ -61,6 +68,8 @@ class TestLoadFromFile(unittest.TestCase):
         self.assertTrue('sha256:a1d963a97357110bdbfc70767a495c8df6ddfa9bda4da3183165ca73c3b99'
                         '0d2' in schema2_data)
         self.assertTrue('1.25.1-musl' in schema2_data)
+        self.assertEqual(repo_tuple.schema2_tags, frozenset(schema2_data))
+        self.assertEqual(set(repo_tuple.manifest_routes), repo_tuple.schema2_tags)
 
     def test_demo_file_v4(self):
         repo_id, repo_tuple, image_ids = data.load_from_file(demo_data.foo_v4_metadata_path)
@@ -83,10 +92,82 @@ class TestLoadFromFile(unittest.TestCase):
         expected = ["sha256:c55544de64a01e157b9d931f5db7a16554a14be19c367f91c9a8cdc46db086bf", 2]
         self.assertEqual(manifest_list_amd64['bar'], expected)
 
+        self.assertEqual(repo_tuple.schema2_tags, frozenset(schema2_data))
+        self.assertEqual(repo_tuple.manifest_list_tags, frozenset(manifest_list_data))
+        self.assertEqual(repo_tuple.manifest_list_amd64['bar'], tuple(expected))
+        self.assertEqual(repo_tuple.manifest_list_amd64['latest'][1], 1)
+        # an old client asking for the manifest list tag gets the amd64 image
+        self.assertEqual(repo_tuple.manifest_routes['bar'][0][2],
+                         'http://cdn.redhat.com/zoo/bar/manifests/1/bar')
+        self.assertEqual(repo_tuple.manifest_routes['bar'][3][:2],
+                         ('manifests/list/bar',
+                          'application/vnd.docker.distribution.manifest.list.v2+json'))
+
     def test_wrong_version(self):
         self.assertRaises(ValueError, data.load_from_file, demo_data.wrong_version_path)
 
 
+class TestEncodeBody(unittest.TestCase):
+    def test_compact(self):
+        body, gzipped = data.encode_body({'tags': [{'id': 'abc123'}]})
+
+        self.assertEqual(body, '{"tags":[{"id":"abc123"}]}')
+        self.assertTrue(isinstance(body, str))
+        self.assertTrue(gzipped is None)
+
+    def test_unicode(self):
+        body, gzipped = data.encode_body([u'caf\xe9'])
+
+        self.assertTrue(isinstance(body, str))
+        self.assertEqual(json.loads(body), [u'caf\xe9'])
+
+    def test_gzip(self):
+        images = [{'id': '%064d' % i} for i in range(100)]
+
+        body, gzipped = data.encode_body(images)
+
+        self.assertTrue(len(body) >= compression.MIN_SIZE)
+        self.assertEqual(zlib.decompress(gzipped, 16 + zlib.MAX_WBITS), body)
+        self.assertTrue(len(gzipped) < len(body))
+        # no timestamp in the header, so reloading does not change the bytes
+        self.assertEqual(data.encode_body(images)[1], gzipped)
+
+    def test_load_from_file_gzip(self):
+        with mock.patch.object(compression, 'MIN_SIZE', 0):
+            repo_tuple = data.load_from_file(demo_data.foo_metadata_path)[1]
+
+        self.assertEqual(zlib.decompress(repo_tuple.images_gzip, 16 + zlib.MAX_WBITS),
+                         repo_tuple.images_json)
+        self.assertEqual(zlib.decompress(repo_tuple.tags_gzip, 16 + zlib.MAX_WBITS),
+                         repo_tuple.tags_json)
+
+
+class TestLoadFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = data.find_metadata_files(demo_data.metadata_good_path)
+
+    @mock.patch('multiprocessing.Pool')
+    def test_workers(self, mock_pool):
+        mock_pool.return_value.map.side_effect = lambda func, items, chunksize: map(func, items)
+
+        loaded_files = data.load_files(self.paths, {}, workers=2)
+
+        mock_pool.assert_called_once_with(2)
+        self.assertEqual(sorted(loaded_files), self.paths)
+
+    @mock.patch('multiprocessing.Pool')
+    def test_workers_not_used_in_other_threads(self, mock_pool):
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(data.load_files(self.paths, {}, workers=2)))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(mock_pool.call_count, 0)
+        self.assertEqual(sorted(results[0]), self.paths)
+
+
 class TestLoadAll(unittest.TestCase):
 
     def setUp(self):
@@ -215,6 +296,222 @@ class TestLoadAll(unittest.TestCase):
         self.assertEqual(mock_error.call_count, 1)
 
 
+class TestIncrementalLoadAll(unittest.TestCase):
+
+    def setUp(self):
+        _reset_response_data()
+        data._load_state = {'files': {}, 'paths': [], 'winners': {}, 'repo_images': {},
+                            'v1': None, 'v2': None}
+        self.working_dir = tempfile.mkdtemp()
+        self.app = mock.Mock(config={config.KEY_DATA_DIR: self.working_dir})
+        for name in ('foo.json', 'bar.json', 'zoo_v4.json'):
+            shutil.copy(os.path.join(demo_data.metadata_good_path, name), self.working_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+        _reset_response_data()
+
+    def _write_metadata(self, name, repo_id, image_ids, protected=False, description=None):
+        with open(os.path.join(self.working_dir, name), 'w') as metadata_file:
+            json.dump({'version': 1, 'repo-registry-id': repo_id, 'repository': repo_id,
+                       'url': 'http://cdn.redhat.com/%s/' % repo_id, 'protected': protected,
+                       'images': [{'id': image_id} for image_id in image_ids],
+                       'tags': {}, 'description': description}, metadata_file)
+
+    def test_only_changed_files_are_parsed(self):
+        data.load_all(self.app)
+
+        self._write_metadata('new.json', 'redhat/new', ['abc123', 'new456'])
+        with mock.patch.object(data, 'load_from_file', wraps=data.load_from_file) as mock_load:
+            data.load_all(self.app)
+
+        mock_load.assert_called_once_with(os.path.join(self.working_dir, 'new.json'))
+        self.assertEqual(data.v1_response_data['images']['abc123'],
+                         frozenset(['redhat/foo', 'redhat/new']))
+        self.assertEqual(data.v1_response_data['images']['new456'], frozenset(['redhat/new']))
+        self.assertTrue('bar' in data.v1_response_data['repos'])
+        self.assertTrue('redhat/zoo' in data.v2_response_data['repos'])
+
+    def test_generation(self):
+        data.load_all(self.app)
+        generation = data.v1_response_data['generation']
+        self.assertTrue(generation)
+        self.assertEqual(data.v2_response_data['generation'], generation)
+
+        data.load_all(self.app)
+        self.assertEqual(data.v1_response_data['generation'], generation)
+
+        self._write_metadata('new.json', 'redhat/new', ['new456'])
+        data.load_all(self.app)
+        self.assertNotEqual(data.v1_response_data['generation'], generation)
+
+    def test_search_index(self):
+        data.load_all(self.app)
+        self.assertTrue(data.v1_response_data['search_index'] is None)
+
+        self.app.config[config.SECTION_SEARCH] = {config.KEY_SEARCH_LOCAL: True}
+        self._write_metadata('new.json', 'redhat/new', ['new456'], description='Brand new')
+        data.load_all(self.app)
+
+        index = data.v1_response_data['search_index']
+        self.assertEqual(index.search('brand'), ['redhat/new'])
+        self.assertEqual(index.descriptions['redhat/new'], 'Brand new')
+        # v2 repositories are indexed too
+        self.assertEqual(index.search('zoo'), ['redhat/zoo'])
+
+    def test_image_repos(self):
+        self._write_metadata('new.json', 'redhat/new', ['abc123'])
+        data.load_all(self.app)
+
+        image_repos = data.v1_response_data['images']['abc123']
+        self.assertTrue(isinstance(image_repos, data.ImageRepos))
+        # the lowest repo id is chosen
+        self.assertEqual(image_repos.unprotected, 'redhat/foo')
+
+    def test_image_repos_rebuilt_when_repo_changes(self):
+        self._write_metadata('new.json', 'redhat/new', ['abc123'])
+        data.load_all(self.app)
+
+        # redhat/foo keeps its images but becomes protected
+        with open(os.path.join(self.working_dir, 'foo.json')) as metadata_file:
+            foo = json.load(metadata_file)
+        foo['protected'] = True
+        with open(os.path.join(self.working_dir, 'foo.json'), 'w') as metadata_file:
+            json.dump(foo, metadata_file)
+        data.load_all(self.app)
+
+        image_repos = data.v1_response_data['images']['abc123']
+        self.assertEqual(image_repos.unprotected, 'redhat/new')
+        self.assertEqual(data.v1_response_data['images']['xyz789'].protected,
+                         (('/foo/bar/images/', 'redhat/foo'),))
+
+    def test_removed_file(self):
+        self._write_metadata('new.json', 'redhat/new', ['abc123', 'new456'])
+        data.load_all(self.app)
+
+        os.unlink(os.path.join(self.working_dir, 'new.json'))
+        data.load_all(self.app)
+
+        self.assertFalse('redhat/new' in data.v1_response_data['repos'])
+        self.assertFalse('new456' in data.v1_response_data['images'])
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+
+    def test_changed_file(self):
+        self._write_metadata('new.json', 'redhat/new', ['new456'])
+        data.load_all(self.app)
+        old_repos = data.v1_response_data['repos']
+
+        self._write_metadata('new.json', 'redhat/new', ['new789'])
+        # make sure the fingerprint changes even on coarse mtime filesystems
+        st = os.stat(os.path.join(self.working_dir, 'new.json'))
+        os.utime(os.path.join(self.working_dir, 'new.json'), (st.st_atime, st.st_mtime + 1))
+        data.load_all(self.app)
+
+        self.assertFalse('new456' in data.v1_response_data['images'])
+        self.assertEqual(data.v1_response_data['images']['new789'], frozenset(['redhat/new']))
+        # the previously published data must not be modified
+        self.assertEqual(json.loads(old_repos['redhat/new'].images_json), [{'id': 'new456'}])
+
+    def test_unchanged(self):
+        data.load_all(self.app)
+        v1_response_data = data.v1_response_data
+
+        with mock.patch.object(data, 'load_from_file') as mock_load:
+            data.load_all(self.app)
+
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertTrue(data.v1_response_data is v1_response_data)
+
+    def test_rebuilds_after_external_reset(self):
+        data.load_all(self.app)
+        _reset_response_data()
+
+        with mock.patch.object(data, 'load_from_file') as mock_load:
+            data.load_all(self.app)
+
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+
+    def test_duplicate_repo_id_falls_back(self):
+        self._write_metadata('zzz.json', 'redhat/foo', ['dup123'])
+        with mock.patch('os.walk', return_value=[
+                (self.working_dir, (), ('foo.json', 'zzz.json'))]):
+            data.load_all(self.app)
+        self.assertEqual(data.v1_response_data['repos']['redhat/foo'].url,
+                         'http://cdn.redhat.com/redhat/foo/')
+        # the images of both files are served from the winning repository
+        self.assertEqual(data.v1_response_data['images']['dup123'], frozenset(['redhat/foo']))
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+
+        os.unlink(os.path.join(self.working_dir, 'zzz.json'))
+        with mock.patch('os.walk', return_value=[
+                (self.working_dir, (), ('foo.json', ))]):
+            data.load_all(self.app)
+
+        self.assertFalse('dup123' in data.v1_response_data['images'])
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+
+    def test_duplicate_repo_id_same_as_full_load(self):
+        data.load_all(self.app)
+        # sorts before foo.json, which therefore still wins
+        self._write_metadata('aaa.json', 'redhat/foo', ['dup123'], protected=True)
+        self._write_metadata('zzz.json', 'bar', ['dup456'])
+        changed = set(os.path.join(self.working_dir, name) for name in ('aaa.json', 'zzz.json'))
+        data.load_all(self.app, changed)
+        incremental = data.v1_response_data, data.v2_response_data
+
+        data._load_state = {'files': {}, 'paths': [], 'winners': {}, 'repo_images': {},
+                            'v1': None, 'v2': None}
+        _reset_response_data()
+        data.load_all(self.app)
+
+        self.assertEqual((data.v1_response_data, data.v2_response_data), incremental)
+        self.assertFalse(data.v1_response_data['repos']['redhat/foo'].protected)
+        self.assertEqual(data.v1_response_data['repos']['bar'].url, 'http://cdn.redhat.com/bar/')
+        self.assertEqual(data.v1_response_data['images']['dup123'], frozenset(['redhat/foo']))
+        self.assertEqual(data.v1_response_data['images']['def456'], frozenset(['bar']))
+
+    def test_parallel_load(self):
+        self._write_metadata('new.json', 'redhat/new', ['abc123'])
+        data.load_all(self.app)
+        serial = data.v1_response_data, data.v2_response_data
+
+        data._load_state = {'files': {}, 'paths': [], 'winners': {}, 'repo_images': {},
+                            'v1': None, 'v2': None}
+        _reset_response_data()
+        self.app.config[config.KEY_LOAD_WORKERS] = 2
+        data.load_all(self.app)
+
+        self.assertEqual((data.v1_response_data, data.v2_response_data), serial)
+
+    @mock.patch.object(data.logger, 'error', spec_set=True)
+    def test_parallel_load_bad_file(self, mock_error):
+        shutil.copy(demo_data.wrong_version_path, self.working_dir)
+        self.app.config[config.KEY_LOAD_WORKERS] = 2
+
+        data.load_all(self.app)
+
+        mock_error.assert_called_once_with(
+            'skipping current metadata load: metadata version -1 not supported')
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+        self.assertTrue('redhat/zoo' in data.v2_response_data['repos'])
+
+    def test_changed_paths(self):
+        data.load_all(self.app)
+
+        new_path = os.path.join(self.working_dir, 'new.json')
+        self._write_metadata('new.json', 'redhat/new', ['new456'])
+        os.unlink(os.path.join(self.working_dir, 'bar.json'))
+        with mock.patch('os.walk') as mock_walk:
+            data.load_all(self.app, set([new_path, os.path.join(self.working_dir, 'bar.json')]))
+
+        self.assertFalse(mock_walk.called)
+        self.assertEqual(data.v1_response_data['images']['new456'], frozenset(['redhat/new']))
+        self.assertFalse('bar' in data.v1_response_data['repos'])
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+
+
 class StopTest(Exception):
     pass
 
@@ -402,3 +699,92 @@ class StartMonitoringDataDirTests(unittest.TestCase):
         created_thread = mock_thread.return_value
         created_thread.setDaemon.assert_called_once_with(True)
         self.assertTrue(created_thread.start.called)
+
+    @mock.patch('crane.data.load_all')
+    @mock.patch('crane.data.time.time')
+    @mock.patch('crane.data.threading.Thread')
+    def test_monitoring_initialization_inotify(self, mock_thread, mock_time, mock_load_all):
+        mock_time.return_value = time.time()
+        mock_app = mock.Mock(config={config.KEY_DATA_WATCHER: 'inotify'})
+        data.start_monitoring_data_dir(mock_app)
+        mock_thread.assert_called_once_with(target=data.monitor_data_dir_inotify,
+                                            args=(mock_app, mock_time.return_value))
+
+
+class TestMonitorDataDirInotify(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.app = mock.Mock(config={config.KEY_DATA_DIR: self.working_dir,
+                                     config.KEY_DATA_POLLING_INTERVAL: 60,
+                                     config.KEY_DATA_WATCHER_DEBOUNCE: 100})
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    @mock.patch('crane.data.load_all')
+    @mock.patch('crane.inotify.InotifyWatcher')
+    def test_loads_changed_paths(self, mock_watcher, mock_load_all):
+        changed = set([os.path.join(self.working_dir, 'foo.json')])
+        mock_watcher.return_value.wait_for_changes.side_effect = [changed, None, StopTest()]
+
+        self.assertRaises(StopTest, data.monitor_data_dir_inotify, self.app)
+
+        mock_watcher.assert_called_once_with(self.working_dir, poll_interval=60)
+        mock_watcher.return_value.wait_for_changes.assert_called_with(0.1)
+        self.assertEqual(mock_load_all.call_args_list,
+                         [mock.call(self.app), mock.call(self.app, changed),
+                          mock.call(self.app, None)])
+
+    @mock.patch('crane.data.monitor_data_dir')
+    @mock.patch('crane.inotify.InotifyWatcher')
+    def test_falls_back_to_polling(self, mock_watcher, mock_monitor):
+        mock_watcher.side_effect = OSError('inotify is not available')
+
+        data.monitor_data_dir_inotify(self.app, 123)
+
+        mock_monitor.assert_called_once_with(self.app, 123)
+
+    @mock.patch('crane.data.monitor_data_dir')
+    def test_missing_data_dir_falls_back_to_polling(self, mock_monitor):
+        self.app.config[config.KEY_DATA_DIR] = os.path.join(self.working_dir, 'idontexist')
+
+        data.monitor_data_dir_inotify(self.app, 123)
+
+        mock_monitor.assert_called_once_with(self.app, 123)
+
+
+class TestImageRepos(unittest.TestCase):
+    def setUp(self):
+        self.repos = {
+            'a': data.V1Repo('', 'a', '[]', '{}', '/content/a', True),
+            'b': data.V1Repo('', 'b', '[]', '{}', '/content/shared', True),
+            'c': data.V1Repo('', 'c', '[]', '{}', '/content/shared', True),
+            'd': data.V1Repo('', 'd', '[]', '{}', '/content/d', False),
+            'e': data.V1Repo('', 'e', '[]', '{}', '/content/e', False),
+        }
+
+    def test_equals_frozenset(self):
+        image_repos = data.ImageRepos(['a', 'd'], self.repos)
+        self.assertEqual(image_repos, frozenset(['a', 'd']))
+
+    def test_unprotected(self):
+        image_repos = data.ImageRepos(['e', 'a', 'd'], self.repos)
+        self.assertEqual(image_repos.unprotected, 'd')
+
+    def test_protected_grouped_by_path(self):
+        image_repos = data.ImageRepos(['c', 'b', 'a'], self.repos)
+        self.assertTrue(image_repos.unprotected is None)
+        self.assertEqual(image_repos.protected,
+                         (('/content/a', 'a'), ('/content/shared', 'b')))
+
+    def test_without_repos(self):
+        image_repos = data.ImageRepos(['a'])
+        self.assertTrue(image_repos.unprotected is None)
+        self.assertEqual(image_repos.protected, ())
+
+    def test_pickle(self):
+        image_repos = data.ImageRepos(['c', 'b', 'a'], self.repos)
+        loaded = cPickle.loads(cPickle.dumps(image_repos, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(loaded, image_repos)
+        self.assertEqual(loaded.protected, image_repos.protected)
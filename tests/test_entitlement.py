@@ -0,0 +1,102 @@
+import itertools
+
+from rhsm import certificate
+from rhsm.pathtree import PathTree
+import unittest2
+
+from crane import entitlement
+import demo_data
+
+
+END = {'PATH END': None}
+
+# a path tree in the structure produced by rhsm.pathtree.PathTree, including
+# nodes that are shared between paths and "$variable" segments
+SHARED = {'os': [END], 'debug': [END]}
+TREE = {
+    'content': [
+        {'dist': [
+            {'rhel': [
+                {'server': [
+                    {'7': [
+                        {'$basearch': [SHARED]},
+                        {'x86_64': [{'extras': [END]}]},
+                    ]},
+                    {'$releasever': [{'$basearch': [{'optional': [SHARED]}]}]},
+                ]},
+            ]},
+            {'rhel': [{'client': [END]}]},
+        ]},
+        {'beta': [{'$arch': [{'$arch': [{'images': [END]}]}]}]},
+    ],
+    'exact': [END],
+}
+
+SEGMENTS = ['content', 'dist', 'rhel', 'server', 'client', '7', '8', 'x86_64', 'ppc64le',
+            'os', 'debug', 'extras', 'optional', 'beta', 'images', 'listing', 'exact',
+            '$basearch', 'other']
+
+
+def all_paths(max_depth):
+    for depth in range(1, max_depth + 1):
+        for words in itertools.product(SEGMENTS, repeat=depth):
+            yield '/' + '/'.join(words)
+
+
+class TestPathMatcher(unittest2.TestCase):
+    def setUp(self):
+        self.matcher = entitlement.PathMatcher(TREE)
+
+    def assertEquivalent(self, path):
+        expected = PathTree._traverse_tree(TREE, path.strip('/').split('/'))
+        self.assertEqual(self.matcher.match(path), expected, path)
+
+    def test_equivalent_to_path_tree(self):
+        for path in all_paths(4):
+            self.assertEquivalent(path)
+
+    def test_deep_paths(self):
+        for path in ('/content/dist/rhel/server/7/x86_64/os/repodata/repomd.xml',
+                     '/content/dist/rhel/server/7Server/ppc64le/optional/debug/Packages',
+                     '/content/dist/rhel/server/7/x86_64/extras',
+                     '/content/dist/rhel/server/7/x86_64/listing',
+                     '/content/dist/rhel/server/7/listing',
+                     '/content/beta/x86_64/x86_64/images/pulp',
+                     '/content/beta/x86_64/images',
+                     '/exact/anything/below'):
+            self.assertEquivalent(path)
+
+    def test_examples(self):
+        self.assertTrue(self.matcher.match('/content/dist/rhel/server/7/x86_64/os'))
+        self.assertTrue(self.matcher.match('/content/dist/rhel/server/8/s390x/optional/debug'))
+        self.assertTrue(self.matcher.match('/content/dist/rhel/listing'))
+        self.assertFalse(self.matcher.match('/content/dist/rhel/server/7/x86_64'))
+        self.assertFalse(self.matcher.match('/content/dist/rhel/server/7/x86_64/optional'))
+
+    def test_normalizes_path(self):
+        self.assertTrue(self.matcher.match('//content/dist/rhel//client/'))
+        self.assertTrue(self.matcher.match('/content/dist/rhel/server/../client'))
+
+    def test_relative_path(self):
+        self.assertRaises(ValueError, self.matcher.match, 'content/dist')
+        self.assertRaises(ValueError, self.matcher.match, '')
+
+    def test_empty_tree(self):
+        matcher = entitlement.PathMatcher({})
+        self.assertFalse(matcher.match('/content'))
+
+
+class TestCompileCertificate(unittest2.TestCase):
+    def setUp(self):
+        self.cert = certificate.create_from_file(demo_data.demo_entitlement_cert_path)
+        self.matcher = entitlement.compile_certificate(self.cert)
+
+    def test_equivalent_to_check_path(self):
+        for path in ('/foo', '/foo/path', '/foo/path/always', '/foo/path/never/x',
+                     '/foo/path/sometimes', '/foo/listing', '/foo/bar', '/bar',
+                     '/foo//path/', '/foo/path/../bar', '/listing'):
+            self.assertEqual(self.matcher.match(path), self.cert.check_path(path), path)
+
+    def test_no_path_tree(self):
+        cert = type('OldCertificate', (object,), {})()
+        self.assertTrue(entitlement.compile_certificate(cert) is None)
@@ -0,0 +1,148 @@
+import json
+
+import mock
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from crane import config, fastpath
+from tests.views import base
+
+
+DIGEST = 'sha256:c55544de64a01e157b9d931f5db7a16554a14be19c367f91c9a8cdc46db086bf'
+
+
+class FastPathMixin(object):
+    def setUp(self):
+        super(FastPathMixin, self).setUp()
+        self.fastpath = fastpath.FastPath(self.app)
+        self.fast_client = Client(self.fastpath, BaseResponse)
+
+    @mock.patch('time.time', return_value=1500000000.5)
+    def get_both(self, path, mock_time, **kwargs):
+        """
+        :return:    the responses of FastPath and of the Flask app for a request
+        :rtype:     tuple
+        """
+        return (self.fast_client.get(path, **kwargs), self.test_client.get(path, **kwargs))
+
+    def assertRedirectsLikeFlask(self, path, **kwargs):
+        fast, slow = self.get_both(path, **kwargs)
+        self.assertIn(fast.status_code, (302, 307, 308))
+        self.assertEqual(fast.status_code, slow.status_code)
+        for header in ('Location', 'Cache-Control', 'Expires', 'Vary',
+                       'X-Docker-Registry-Version', 'X-Docker-Registry-Config'):
+            self.assertEqual(fast.headers.get(header), slow.headers.get(header))
+        self.assertEqual(fast.data, '')
+        return fast
+
+    def assertSameAsFlask(self, path, **kwargs):
+        fast, slow = self.get_both(path, **kwargs)
+        self.assertEqual(fast.status_code, slow.status_code)
+        self.assertEqual(sorted(fast.headers.items()), sorted(slow.headers.items()))
+        self.assertEqual(fast.data, slow.data)
+        return fast
+
+
+class TestRedirects(FastPathMixin, base.BaseCraneAPITest):
+    def test_v2_blob(self):
+        response = self.assertRedirectsLikeFlask('/v2/redhat/zoo/blobs/%s' % DIGEST)
+
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=86400')
+
+    def test_v2_manifest(self):
+        headers = {'Accept': 'application/vnd.docker.distribution.manifest.v2+json'}
+        response = self.assertRedirectsLikeFlask('/v2/redhat/zoo/manifests/1.25.1-musl',
+                                                 headers=headers)
+
+        self.assertTrue('/manifests/2/' in response.headers['Location'])
+        self.assertEqual(response.headers['Vary'], 'Accept')
+
+    def test_v2_blob_does_not_vary(self):
+        response = self.assertRedirectsLikeFlask('/v2/redhat/zoo/blobs/%s' % DIGEST)
+
+        self.assertFalse('Vary' in response.headers)
+
+    def test_v2_tags(self):
+        self.assertRedirectsLikeFlask('/v2/redhat/foo/tags/list')
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_v2_protected(self, mock_get_cert):
+        mock_get_cert.return_value.check_path.return_value = True
+        response = self.assertRedirectsLikeFlask('/v2/protected/blobs/%s' % DIGEST)
+
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=86400')
+
+    def test_v2_permanent_redirect(self):
+        self.app.config[config.KEY_REDIRECT_STATUS] = 308
+
+        response = self.assertRedirectsLikeFlask('/v2/redhat/zoo/blobs/%s' % DIGEST)
+
+        self.assertEqual(response.status_code, 308)
+
+    def test_v1_image(self):
+        response = self.assertRedirectsLikeFlask('/v1/images/abc123/layer')
+
+        self.assertEqual(response.headers['Location'],
+                         'http://cdn.redhat.com/foo/bar/images/abc123/layer')
+
+    def test_head(self):
+        response = self.fast_client.head('/v1/images/abc123/layer')
+
+        self.assertEqual(response.status_code, 302)
+
+
+class TestErrors(FastPathMixin, base.BaseCraneAPITest):
+    def test_v2_unknown_repo(self):
+        response = self.assertSameAsFlask('/v2/no/name/blobs/%s' % DIGEST)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)['errors'][0]['code'], '404')
+
+    def test_v2_invalid_path(self):
+        response = self.assertSameAsFlask('/v2/redhat/zoo/test')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_v1_unknown_image(self):
+        response = self.assertSameAsFlask('/v1/images/idontexist/layer')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.headers['X-Docker-Registry-Version'], '0.6.6')
+
+    @mock.patch('crane.app_util._get_certificate', return_value=None)
+    def test_v2_unauthorized(self, mock_get_cert):
+        response = self.assertSameAsFlask('/v2/protected/blobs/%s' % DIGEST)
+
+        self.assertEqual(response.status_code, 404)
+
+
+class TestFallback(FastPathMixin, base.BaseCraneAPITest):
+    def test_other_v2_routes(self):
+        mock_redirect = mock.Mock()
+        self.fastpath.endpoints['v2.name_serve_or_redirect'] = mock_redirect
+
+        self.assertSameAsFlask('/v2/')
+
+        self.assertEqual(mock_redirect.call_count, 0)
+
+    def test_other_v1_routes(self):
+        self.assertSameAsFlask('/v1/_ping')
+        self.assertSameAsFlask('/v1/repositories/redhat/foo/tags')
+
+    def test_admin(self):
+        self.assertSameAsFlask('/crane/repositories/v2')
+
+    def test_method(self):
+        response = self.fast_client.post('/v1/images/abc123/layer')
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_unknown_path(self):
+        self.assertSameAsFlask('/v1/images/abc123')
+
+
+class TestServeContent(FastPathMixin, base.BaseCraneAPITestServeContent):
+    def test_served_by_flask(self):
+        response = self.fast_client.get('/v1/images/abc123/layer')
+
+        self.verify_200(response, 'foo/abc123/layer', 'application/octet-stream', v1=True)
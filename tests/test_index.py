@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from crane import config, data, index, store
+import demo_data
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.working_dir, 'metadata')
+        shutil.copytree(demo_data.metadata_good_path, self.data_dir)
+        self.index_path = os.path.join(self.working_dir, 'crane.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        count = index.build(self.data_dir, self.index_path)
+
+        loaded_index = index.load(self.index_path)
+        files = loaded_index.table('files')
+        self.assertEqual(count, len(files))
+        self.assertEqual(loaded_index.table('info')['data_dir'], self.data_dir)
+        fingerprints = dict((path, loaded_file.fingerprint)
+                            for path, loaded_file in files.iteritems())
+        self.assertEqual(loaded_index.source_digest, store.fingerprint_digest(fingerprints))
+        loaded_file = files[os.path.join(self.data_dir, 'foo.json')]
+        self.assertEqual(loaded_file.repo_id, 'redhat/foo')
+        self.assertEqual(loaded_file.repo_tuple,
+                         data.load_from_file(os.path.join(self.data_dir, 'foo.json'))[1])
+        self.assertEqual(loaded_index.table('v1_repos')['redhat/foo'], loaded_file.repo_tuple)
+        self.assertEqual(loaded_index.table('images')['abc123'], frozenset(['redhat/foo']))
+
+    def test_rebuild_parses_only_changed_files(self):
+        index.build(self.data_dir, self.index_path)
+        shutil.copy(demo_data.foo_metadata_path, os.path.join(self.data_dir, 'new.json'))
+
+        with mock.patch.object(data, 'load_from_file', wraps=data.load_from_file) as mock_load:
+            index.build(self.data_dir, self.index_path)
+
+        mock_load.assert_called_once_with(os.path.join(self.data_dir, 'new.json'))
+
+    def test_writable_by_others(self):
+        index.build(self.data_dir, self.index_path)
+        os.chmod(self.index_path, 0o666)
+
+        with mock.patch('cPickle.loads') as mock_loads:
+            self.assertRaises(index.InvalidIndexError, index.load, self.index_path)
+
+        self.assertEqual(mock_loads.call_count, 0)
+
+    def test_truncated(self):
+        index.build(self.data_dir, self.index_path)
+        with open(self.index_path, 'r+b') as index_file:
+            index_file.truncate(os.path.getsize(self.index_path) - 1)
+
+        self.assertRaises(index.InvalidIndexError, index.load, self.index_path)
+
+    def test_not_an_index(self):
+        with open(self.index_path, 'w') as index_file:
+            index_file.write('{"foo": "bar"}' * 10)
+
+        self.assertRaises(index.InvalidIndexError, index.load, self.index_path)
+
+    def test_shared_store_generation(self):
+        store_dir = os.path.join(self.working_dir, 'store')
+        with store.lock(store_dir):
+            path = store.publish(store_dir, '\0' * 32, {'v1_repos': {}})
+
+        self.assertRaises(index.InvalidIndexError, index.load, path)
+
+    def test_empty_file(self):
+        open(self.index_path, 'w').close()
+
+        self.assertRaises(index.InvalidIndexError, index.load, self.index_path)
+
+    def test_unsupported_version(self):
+        with mock.patch.object(store, 'FORMAT_VERSION', 0):
+            index.build(self.data_dir, self.index_path)
+
+        self.assertRaises(index.InvalidIndexError, index.load, self.index_path)
+
+    def test_is_stale(self):
+        index.build(self.data_dir, self.index_path)
+        self.assertFalse(index.is_stale(self.index_path, self.data_dir))
+
+        os.unlink(os.path.join(self.data_dir, 'foo.json'))
+        self.assertTrue(index.is_stale(self.index_path, self.data_dir))
+
+        index.build(self.data_dir, self.index_path)
+        self.assertFalse(index.is_stale(self.index_path, self.data_dir))
+
+        shutil.copy(demo_data.foo_metadata_path, self.data_dir)
+        self.assertTrue(index.is_stale(self.index_path, self.data_dir))
+
+    def test_main(self):
+        argv = ['-o', self.index_path, '-d', self.data_dir]
+        with mock.patch('crane.config.CONFIG_PATH', new='/a/b/c/idontexist'), \
+                mock.patch('logging.basicConfig'):
+            self.assertEqual(index.main(['check'] + argv), 2)
+            self.assertEqual(index.main(['build'] + argv), 0)
+            self.assertEqual(index.main(['check'] + argv), 0)
+            os.unlink(os.path.join(self.data_dir, 'foo.json'))
+            self.assertEqual(index.main(['check'] + argv), 1)
+
+
+class TestLoadAllFromIndex(unittest.TestCase):
+
+    def setUp(self):
+        data._load_state = {'files': {}, 'paths': [], 'winners': {}, 'repo_images': {},
+                            'v1': None, 'v2': None}
+        self.working_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.working_dir, 'crane.idx')
+        self.app = mock.Mock(config={config.KEY_DATA_DIR: demo_data.metadata_good_path,
+                                     config.KEY_INDEX_PATH: self.index_path})
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+        data._load_state = {'files': {}, 'paths': [], 'winners': {}, 'repo_images': {},
+                            'v1': None, 'v2': None}
+        data._index_generation = None
+        data.v1_response_data = {'repos': {}, 'images': {}, 'generation': None,
+                                 'search_index': None}
+        data.v2_response_data = {'repos': {}, 'generation': None}
+
+    def test_mapped_from_index(self):
+        index.build(demo_data.metadata_good_path, self.index_path)
+
+        with mock.patch.object(data, 'load_from_file') as mock_load:
+            data.load_all(self.app)
+            # the monitor finds the index still matches the metadata files
+            data.load_all(self.app)
+
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertTrue(isinstance(data.v1_response_data['repos'], store.MappedTable))
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+        self.assertTrue('v2/bar' in data.v2_response_data['repos'])
+
+    def test_stale_index(self):
+        data_dir = os.path.join(self.working_dir, 'metadata')
+        shutil.copytree(demo_data.metadata_good_path, data_dir)
+        self.app.config[config.KEY_DATA_DIR] = data_dir
+        index.build(data_dir, self.index_path)
+        new_path = os.path.join(data_dir, 'new.json')
+        shutil.copy(demo_data.foo_metadata_path, new_path)
+
+        with mock.patch.object(data, 'load_from_file', wraps=data.load_from_file) as mock_load:
+            data.load_all(self.app)
+
+        mock_load.assert_called_once_with(new_path)
+        self.assertTrue(data._index_generation is None)
+        self.assertTrue(isinstance(data.v1_response_data['repos'], dict))
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+
+    def test_changed_after_mapping(self):
+        data_dir = os.path.join(self.working_dir, 'metadata')
+        shutil.copytree(demo_data.metadata_good_path, data_dir)
+        self.app.config[config.KEY_DATA_DIR] = data_dir
+        index.build(data_dir, self.index_path)
+        data.load_all(self.app)
+        self.assertTrue(data._index_generation is not None)
+        os.unlink(os.path.join(data_dir, 'foo.json'))
+
+        with mock.patch.object(data, 'load_from_file', wraps=data.load_from_file) as mock_load:
+            data.load_all(self.app)
+
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertTrue(data._index_generation is None)
+        self.assertFalse('redhat/foo' in data.v1_response_data['repos'])
+
+    @mock.patch.object(data.logger, 'error', spec_set=True)
+    def test_missing_index(self, mock_error):
+        data.load_all(self.app)
+
+        self.assertTrue(mock_error.called)
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from crane import inotify
+
+
+@unittest.skipUnless(inotify.available(), 'inotify is not available')
+class TestInotifyWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.sub_dir = os.path.join(self.working_dir, 'sub')
+        os.mkdir(self.sub_dir)
+        self.watcher = inotify.InotifyWatcher(self.working_dir)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+
+    def _write(self, path):
+        with open(path, 'w') as f:
+            f.write('{}')
+
+    def test_timeout(self):
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=0), set())
+
+    def test_file_written(self):
+        path = os.path.join(self.sub_dir, 'foo.json')
+        self._write(path)
+
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1), set([path]))
+
+    def test_burst_is_collected(self):
+        paths = set(os.path.join(self.working_dir, '%d.json' % i) for i in range(10))
+        for path in paths:
+            self._write(path)
+
+        self.assertEqual(self.watcher.wait_for_changes(0.05, timeout=1), paths)
+
+    def test_ignores_other_files(self):
+        self._write(os.path.join(self.working_dir, 'foo.txt'))
+
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=0.05), set())
+
+    def test_file_moved_in_and_deleted(self):
+        tmp_path = os.path.join(self.working_dir, 'foo.tmp')
+        path = os.path.join(self.working_dir, 'foo.json')
+        self._write(tmp_path)
+        os.rename(tmp_path, path)
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1), set([path]))
+
+        os.unlink(path)
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1), set([path]))
+
+    def test_new_directory_is_watched(self):
+        new_dir = os.path.join(self.working_dir, 'new')
+        os.mkdir(new_dir)
+        self.watcher.wait_for_changes(0, timeout=1)
+
+        path = os.path.join(new_dir, 'foo.json')
+        self._write(path)
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1), set([path]))
+
+    def test_directory_moved_in(self):
+        outside_dir = tempfile.mkdtemp()
+        path = os.path.join(outside_dir, 'foo.json')
+        self._write(path)
+        os.rename(outside_dir, os.path.join(self.working_dir, 'moved'))
+
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1),
+                         set([os.path.join(self.working_dir, 'moved', 'foo.json')]))
+
+    def test_directory_removed_requires_rescan(self):
+        shutil.rmtree(self.sub_dir)
+
+        self.assertTrue(self.watcher.wait_for_changes(0.05, timeout=1) is None)
+
+    def test_directory_moved_out(self):
+        outside_dir = os.path.join(tempfile.mkdtemp(), 'moved')
+        self.addCleanup(shutil.rmtree, os.path.dirname(outside_dir), ignore_errors=True)
+        os.rename(self.sub_dir, outside_dir)
+        self.assertTrue(self.watcher.wait_for_changes(0.05, timeout=1) is None)
+        self.assertEqual(self.watcher._watches.values(), [self.working_dir])
+
+        # changes outside the tree are not reported
+        self._write(os.path.join(outside_dir, 'foo.json'))
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=0.05), set())
+
+    def test_root_removed(self):
+        self.watcher.poll_interval = 0.01
+        shutil.rmtree(self.working_dir)
+        self.assertTrue(self.watcher.wait_for_changes(0.05, timeout=1) is None)
+        self.assertEqual(self.watcher._watches, {})
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=0.05), set())
+
+        os.mkdir(self.working_dir)
+        self.assertTrue(self.watcher.wait_for_changes(0, timeout=1) is None)
+
+        path = os.path.join(self.working_dir, 'foo.json')
+        self._write(path)
+        self.assertEqual(self.watcher.wait_for_changes(0, timeout=1), set([path]))
+
+
+class TestAvailable(unittest.TestCase):
+
+    @mock.patch('crane.inotify._libc', None)
+    def test_not_available(self):
+        self.assertFalse(inotify.available())
+        self.assertRaises(OSError, inotify.InotifyWatcher, '/')
@@ -0,0 +1,90 @@
+import unittest2
+
+from crane import manifests
+from crane.data import V3Repo, V4Repo
+
+
+SCHEMA2_TAGS = frozenset(['s2tag', 'both'])
+MANIFEST_LIST_TAGS = frozenset(['list', 'both', 'list1', 'list2'])
+MANIFEST_LIST_AMD64 = {'list1': ('sha256:1', 1), 'list2': ('sha256:2', 2), 'both': ('sha256:3', 3)}
+
+
+class TestMediaClass(unittest2.TestCase):
+    def test_classes(self):
+        for index, accept_headers in enumerate(manifests.MEDIA_CLASSES):
+            self.assertEqual(manifests.media_class(accept_headers), index)
+
+    def test_ignores_other_types(self):
+        accept = set([manifests.SCHEMA2_MEDIATYPE, 'application/json', 'text/html'])
+        self.assertEqual(manifests.media_class(accept), 1)
+
+
+class TestRoute(unittest2.TestCase):
+    def setUp(self):
+        self.repo = V4Repo(url='http://cdn/zoo', repository='zoo', url_path='/zoo',
+                           schema2_data='', manifest_list_data='', manifest_list_amd64_tags='',
+                           protected=False, schema2_tags=SCHEMA2_TAGS,
+                           manifest_list_tags=MANIFEST_LIST_TAGS,
+                           manifest_list_amd64=MANIFEST_LIST_AMD64,
+                           manifest_routes=manifests.build_routes(
+                               'http://cdn/zoo', SCHEMA2_TAGS, MANIFEST_LIST_TAGS,
+                               MANIFEST_LIST_AMD64))
+        self.all_types = set([manifests.SCHEMA2_MEDIATYPE, manifests.MANIFEST_LIST_MEDIATYPE])
+
+    def _route(self, identifier, accept_headers):
+        return manifests.route(self.repo, identifier, accept_headers)[:2]
+
+    def test_manifest_list(self):
+        self.assertEqual(self._route('list', self.all_types),
+                         ('manifests/list/list', manifests.MANIFEST_LIST_MEDIATYPE))
+
+    def test_amd64_schema2_client(self):
+        accept = set([manifests.SCHEMA2_MEDIATYPE])
+        self.assertEqual(self._route('list1', accept),
+                         ('manifests/1/sha256:1', 'application/json'))
+        self.assertEqual(self._route('list2', accept),
+                         ('manifests/2/sha256:2', manifests.SCHEMA2_MEDIATYPE))
+
+    def test_amd64_old_client(self):
+        self.assertEqual(self._route('list1', set()),
+                         ('manifests/1/sha256:1', 'application/json'))
+        self.assertEqual(self._route('list2', set()), ('manifests/1/list2', 'application/json'))
+
+    def test_schema2(self):
+        self.assertEqual(self._route('s2tag', set([manifests.SCHEMA2_MEDIATYPE])),
+                         ('manifests/2/s2tag', manifests.SCHEMA2_MEDIATYPE))
+        self.assertEqual(self._route('s2tag', set()), ('manifests/1/s2tag', 'application/json'))
+
+    def test_unknown(self):
+        self.assertEqual(manifests.route(self.repo, 'nope', self.all_types),
+                         ('manifests/1/nope', 'application/json',
+                          'http://cdn/zoo/manifests/1/nope'))
+
+    def test_url(self):
+        self.assertEqual(manifests.route(self.repo, 'list', self.all_types)[2],
+                         'http://cdn/zoo/manifests/list/list')
+
+    def test_table_matches_resolve(self):
+        for identifier in SCHEMA2_TAGS | MANIFEST_LIST_TAGS:
+            for accept_headers in manifests.MEDIA_CLASSES:
+                expected = manifests.resolve(SCHEMA2_TAGS, MANIFEST_LIST_TAGS,
+                                             MANIFEST_LIST_AMD64, identifier, accept_headers)
+                self.assertEqual(self._route(identifier, set(accept_headers)), expected)
+
+    def test_v3_without_schema2(self):
+        repo = V3Repo(url='', repository='', url_path='', schema2_data='[]', protected=False)
+        self.assertEqual(manifests.route(repo, 'latest', self.all_types)[:2],
+                         ('manifests/1/latest', 'application/json'))
+
+
+class TestBuildRoutes(unittest2.TestCase):
+    def test_keys(self):
+        routes = manifests.build_routes('http://cdn/zoo/', SCHEMA2_TAGS, MANIFEST_LIST_TAGS,
+                                        MANIFEST_LIST_AMD64)
+        self.assertEqual(set(routes), SCHEMA2_TAGS | MANIFEST_LIST_TAGS)
+        for targets in routes.itervalues():
+            self.assertEqual(len(targets), len(manifests.MEDIA_CLASSES))
+
+    def test_empty(self):
+        self.assertEqual(manifests.build_routes('http://cdn/zoo/', frozenset(), frozenset(), {}),
+                         {})
@@ -0,0 +1,67 @@
+import unittest2
+
+from crane.search_index import SearchIndex, tokenize
+
+
+class TestTokenize(unittest2.TestCase):
+    def test_repo_id(self):
+        self.assertEqual(tokenize('Redhat/RHEL7-atomic_host.x86:1'),
+                         set(['redhat', 'rhel7', 'atomic', 'host', 'x86', '1']))
+
+    def test_empty(self):
+        self.assertEqual(tokenize(' / '), set())
+
+
+class TestSearchIndex(unittest2.TestCase):
+    def setUp(self):
+        super(TestSearchIndex, self).setUp()
+        self.index = SearchIndex({
+            'redhat/rhel7': 'Red Hat Enterprise Linux 7',
+            'redhat/rhel7-atomic': None,
+            'redhat/rhel6': 'Red Hat Enterprise Linux 6',
+            'pulp/worker': 'Pulp worker for atomic hosts',
+            'rhel7': None,
+        })
+
+    def test_len(self):
+        self.assertEqual(len(self.index), 5)
+
+    def test_exact_id_first(self):
+        self.assertEqual(self.index.search('rhel7'),
+                         ['rhel7', 'redhat/rhel7', 'redhat/rhel7-atomic'])
+
+    def test_namespace(self):
+        self.assertEqual(self.index.search('redhat'),
+                         ['redhat/rhel6', 'redhat/rhel7', 'redhat/rhel7-atomic'])
+
+    def test_prefix(self):
+        self.assertEqual(self.index.search('rhel'),
+                         ['rhel7', 'redhat/rhel6', 'redhat/rhel7', 'redhat/rhel7-atomic'])
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.index.search('PULP'), ['pulp/worker'])
+
+    def test_all_words(self):
+        self.assertEqual(self.index.search('redhat/rhel7-atomic'), ['redhat/rhel7-atomic'])
+        self.assertEqual(self.index.search('rhel6 atomic'), [])
+
+    def test_name_ranked_above_description(self):
+        self.assertEqual(self.index.search('atomic'), ['redhat/rhel7-atomic', 'pulp/worker'])
+
+    def test_whole_word_ranked_above_prefix(self):
+        index = SearchIndex({'a/foobar': None, 'b/foo': None})
+
+        self.assertEqual(index.search('foo'), ['b/foo', 'a/foobar'])
+
+    def test_description(self):
+        self.assertEqual(self.index.search('enterprise'), ['redhat/rhel6', 'redhat/rhel7'])
+
+    def test_substring(self):
+        self.assertEqual(self.index.search('hel7-at'), ['redhat/rhel7-atomic'])
+        self.assertEqual(self.index.search('ork'), ['pulp/worker'])
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('fedora'), [])
+
+    def test_empty_query(self):
+        self.assertEqual(self.index.search(' '), [])
@@ -0,0 +1,215 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from crane import config, data, store
+from crane.data import V1Repo
+import demo_data
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        store.clear_record_caches()
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        store.clear_record_caches()
+
+    def _publish(self, tables, digest='a' * 32):
+        return store.publish(self.store_dir, digest, tables)
+
+    def test_no_generation(self):
+        self.assertTrue(store.open_current(self.store_dir) is None)
+
+    def test_round_trip(self):
+        repo = V1Repo('http://cdn/foo', 'foo', '[]', '{}', '/foo', False)
+        self._publish({'repos': {u'redhat/foo': repo, 'bar': None},
+                       'images': {'abc123': frozenset(['redhat/foo'])},
+                       'empty': {}})
+
+        generation = store.open_current(self.store_dir)
+        self.assertEqual(generation.source_digest, 'a' * 32)
+        repos = generation.table('repos')
+        self.assertEqual(repos['redhat/foo'], repo)
+        self.assertEqual(repos.get(u'redhat/foo'), repo)
+        self.assertTrue('bar' in repos)
+        self.assertTrue(repos['bar'] is None)
+        self.assertFalse('baz' in repos)
+        self.assertTrue(repos.get('baz') is None)
+        self.assertRaises(KeyError, lambda: repos['baz'])
+        self.assertEqual(len(repos), 2)
+        self.assertEqual(dict(repos.items()), {'redhat/foo': repo, 'bar': None})
+        self.assertEqual(sorted(repos), ['bar', 'redhat/foo'])
+        self.assertEqual(generation.table('images')['abc123'], frozenset(['redhat/foo']))
+        self.assertEqual(generation.table('empty').get('foo'), None)
+        self.assertEqual(len(generation.table('empty')), 0)
+
+    @mock.patch('crane.store._key_hash', return_value=42)
+    def test_hash_collisions(self, mock_hash):
+        table = dict(('key%d' % i, i) for i in range(10))
+        self._publish({'table': table})
+
+        mapped = store.open_current(self.store_dir).table('table')
+        for key, value in table.items():
+            self.assertEqual(mapped[key], value)
+        self.assertFalse('key10' in mapped)
+
+    def test_many_keys(self):
+        table = dict(('key%d' % i, i) for i in range(1000))
+        self._publish({'table': table})
+
+        mapped = store.open_current(self.store_dir).table('table')
+        for key, value in table.items():
+            self.assertEqual(mapped[key], value)
+
+    def test_lookups_cached(self):
+        repo = V1Repo('http://cdn/foo', 'foo', '[]', '{}', '/foo', False)
+        self._publish({'repos': {'redhat/foo': repo}})
+        repos = store.open_current(self.store_dir, ['repos']).table('repos')
+
+        first = repos['redhat/foo']
+        with mock.patch('cPickle.loads') as mock_loads:
+            second = repos['redhat/foo']
+            self.assertTrue('redhat/foo' in repos)
+
+        self.assertEqual(mock_loads.call_count, 0)
+        self.assertTrue(first is second)
+
+    def test_unknown_keys_not_cached(self):
+        self._publish({'repos': {'redhat/foo': 1}})
+        repos = store.open_current(self.store_dir, ['repos']).table('repos')
+
+        self.assertFalse('redhat/bar' in repos)
+
+        self.assertEqual(len(store.record_cache('repos')), 0)
+
+    def test_cache_per_table(self):
+        self._publish({'repos': {'redhat/foo': 1}, 'images': {'abc123': 2}, 'files': {'a': 3}})
+        generation = store.open_current(self.store_dir, ['repos', 'images'])
+        generation.table('repos')['redhat/foo']
+        store.resize_record_caches(1)
+        self.addCleanup(store.resize_record_caches, 1000)
+
+        generation.table('images')['abc123']
+        generation.table('files')['a']
+
+        # lookups in other tables do not evict the repository
+        self.assertEqual(len(store.record_cache('repos')), 1)
+        self.assertEqual(len(store.record_cache('images')), 1)
+        self.assertFalse('files' in store.record_caches)
+
+    def test_cache_per_generation(self):
+        self._publish({'table': {'foo': 1}})
+        old = store.open_current(self.store_dir, ['table']).table('table')
+        self.assertEqual(old['foo'], 1)
+        self._publish({'table': {'foo': 2}}, digest='b' * 32)
+
+        self.assertEqual(store.open_current(self.store_dir, ['table']).table('table')['foo'], 2)
+        self.assertEqual(old['foo'], 1)
+
+    def test_swap_keeps_old_generation_readable(self):
+        self._publish({'table': {'foo': 1}})
+        old = store.open_current(self.store_dir)
+        for i in range(3):
+            self._publish({'table': {'foo': i + 2}}, digest=str(i) * 32)
+
+        self.assertEqual(old.table('table')['foo'], 1)
+        self.assertEqual(store.open_current(self.store_dir).table('table')['foo'], 4)
+        generations = [name for name in os.listdir(self.store_dir)
+                       if name.startswith(store.GENERATION_PREFIX)]
+        # the current and the previous generation are kept
+        self.assertEqual(len(generations), 2)
+
+    def test_invalid_generation(self):
+        path = os.path.join(self.store_dir, 'bogus')
+        with open(path, 'w') as bogus:
+            bogus.write('x' * 100)
+        os.symlink('bogus', os.path.join(self.store_dir, store.CURRENT_LINK))
+
+        self.assertTrue(store.open_current(self.store_dir) is None)
+
+    def test_writable_by_others(self):
+        path = self._publish({'table': {'foo': 1}})
+        os.chmod(path, 0o664)
+
+        self.assertRaises(store.InvalidStoreError, store.Generation, path)
+        self.assertTrue(store.open_current(self.store_dir) is None)
+
+    def test_lock_creates_dir(self):
+        store_dir = os.path.join(self.store_dir, 'sub')
+        with store.lock(store_dir):
+            self.assertTrue(os.path.exists(os.path.join(store_dir, store.LOCK_FILE)))
+
+
+class TestLoadAllShared(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.working_dir, 'metadata')
+        shutil.copytree(demo_data.metadata_good_path, self.data_dir)
+        self.app = mock.Mock(config={
+            config.KEY_DATA_DIR: self.data_dir,
+            config.KEY_SHARED_STORE_DIR: os.path.join(self.working_dir, 'store')})
+        store.clear_record_caches()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir, ignore_errors=True)
+        data._shared_generation = None
+        data.v1_response_data = {'repos': {}, 'images': {}}
+        data.v2_response_data = {'repos': {}}
+
+    def test_load(self):
+        data.load_all(self.app)
+
+        self.assertTrue(isinstance(data.v1_response_data['repos'], store.MappedTable))
+        self.assertEqual(data.v1_response_data['repos']['redhat/foo'].url,
+                         'http://cdn.redhat.com/foo/bar/images/')
+        self.assertEqual(data.v1_response_data['images']['abc123'], frozenset(['redhat/foo']))
+        self.assertTrue(isinstance(data.v2_response_data['repos']['redhat/zoo'], data.V4Repo))
+
+    def test_other_process_maps_published_generation(self):
+        data.load_all(self.app)
+        # simulate another process
+        data._shared_generation = None
+
+        with mock.patch.object(data, 'load_from_file') as mock_load:
+            data.load_all(self.app)
+
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertTrue('redhat/foo' in data.v1_response_data['repos'])
+
+    def test_unchanged(self):
+        data.load_all(self.app)
+        v1_response_data = data.v1_response_data
+
+        data.load_all(self.app)
+
+        self.assertTrue(data.v1_response_data is v1_response_data)
+
+    def test_changed_file(self):
+        data.load_all(self.app)
+        os.unlink(os.path.join(self.data_dir, 'foo.json'))
+
+        with mock.patch.object(data, 'load_from_file') as mock_load:
+            data.load_all(self.app)
+
+        # the other files are taken from the previous generation
+        self.assertEqual(mock_load.call_count, 0)
+        self.assertFalse('redhat/foo' in data.v1_response_data['repos'])
+        self.assertFalse('abc123' in data.v1_response_data['images'])
+        self.assertTrue('redhat/zoo' in data.v2_response_data['repos'])
+
+    def test_new_generation_clears_cache(self):
+        data.load_all(self.app)
+        data.v1_response_data['repos']['redhat/foo']
+        self.assertEqual(len(store.record_cache('v1_repos')), 1)
+        os.unlink(os.path.join(self.data_dir, 'foo.json'))
+
+        data.load_all(self.app)
+
+        self.assertEqual(len(store.record_cache('v1_repos')), 0)
@@ -9,3 +9,8 @@ class TestWSGI(unittest.TestCase):
     def test_application_exists(self, mock_init_logging):
         from crane import wsgi
         self.assertTrue(isinstance(wsgi.application, Flask))
+
+    def test_fastpath_application_exists(self, mock_init_logging):
+        from crane import fastpath, fastpath_wsgi
+        self.assertTrue(isinstance(fastpath_wsgi.application, fastpath.FastPath))
+        self.assertTrue(isinstance(fastpath_wsgi.application.app, Flask))
@@ -1,7 +1,7 @@
 import time
 from datetime import datetime
 
-from crane import config
+from crane import cdn, config
 from tests.views import base
 import mock
 
@@ -13,6 +13,7 @@ class TestCDN(base.BaseCraneAPITest):
     def test_url_rewrite(self):
         self.app.config[config.SECTION_CDN][config.KEY_URL_MATCH] = 'cdn.redhat.com'
         self.app.config[config.SECTION_CDN][config.KEY_URL_REPLACE] = 'cdn.fedora.com'
+        cdn.init_app(self.app)
         response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
 
         self.assertEqual(response.status_code, 302)
@@ -23,9 +24,25 @@ class TestCDN(base.BaseCraneAPITest):
         self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_PARAM] = '_auth_'
         self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_TTL] = 600
         self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_SECRET] = 'abc123'
+        cdn.init_app(self.app)
         response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
 
         expected_time = int(time.time()) + 600
         self.assertEqual(response.status_code, 302)
         self.assertIn('?_auth_=', response.headers['Location'])
         self.assertIn('exp=%s~' % expected_time, response.headers['Location'])
+
+    @mock.patch('time.time', mock_time)
+    def test_cdn_auth_bucket(self):
+        self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_TTL] = 600
+        self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_SECRET] = 'abc123'
+        self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_BUCKET] = 3600
+        cdn.init_app(self.app)
+        response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
+        second_response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
+
+        expected_time = int(time.time()) + 600
+        expected_time += -expected_time % 3600
+        self.assertIn('exp=%s~' % expected_time, response.headers['Location'])
+        self.assertEqual(response.headers['Location'], second_response.headers['Location'])
+        self.assertEqual(self.app.extensions[cdn.EXTENSION_NAME].tokens.hits, 1)
@@ -1,5 +1,9 @@
 import json
 
+import mock
+from werkzeug.http import http_date
+
+from crane import cdn, config
 from tests.views import base
 
 
@@ -126,3 +130,73 @@ class TestPathServeContent(base.BaseCraneAPITestServeContent, Common404CasesMixi
         parsed_response_data = json.loads(response.data)
         self.assertEqual(parsed_response_data['errors'][0]['code'], '404')
         self.assertEqual(parsed_response_data['errors'][0]['message'], 'Not Found')
+
+
+class TestRedirectCaching(base.BaseCraneAPITest):
+    digest = 'sha256:c55544de64a01e157b9d931f5db7a16554a14be19c367f91c9a8cdc46db086bf'
+
+    @mock.patch('time.time', return_value=1500000000.5)
+    def test_blob(self, mock_time):
+        response = self.test_client.get('/v2/redhat/zoo/blobs/%s' % self.digest)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=86400')
+        self.assertEqual(response.headers['Expires'], http_date(1500000000 + 86400))
+
+    def test_manifest_by_digest(self):
+        response = self.test_client.get('/v2/redhat/zoo/manifests/%s' % self.digest)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=86400')
+
+    def test_tag(self):
+        response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+
+    def test_manifest_varies_by_accept(self):
+        list_type = 'application/vnd.docker.distribution.manifest.list.v2+json'
+        path = '/v2/redhat/zoo/manifests/latest'
+        with_list = self.test_client.get(path, headers={'Accept': list_type})
+        without = self.test_client.get(path)
+
+        # the same path redirects to different manifests, so caches must tell them apart
+        self.assertTrue('/manifests/list/' in with_list.headers['Location'])
+        self.assertFalse('/manifests/list/' in without.headers['Location'])
+        for response in (with_list, without):
+            self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+            self.assertEqual(response.headers['Vary'], 'Accept')
+
+        response = self.test_client.get('/v2/redhat/zoo/manifests/%s' % self.digest)
+        self.assertEqual(response.headers['Vary'], 'Accept')
+
+    def test_blob_does_not_vary(self):
+        response = self.test_client.get('/v2/redhat/zoo/blobs/%s' % self.digest)
+
+        self.assertFalse('Vary' in response.headers)
+
+    def test_bounded_by_token(self):
+        self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_TTL] = 600
+        self.app.config[config.SECTION_CDN][config.KEY_URL_AUTH_SECRET] = 'abc123'
+        cdn.init_app(self.app)
+        response = self.test_client.get('/v2/redhat/zoo/blobs/%s' % self.digest)
+
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=600')
+
+    @mock.patch('crane.app_util._get_certificate')
+    def test_protected(self, mock_get_cert):
+        mock_get_cert.return_value.check_path.return_value = True
+        response = self.test_client.get('/v2/protected/blobs/%s' % self.digest)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=86400')
+
+    def test_permanent_redirect(self):
+        self.app.config[config.KEY_REDIRECT_STATUS] = 308
+        response = self.test_client.get('/v2/redhat/zoo/blobs/%s' % self.digest)
+        self.assertEqual(response.status_code, 308)
+
+        # tags can move, so they are never redirected permanently
+        response = self.test_client.get('/v2/redhat/zoo/manifests/latest')
+        self.assertEqual(response.status_code, 307)
@@ -1,7 +1,11 @@
 import json
+import zlib
+
+import mock
 
 import base
-from crane import config
+from crane import config, data
+from crane.search import Composite, GSA
 
 
 class TestRepository(base.BaseCraneAPITest):
@@ -287,3 +291,242 @@ class TestRepository(base.BaseCraneAPITest):
 
         self.assertEqual(response.status_code, 404)
         self.assertTrue(response.headers['Content-Type'].startswith('text/html'))
+
+
+class TestConditionalGet(base.BaseCraneAPITest):
+    def _assert_conditional(self, path, headers=None):
+        headers = dict(headers or {})
+        response = self.test_client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        headers['If-None-Match'] = etag
+        response = self.test_client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, '')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        headers['If-None-Match'] = '"something-else"'
+        response = self.test_client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return etag
+
+    def test_images(self):
+        self._assert_conditional('/v1/repositories/redhat/foo/images')
+
+    def test_tags(self):
+        self._assert_conditional('/v1/repositories/redhat/foo/tags')
+
+    def test_repositories(self):
+        json_etag = self._assert_conditional('/crane/repositories',
+                                             {'Accept': 'application/json'})
+        html_etag = self._assert_conditional('/crane/repositories')
+        v2_etag = self._assert_conditional('/crane/repositories/v2',
+                                           {'Accept': 'application/json'})
+        self.assertEqual(len(set([json_etag, html_etag, v2_etag])), 3)
+
+    def test_protected_not_modified_requires_authorization(self):
+        repo = data.v1_response_data['repos']['baz']
+        response = self.test_client.get('/v1/repositories/baz/tags',
+                                        headers={'If-None-Match': '"%s"' % repo.tags_etag})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestCompressedJson(base.BaseCraneAPITest):
+    def setUp(self):
+        super(TestCompressedJson, self).setUp()
+        images_json, images_gzip = data.encode_body([{'id': '%064d' % i} for i in range(100)])
+        self.repo = data.V1Repo('http://cdn.redhat.com/big/', 'big', images_json, '{}',
+                                '/big/', False, data.etag(images_json), data.etag('{}'),
+                                images_gzip, None)
+        patcher = mock.patch('crane.api.repository.get_repo', return_value=self.repo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_gzip(self):
+        response = self.test_client.get('/v1/repositories/big/images',
+                                        headers={'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.headers['ETag'], '"%s-gzip"' % self.repo.images_etag)
+        self.assertEqual(response.data, self.repo.images_gzip)
+
+    def test_identity(self):
+        for accept_encoding in ('identity', 'gzip;q=0'):
+            response = self.test_client.get('/v1/repositories/big/images',
+                                            headers={'Accept-Encoding': accept_encoding})
+
+            self.assertFalse('Content-Encoding' in response.headers)
+            self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(response.headers['ETag'], '"%s"' % self.repo.images_etag)
+            self.assertEqual(response.data, self.repo.images_json)
+
+    def test_gzip_not_modified(self):
+        response = self.test_client.get(
+            '/v1/repositories/big/images',
+            headers={'Accept-Encoding': 'gzip',
+                     'If-None-Match': '"%s-gzip"' % self.repo.images_etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_small_body_not_compressed(self):
+        response = self.test_client.get('/v1/repositories/big/tags',
+                                        headers={'Accept-Encoding': 'gzip'})
+
+        self.assertFalse('Content-Encoding' in response.headers)
+        self.assertFalse('Vary' in response.headers)
+        self.assertEqual(response.data, '{}')
+
+
+class TestCompressedResponses(base.BaseCraneAPITest):
+    def setUp(self):
+        super(TestCompressedResponses, self).setUp()
+        patcher = mock.patch('crane.compression.MIN_SIZE', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_listing(self):
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        response = self.test_client.get('/crane/repositories', headers=headers)
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue('Accept-Encoding' in response.headers['Vary'])
+        self.assertTrue(response.headers['ETag'].endswith('-gzip"'))
+        self.assertTrue('redhat/foo' in
+                        json.loads(zlib.decompress(response.data, 16 + zlib.MAX_WBITS)))
+
+        headers['If-None-Match'] = response.headers['ETag']
+        response = self.test_client.get('/crane/repositories', headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], headers['If-None-Match'])
+
+    def test_v1_tags(self):
+        response = self.test_client.get('/v1/repositories/redhat/foo/tags',
+                                        headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        tags = json.loads(zlib.decompress(response.data, 16 + zlib.MAX_WBITS))
+        self.assertEqual(tags['latest'], 'abc123')
+
+    def test_v2_error(self):
+        response = self.test_client.get('/v2/nothing/manifests/latest',
+                                        headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        error = json.loads(zlib.decompress(response.data, 16 + zlib.MAX_WBITS))
+        self.assertEqual(error['errors'][0]['code'], '404')
+
+    def test_v2(self):
+        response = self.test_client.get('/v2/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+
+class TestRepositoriesListing(base.BaseCraneAPITest):
+    def setUp(self):
+        super(TestRepositoriesListing, self).setUp()
+        self.all_ids = sorted(data.v1_response_data['repos'])
+
+    def _get(self, query='', accept='application/json'):
+        return self.test_client.get('/crane/repositories/v1%s' % query,
+                                    headers={'Accept': accept})
+
+    def test_total(self):
+        response = self._get()
+        self.assertEqual(response.headers['X-Total-Count'], str(len(self.all_ids)))
+        self.assertFalse('Link' in response.headers)
+
+    def test_prefix(self):
+        response = self._get('?prefix=redhat/')
+        self.assertEqual(response.status_code, 200)
+        response_data = json.loads(response.data)
+        self.assertEqual(sorted(response_data),
+                         [repo_id for repo_id in self.all_ids if repo_id.startswith('redhat/')])
+        self.assertEqual(response.headers['X-Total-Count'], str(len(response_data)))
+
+    def test_prefix_no_match(self):
+        response = self._get('?prefix=nothing')
+        self.assertEqual(json.loads(response.data), {})
+        self.assertEqual(response.headers['X-Total-Count'], '0')
+
+    def test_pages(self):
+        seen = []
+        for page in range(1, len(self.all_ids) + 1):
+            response = self._get('?page=%d&per_page=1' % page)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(json.loads(response.data))
+        self.assertEqual(seen, self.all_ids)
+
+    def test_page_links(self):
+        response = self._get('?page=2&per_page=1')
+        self.assertEqual(response.headers['Link'],
+                         '<http://localhost/crane/repositories/v1?page=1&per_page=1>; '
+                         'rel="prev", '
+                         '<http://localhost/crane/repositories/v1?page=3&per_page=1>; '
+                         'rel="next"')
+
+    def test_page_html(self):
+        response = self._get('?page=1&per_page=1', accept='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.all_ids[0] in response.data)
+        self.assertFalse(self.all_ids[1] in response.data)
+        self.assertTrue('?page=2&amp;per_page=1' in response.data)
+
+    def test_past_last_page(self):
+        response = self._get('?page=100&per_page=10')
+        self.assertEqual(json.loads(response.data), {})
+
+    def test_invalid_pagination(self):
+        for query in ('?page=abc', '?page=0', '?per_page=0', '?per_page=100000'):
+            self.assertEqual(self._get(query).status_code, 400, query)
+
+    def test_rendered_once(self):
+        with mock.patch('crane.views.crane.render_template',
+                        return_value='listing') as mock_render:
+            self._get('?prefix=b', accept='text/html')
+            self._get('?prefix=b', accept='text/html')
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_rebuilt_for_new_generation(self):
+        self._get()
+        # patched rather than assigned, so the data loader cannot replace it
+        new_data = dict(data.v1_response_data, generation='new',
+                        repos={'only': data.v1_response_data['repos']['bar']})
+        with mock.patch('crane.app_util.get_data', return_value=new_data):
+            response = self._get()
+        self.assertEqual(json.loads(response.data).keys(), ['only'])
+
+
+class TestSearchHealth(base.BaseCraneAPITest):
+    def test_search_health(self):
+        with mock.patch('crane.search.backend', Composite([GSA('http://localhost/')], 2)):
+            response = self.test_client.get('/crane/search')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.data), {
+            'backend': 'Composite', 'deadline': 2,
+            'backends': [{'backend': 'GSA', 'timeout': {'timeout': 1}}],
+        })
+
+
+class TestStats(base.BaseCraneAPITest):
+    def test_stats(self):
+        response = self.test_client.get('/crane/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+
+        response_data = json.loads(response.data)
+        self.assertEqual(set(response_data),
+                         set(['certificates', 'certificate_paths', 'compressed_responses',
+                              'shared_store_records', 'cdn_tokens']))
+        self.assertEqual(set(response_data['certificates']),
+                         set(['hits', 'misses', 'size', 'maxsize']))
+        self.assertEqual(response_data['certificates']['maxsize'], 1000)
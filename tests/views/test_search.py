@@ -3,6 +3,7 @@ import json
 
 import mock
 
+from crane import config, data, search
 from crane.search.base import SearchResult, SearchBackend
 import base
 
@@ -49,3 +50,51 @@ class TestSearch(base.BaseCraneAPITest):
         data = json.loads(response.data)
 
         self.assertEqual(data['num_results'], 3)
+        mock_search.assert_called_once_with('rhel', None, None)
+
+    @mock.patch('crane.search.backend.search', spec_set=True, return_value=[])
+    def test_page(self, mock_search):
+        response = self.test_client.get('/v1/search?q=rhel&n=10&page=3')
+        data = json.loads(response.data)
+
+        mock_search.assert_called_once_with('rhel', 3, 10)
+        self.assertEqual((data['page'], data['page_size']), (3, 10))
+
+    @mock.patch('crane.search.backend.search', spec_set=True, return_value=[])
+    def test_page_size_default(self, mock_search):
+        self.test_client.get('/v1/search?q=rhel&page=2')
+
+        mock_search.assert_called_once_with('rhel', 2, 25)
+
+    def test_invalid_page(self):
+        for args in ('n=x', 'page=0', 'n=0', 'n=101', 'page=1.5'):
+            response = self.test_client.get('/v1/search?q=rhel&' + args)
+
+            self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+
+
+class TestLocalSearch(base.BaseCraneAPITest):
+    def setUp(self):
+        super(TestLocalSearch, self).setUp()
+        self.app.config[config.SECTION_SEARCH] = {config.KEY_SEARCH_LOCAL: True}
+        self.addCleanup(setattr, search, 'backend', search.backend)
+        search.load_config(self.app)
+        index = data._build_search_index(self.app, data.v1_response_data['repos'],
+                                         data.v2_response_data['repos'])
+        patcher = mock.patch('crane.app_util.get_data',
+                             return_value=dict(data.v1_response_data, search_index=index))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search(self):
+        response = self.test_client.get('/v1/search?q=foo')
+
+        self.assertEqual(response.status_code, httplib.OK)
+        names = [result['name'] for result in json.loads(response.data)['results']]
+        self.assertEqual(names, ['redhat/foo'])
+
+    def test_unauthorized_excluded(self):
+        # "qux" is protected, and no client certificate is given
+        response = self.test_client.get('/v1/search?q=qux')
+
+        self.assertEqual(json.loads(response.data)['num_results'], 0)